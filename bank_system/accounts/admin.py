@@ -1,8 +1,21 @@
 from django.contrib import admin
 from .models import Account
+from .balances import enable_hot_mode, disable_hot_mode
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ['account_number', 'user', 'account_type', 'balance', 'is_active', 'created_at']
-    list_filter = ['account_type', 'is_active', 'created_at']
-    search_fields = ['account_number', 'user__username']
\ No newline at end of file
+    list_display = ['account_number', 'user', 'account_type', 'balance', 'is_active', 'is_hot', 'created_at']
+    list_filter = ['account_type', 'is_active', 'is_hot', 'created_at']
+    search_fields = ['account_number', 'user__username']
+    readonly_fields = ['is_hot']
+    actions = ['enable_hot_mode', 'disable_hot_mode']
+
+    @admin.action(description='Split balance over shards (hot mode)')
+    def enable_hot_mode(self, request, queryset):
+        for account in queryset:
+            enable_hot_mode(account)
+
+    @admin.action(description='Fold shards back into the balance')
+    def disable_hot_mode(self, request, queryset):
+        for account in queryset:
+            disable_hot_mode(account)
@@ -0,0 +1,198 @@
+"""
+Account balance updates
+
+All credits and debits go through credit() and debit(). Ordinary accounts
+are updated in place with a single conditional UPDATE. Accounts in hot mode
+(Account.is_hot) keep their money in AccountBalanceShard rows instead, so
+concurrent credits land on different rows rather than queueing on one.
+For hot accounts Account.balance is a cached total that fold_hot_balances()
+refreshes from the shards; shard_total() and live_balance() read the exact
+balance.
+"""
+
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Account, AccountBalanceShard
+
+DEFAULT_SHARDS = 8
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def credit(account, amount):
+    """
+    Add `amount` to an account.
+
+    `account` may be an Account or an accounts.directory.AccountEntry; only
+    its id and is_hot flag are used.
+    """
+    if account.is_hot and _credit_shards(account.id, amount):
+        return
+    if not account.is_hot and _credit_plain(account, amount):
+        return
+    # The flag was stale: read it again under the row lock enable/disable_hot_mode() hold while switching
+    with transaction.atomic():
+        if not _locked_is_hot(account.id):
+            _credit_plain(account, amount)
+        elif not _credit_shards(account.id, amount):
+            raise RuntimeError(f'Hot account {account.id} has no balance shards')
+
+
+def debit(account, amount):
+    """Take `amount` from an account, returns False (and changes nothing) if funds are insufficient"""
+    debited = _debit_shards(account.id, amount) if account.is_hot else _debit_plain(account, amount)
+    if debited is not None:
+        return debited
+    # The flag was stale: read it again under the row lock enable/disable_hot_mode() hold while switching
+    with transaction.atomic():
+        if _locked_is_hot(account.id):
+            return bool(_debit_shards(account.id, amount))
+        return bool(_debit_plain(account, amount))
+
+
+def _locked_is_hot(account_id):
+    return Account.objects.select_for_update().values_list('is_hot', flat=True).get(pk=account_id)
+
+
+def _credit_plain(account, amount):
+    """Credit an account not in hot mode, returns False if it is in hot mode"""
+    updated = Account.objects.filter(pk=account.id, is_hot=False).update(
+        balance=F('balance') + amount, updated_at=timezone.now()
+    )
+    if updated and isinstance(account, Account):
+        account.balance += amount
+    return bool(updated)
+
+
+def _credit_shards(account_id, amount):
+    """Credit a random shard of a hot account, returns False if it has no shards (is not in hot mode)"""
+    shards = AccountBalanceShard.objects.filter(account_id=account_id)
+    shard = random.randrange(_shard_count())
+    if shards.filter(shard=shard).update(balance=F('balance') + amount):
+        return True
+    # Shard 0 always exists, even if HOT_ACCOUNT_SHARDS changed since the split
+    return bool(shards.filter(shard=0).update(balance=F('balance') + amount))
+
+
+def _debit_plain(account, amount):
+    """Debit an account not in hot mode: True, False if funds are insufficient, None if it is in hot mode"""
+    updated = Account.objects.filter(pk=account.id, is_hot=False, balance__gte=amount).update(
+        balance=F('balance') - amount, updated_at=timezone.now()
+    )
+    if updated:
+        if isinstance(account, Account):
+            account.balance -= amount
+        return True
+    if Account.objects.filter(pk=account.id, is_hot=True).exists():
+        return None
+    return False
+
+
+def _shard_count():
+    return getattr(settings, 'HOT_ACCOUNT_SHARDS', DEFAULT_SHARDS)
+
+
+def _take_from(shards, amount):
+    """Greedily pick shards (largest first) until `amount` is covered, returns [(shard, taken)] or None"""
+    taken, remaining = [], amount
+    for shard in shards:
+        if remaining <= 0:
+            break
+        portion = min(shard.balance, remaining)
+        if portion > 0:
+            taken.append((shard, portion))
+            remaining -= portion
+    return taken if remaining <= 0 else None
+
+
+def _debit_shards(account_id, amount):
+    """Debit a hot account: True, False if funds are insufficient, None if it has no shards"""
+    with transaction.atomic():
+        shards = AccountBalanceShard.objects.filter(account_id=account_id, balance__gt=0).order_by('-balance')
+        # Prefer shards nobody else is writing to; fall back to waiting for all of them
+        plan = _take_from(shards.select_for_update(skip_locked=True), amount)
+        if plan is None:
+            plan = _take_from(shards.select_for_update(), amount)
+        if plan is None:
+            # No shards at all means the account left hot mode
+            return False if AccountBalanceShard.objects.filter(account_id=account_id).exists() else None
+        for shard, portion in plan:
+            AccountBalanceShard.objects.filter(pk=shard.pk).update(balance=F('balance') - portion)
+    return True
+
+
+def shard_total(account):
+    """Exact balance of a hot account, summed from its shards"""
+    total = account.balance_shards.aggregate(total=Sum('balance'))['total']
+    return total if total is not None else Decimal('0.00')
+
+
+def _shard_sum():
+    """Sum of the shards of the account in the outer query"""
+    shard_sum = (
+        AccountBalanceShard.objects.filter(account=OuterRef('pk'))
+        .order_by()
+        .values('account')
+        .annotate(total=Sum('balance'))
+        .values('total')
+    )
+    return Coalesce(Subquery(shard_sum), Value(Decimal('0.00')), output_field=MONEY)
+
+
+def live_balance():
+    """
+    Expression for the exact balance of each account in a query: the shard
+    sum of hot accounts, Account.balance of the others. Aggregate it instead
+    of 'balance', whose value is stale for hot accounts between folds.
+    """
+    return Case(When(is_hot=True, then=_shard_sum()), default=F('balance'), output_field=MONEY)
+
+
+def fold_hot_balances(account_ids=None):
+    """Refresh the cached Account.balance of hot accounts from their shards in one UPDATE"""
+    accounts = Account.objects.filter(is_hot=True)
+    if account_ids is not None:
+        accounts = accounts.filter(pk__in=account_ids)
+    return accounts.update(
+        balance=_shard_sum(),
+        updated_at=timezone.now(),
+    )
+
+
+@transaction.atomic
+def enable_hot_mode(account, shards=None):
+    """Split an account's balance evenly over `shards` shard rows"""
+    account = Account.objects.select_for_update().get(pk=account.pk)
+    if account.is_hot:
+        return account
+    shards = shards or _shard_count()
+
+    cents = int(account.balance * 100)
+    base, extra = divmod(cents, shards)
+    AccountBalanceShard.objects.bulk_create([
+        AccountBalanceShard(account=account, shard=index, balance=Decimal(base + (1 if index < extra else 0)) / 100)
+        for index in range(shards)
+    ])
+    account.is_hot = True
+    account.save(update_fields=['is_hot', 'updated_at'])
+    return account
+
+
+@transaction.atomic
+def disable_hot_mode(account):
+    """Fold the shards back into Account.balance and drop them"""
+    account = Account.objects.select_for_update().get(pk=account.pk)
+    if not account.is_hot:
+        return account
+    shards = list(AccountBalanceShard.objects.select_for_update().filter(account=account))
+    account.balance = sum((shard.balance for shard in shards), Decimal('0.00'))
+    account.is_hot = False
+    account.save(update_fields=['balance', 'is_hot', 'updated_at'])
+    account.balance_shards.all().delete()
+    return account
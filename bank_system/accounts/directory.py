@@ -0,0 +1,94 @@
+"""
+Account directory cache
+
+Maps an account number to the few fields a transfer needs (id, active flag,
+hot mode flag, owner display name) so TransferForm can resolve recipients without querying
+Account. Unknown numbers are cached too, for a shorter time, so typos and
+enumeration attempts do not reach the database either.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from transactions.models import Transaction
+from .models import Account
+
+AccountEntry = namedtuple('AccountEntry', ['id', 'account_number', 'is_active', 'is_hot', 'owner'])
+
+# Bump the version whenever AccountEntry changes shape
+CACHE_PREFIX = 'account_directory:2'
+DEFAULT_TTL = 60 * 10
+DEFAULT_NEGATIVE_TTL = 60
+WARM_INTERVAL = 60 * 10
+# Cached in place of an entry for numbers that do not exist
+MISSING = ()
+
+_ENTRY_FIELDS = ['id', 'account_number', 'is_active', 'is_hot', 'user__first_name', 'user__last_name', 'user__username']
+
+
+def _key(account_number):
+    return f'{CACHE_PREFIX}:{account_number}'
+
+
+def _ttl():
+    return getattr(settings, 'ACCOUNT_DIRECTORY_TTL', DEFAULT_TTL)
+
+
+def _negative_ttl():
+    return getattr(settings, 'ACCOUNT_DIRECTORY_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)
+
+
+def _owner_display(first_name, last_name, username):
+    """Show just enough of the owner's name to confirm the recipient"""
+    if first_name:
+        return f"{first_name} {last_name[:1]}.".strip() if last_name else first_name
+    return username
+
+
+def _entry_from_row(row):
+    account_id, account_number, is_active, is_hot, first_name, last_name, username = row
+    return AccountEntry(account_id, account_number, is_active, is_hot, _owner_display(first_name, last_name, username))
+
+
+def resolve_account_number(account_number):
+    """Return the AccountEntry for `account_number`, or None if no such account exists"""
+    cached = cache.get(_key(account_number))
+    if cached is not None:
+        return AccountEntry(*cached) if cached else None
+
+    row = Account.objects.filter(account_number=account_number).values_list(*_ENTRY_FIELDS).first()
+    if row is None:
+        cache.set(_key(account_number), MISSING, _negative_ttl())
+        return None
+
+    entry = _entry_from_row(row)
+    cache.set(_key(account_number), tuple(entry), _ttl())
+    return entry
+
+
+def invalidate_account_number(account_number):
+    cache.delete(_key(account_number))
+
+
+def warm_frequent_payees(user, limit=10):
+    """Pre-load the accounts `user` transfers to most often, at most once per WARM_INTERVAL"""
+    marker = f'{CACHE_PREFIX}:warm:{user.pk}'
+    if cache.get(marker):
+        return 0
+
+    # Grouped over the user's own transfers, then only the top payees are loaded
+    payees = (
+        Transaction.objects.filter(transaction_type='transfer', from_account__user=user, to_account__isnull=False)
+        .values('to_account')
+        .annotate(times_paid=Count('id'))
+        .order_by('-times_paid')[:limit]
+    )
+    rows = Account.objects.filter(pk__in=[row['to_account'] for row in payees]).values_list(*_ENTRY_FIELDS)
+    entries = {_key(row[1]): tuple(_entry_from_row(row)) for row in rows}
+    if entries:
+        cache.set_many(entries, _ttl())
+    cache.set(marker, True, WARM_INTERVAL)
+    return len(entries)
@@ -1,6 +1,6 @@
 from django import forms
 from .models import Account
-import random
+from .numbering import allocate_account_number
 
 class AccountForm(forms.ModelForm):
     class Meta:
@@ -19,7 +19,7 @@ class AccountForm(forms.ModelForm):
         if self.user:
             account.user = self.user
         if not account.account_number:
-            account.account_number = f"ACC{random.randint(1000000000, 9999999999)}"
+            account.account_number = allocate_account_number()
         if commit:
             account.save()
         return account
\ No newline at end of file
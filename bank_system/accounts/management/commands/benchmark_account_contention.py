@@ -0,0 +1,92 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections, transaction
+
+from accounts.balances import credit, debit, disable_hot_mode, enable_hot_mode, fold_hot_balances
+from accounts.models import Account
+
+AMOUNT = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput of concurrent writers against one account, with and without hot mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_number', help='Account to write to; its balance is left unchanged')
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads')
+        parser.add_argument('--ops', type=int, default=200, help='Operations per writer')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(account_number=options['account_number'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Account {options['account_number']} does not exist")
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite locks the whole database on write, so shards cannot help here; '
+                'run against PostgreSQL or MySQL for meaningful numbers.'
+            ))
+
+        was_hot = account.is_hot
+        try:
+            for mode in ('normal', 'hot'):
+                if mode == 'hot':
+                    account = enable_hot_mode(account)
+                else:
+                    account = disable_hot_mode(account)
+                ops, errors, elapsed = self._run(account, options['writers'], options['ops'])
+                self.stdout.write(
+                    f'{mode:>6}: {ops} ops in {elapsed:.2f}s = {ops / elapsed:,.0f} ops/s, {errors} errors'
+                )
+        finally:
+            account = enable_hot_mode(account) if was_hot else disable_hot_mode(account)
+            fold_hot_balances([account.pk])
+
+    def _run(self, account, writers, ops_per_writer):
+        """Every writer alternates a credit and a debit of one cent, so the balance ends where it started"""
+        results = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(writers)
+
+        def writer():
+            done = errors = owed = 0
+            barrier.wait()
+            try:
+                for _ in range(ops_per_writer):
+                    try:
+                        with transaction.atomic():
+                            if owed:
+                                paid = debit(account, AMOUNT)
+                            else:
+                                credit(account, AMOUNT)
+                    except DatabaseError:
+                        errors += 1
+                        continue
+                    if owed and not paid:
+                        errors += 1
+                        continue
+                    owed = 0 if owed else 1
+                    done += 1
+                # Give back a credit left over by an odd number of successful operations
+                while owed:
+                    try:
+                        owed = 0 if debit(account, AMOUNT) else owed
+                    except DatabaseError:
+                        time.sleep(0.01)
+            finally:
+                connections.close_all()
+            with lock:
+                results.append((done, errors))
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return sum(r[0] for r in results), sum(r[1] for r in results), elapsed
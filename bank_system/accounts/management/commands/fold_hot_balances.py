@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.balances import fold_hot_balances
+
+
+class Command(BaseCommand):
+    help = 'Refresh the displayed balance of hot accounts from their balance shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep folding every N seconds instead of running once')
+
+    def handle(self, *args, **options):
+        while True:
+            folded = fold_hot_balances()
+            self.stdout.write(self.style.SUCCESS(f'Folded {folded} hot account balances'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_accountnumbersequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="account",
+            name="is_hot",
+            field=models.BooleanField(
+                default=False,
+                help_text="Balance is split across shard rows to avoid write contention",
+            ),
+        ),
+        migrations.CreateModel(
+            name="AccountBalanceShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                (
+                    "balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balance_shards",
+                        to="accounts.account",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["account", "shard"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("account", "shard"), name="unique_account_balance_shard"
+                    )
+                ],
+            },
+        ),
+    ]
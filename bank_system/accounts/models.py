@@ -15,9 +15,35 @@ class Account(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    is_hot = models.BooleanField(default=False, help_text="Balance is split across shard rows to avoid write contention")
     
     def __str__(self):
         return f"{self.account_number} - {self.user.username}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+
+class AccountNumberSequence(models.Model):
+    """Counter row that blocks of account numbers are reserved from"""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_value}"
+
+
+class AccountBalanceShard(models.Model):
+    """One slice of a hot account's balance; the account balance is the sum of its shards"""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_shards')
+    shard = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.account.account_number} shard {self.shard}"
+
+    class Meta:
+        ordering = ['account', 'shard']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'shard'], name='unique_account_balance_shard'),
+        ]
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .directory import invalidate_account_number
+from .models import Account
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_directory_entry(sender, instance, **kwargs):
+    """Drop the cached directory entry when an account is opened, (de)activated or deleted"""
+    account_number = instance.account_number
+    invalidate_account_number(account_number)
+    # Also after commit, so a concurrent lookup cannot re-cache the old row
+    transaction.on_commit(lambda: invalidate_account_number(account_number))
@@ -1,3 +1,157 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+
+from transactions.forms import TransferForm
+from transactions.models import Transaction
+from . import numbering
+from .balances import credit, debit, disable_hot_mode, enable_hot_mode, fold_hot_balances, live_balance, shard_total
+from .directory import resolve_account_number, warm_frequent_payees
+from .models import Account, AccountNumberSequence
+from .numbering import (
+    allocate_account_number, format_account_number, is_plausible_account_number, luhn_check_digit, luhn_is_valid,
+)
+
+
+class WarmFrequentPayeesTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='payer')
+        self.source = Account.objects.create(user=self.user, account_number='SRC1', balance=Decimal('100'))
+        other = User.objects.create_user(username='payee')
+        self.payees = [
+            Account.objects.create(user=other, account_number=f'PAY{i}', balance=Decimal('0')) for i in range(3)
+        ]
+        for payee, times in zip(self.payees, (3, 1, 2)):
+            Transaction.objects.bulk_create([
+                Transaction(from_account=self.source, to_account=payee, transaction_type='transfer', amount=1)
+                for _ in range(times)
+            ])
+
+    def test_loads_most_paid_accounts(self):
+        self.assertEqual(warm_frequent_payees(self.user, limit=2), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_account_number('PAY0').id, self.payees[0].pk)
+            self.assertEqual(resolve_account_number('PAY2').id, self.payees[2].pk)
+
+    def test_runs_once_per_interval(self):
+        warm_frequent_payees(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(warm_frequent_payees(self.user), 0)
+
+
+class BalanceTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='holder')
+        self.account = Account.objects.create(user=user, account_number='BAL1', balance=Decimal('100.00'))
+
+    def _balance(self):
+        return Account.objects.values_list('balance', flat=True).get(pk=self.account.pk)
+
+    def test_plain_credit_and_debit(self):
+        with self.assertNumQueries(1):
+            credit(self.account, Decimal('5.00'))
+        with self.assertNumQueries(1):
+            self.assertTrue(debit(self.account, Decimal('25.00')))
+        self.assertEqual(self.account.balance, Decimal('80.00'))
+        self.assertEqual(self._balance(), Decimal('80.00'))
+
+    def test_plain_debit_insufficient(self):
+        self.assertFalse(debit(self.account, Decimal('100.01')))
+        self.assertEqual(self._balance(), Decimal('100.00'))
+
+    def test_hot_credit_and_debit(self):
+        account = enable_hot_mode(self.account)
+        with self.assertNumQueries(1):
+            credit(account, Decimal('10.00'))
+        self.assertTrue(debit(account, Decimal('60.00')))
+        self.assertFalse(debit(account, Decimal('50.01')))
+        self.assertEqual(shard_total(account), Decimal('50.00'))
+        # The cached balance is only refreshed by a fold
+        self.assertEqual(self._balance(), Decimal('100.00'))
+        self.assertEqual(Account.objects.aggregate(total=Sum(live_balance()))['total'], Decimal('50.00'))
+        with self.assertNumQueries(1):
+            self.assertEqual(fold_hot_balances(), 1)
+        self.assertEqual(self._balance(), Decimal('50.00'))
+
+    def test_stale_plain_flag_uses_shards(self):
+        stale = Account.objects.get(pk=self.account.pk)
+        enable_hot_mode(self.account, shards=4)
+        credit(stale, Decimal('10.00'))
+        self.assertTrue(debit(stale, Decimal('30.00')))
+        self.assertFalse(debit(stale, Decimal('80.01')))
+        self.assertEqual(shard_total(self.account), Decimal('80.00'))
+        self.assertEqual(self._balance(), Decimal('100.00'))
+
+    def test_stale_hot_flag_uses_balance(self):
+        stale = enable_hot_mode(self.account, shards=4)
+        disable_hot_mode(self.account)
+        credit(stale, Decimal('10.00'))
+        self.assertTrue(debit(stale, Decimal('30.00')))
+        self.assertFalse(debit(stale, Decimal('80.01')))
+        self.assertEqual(self._balance(), Decimal('80.00'))
+
+
+@override_settings(ACCOUNT_NUMBER_BLOCK_SIZE=3)
+class AccountNumberTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        # Each test starts without a block held by this process
+        patcher = mock.patch.dict(numbering._allocators, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_blocks_are_reserved_once_per_block_size(self):
+        first = allocate_account_number()
+        with self.assertNumQueries(0):
+            rest = [allocate_account_number() for _ in range(2)]
+        fourth = allocate_account_number()
+        self.assertEqual([first, *rest, fourth], [format_account_number('account', value) for value in range(1, 5)])
+        self.assertEqual(AccountNumberSequence.objects.get(name='account').last_value, 6)
+        # Another process holding no block continues after the reserved values
+        with mock.patch.dict(numbering._allocators, clear=True):
+            self.assertEqual(allocate_account_number(), format_account_number('account', 7))
+
+    def test_sequences_are_independent(self):
+        self.assertEqual(allocate_account_number('savings'), format_account_number('savings', 1))
+        self.assertEqual(allocate_account_number(), format_account_number('account', 1))
+
+    def test_formats(self):
+        account, savings = allocate_account_number(), allocate_account_number('savings')
+        self.assertRegex(account, r'^ACC\d{11}$')
+        self.assertRegex(savings, r'^SAV\d{9}$')
+        self.assertTrue(is_plausible_account_number(account))
+        self.assertTrue(is_plausible_account_number(savings))
+        with self.assertRaises(OverflowError):
+            format_account_number('savings', 10**8)
+
+    def test_luhn_check_digit(self):
+        self.assertEqual(luhn_check_digit('7992739871'), '3')
+        self.assertTrue(luhn_is_valid('79927398713'))
+        self.assertFalse(luhn_is_valid('79927398710'))
+        self.assertFalse(luhn_is_valid('7'))
+
+    def test_plausibility(self):
+        number = format_account_number('account', 42)
+        typo = number[:-2] + str((int(number[-2]) + 1) % 10) + number[-1]
+        self.assertFalse(is_plausible_account_number(typo))
+        # Numbers issued before allocation have no check digit and are left to the database
+        self.assertTrue(is_plausible_account_number('ACC12345'))
+        self.assertFalse(is_plausible_account_number('  '))
+
+    def test_transfer_form_rejects_typos_without_a_lookup(self):
+        number = format_account_number('account', 42)
+        form = TransferForm({'amount': '5.00', 'to_account_number': number[:-1] + str((int(number[-1]) + 1) % 10)})
+        with self.assertNumQueries(0):
+            self.assertFalse(form.is_valid())
+        self.assertIn('check it for typos', form.errors['to_account_number'][0])
@@ -5,6 +5,7 @@ urlpatterns = [
     path('', views.account_list, name='account_list'),
     path('create/', views.account_create, name='account_create'),
     path('<int:pk>/', views.account_detail, name='account_detail'),
+    path('<int:pk>/statement/', views.account_statement, name='account_statement'),
     path('<int:pk>/update/', views.account_update, name='account_update'),
     path('<int:pk>/delete/', views.account_delete, name='account_delete'),
 ]
\ No newline at end of file
@@ -2,6 +2,11 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
+from django.http import HttpResponseBadRequest
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from transactions.statements import FORMATS, statement_response
+from .balances import shard_total
 from .models import Account
 from .forms import AccountForm
 
@@ -33,6 +38,25 @@ def account_detail(request, pk):
         'total_transfers': total_transfers,
     })
 
+@login_required
+def account_statement(request, pk):
+    """Download a statement for any date range as CSV, JSON Lines or PDF"""
+    account = get_object_or_404(Account, pk=pk, user=request.user)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('Unsupported statement format.')
+
+    try:
+        start = parse_date(request.GET.get('start', '')) or timezone.localtime(account.created_at).date()
+        end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date.')
+    if start > end:
+        return HttpResponseBadRequest('Start date must be before end date.')
+
+    return statement_response(account, start, end, fmt)
+
 @login_required
 def account_create(request):
     if request.method == 'POST':
@@ -62,8 +86,9 @@ def account_update(request, pk):
 def account_delete(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
     if request.method == 'POST':
-        # Check if account has balance
-        if account.balance > 0:
+        # Check if account has balance, a hot account's is in its shards
+        balance = shard_total(account) if account.is_hot else account.balance
+        if balance > 0:
             messages.error(request, 'Cannot delete account with non-zero balance!')
             return redirect('account_detail', pk=account.pk)
         
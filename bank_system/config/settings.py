@@ -99,9 +99,19 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    # Cold storage for archived transactions (python manage.py migrate --database=archive)
+    "archive": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "archive.sqlite3",
+    },
 }
 
+DATABASE_ROUTERS = ['transactions.routers.TransactionArchiveRouter']
+
+# Transactions older than this many days move to the archive database
+TRANSACTION_ARCHIVE_HORIZON_DAYS = 365
+
 # Caching Configuration
 CACHES = {
     'default': {
@@ -113,6 +123,45 @@ CACHES = {
     }
 }
 
+# Idempotency keys for deposit/withdraw/transfer (seconds)
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# Account numbers reserved per worker in one counter UPDATE
+ACCOUNT_NUMBER_BLOCK_SIZE = 100
+
+# Account directory cache used by transfers (seconds)
+ACCOUNT_DIRECTORY_TTL = 60 * 10
+ACCOUNT_DIRECTORY_NEGATIVE_TTL = 60
+
+# Balance shard rows per account in hot mode (see accounts.balances)
+HOT_ACCOUNT_SHARDS = 8
+
+# Drop folder for market price files (see investments.pricefeed)
+PRICE_FEED_DIR = BASE_DIR / 'price_feed'
+
+# Days of minute and hour price bars kept by the compact_prices command; day bars are kept for good
+PRICE_HISTORY_RETENTION = {'minute': 7, 'hour': 90}
+
+# Annual risk-free rate in percent for Sharpe ratios (see investments.performance)
+RISK_FREE_RATE = 2.0
+
+# Monte Carlo paths and random seed for portfolio Value-at-Risk (see investments.risk)
+RISK_SIMULATION_PATHS = 10000
+RISK_SIMULATION_SEED = 1729
+
+# 'inline' executes investment orders as they are placed, 'queued' leaves them
+# to the execute_orders command (see investments.orders)
+INVESTMENT_ORDER_EXECUTION = 'inline'
+
+# Days an installment can stay unpaid before the servicing batch defaults its loan (see loans.servicing)
+LOAN_DEFAULT_AFTER_DAYS = 90
+
+# Share of the outstanding balance expected to be lost, by aging bucket (see loans.rollups)
+LOAN_EXPECTED_LOSS_RATES = {'current': 0.01, '1-30': 0.05, '31-60': 0.15, '61-90': 0.35, '90+': 0.75}
+
+# Months of loan payments customers must hold in their accounts to be offered a loan (see loans.pricing)
+LOAN_RESERVE_MONTHS = 6
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -24,5 +24,6 @@ urlpatterns = [
     path('transactions/', include('transactions.urls')),
     path('savings/', include('savings.urls')),
     path('investments/', include('investments.urls')),
+    path('loans/', include('loans.urls')),
     path('settings/', include('settings.urls')),
 ]
\ No newline at end of file
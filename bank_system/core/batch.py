@@ -0,0 +1,49 @@
+"""
+Helpers for batch jobs: splitting tables into id ranges and spreading work
+over forked worker processes.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connections
+from django.db.models import Max, Min
+
+
+def chunked(items, size):
+    """Split a sequence into lists of at most `size` items"""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def id_ranges(queryset, chunk_size):
+    """Return half-open (start, stop) primary key ranges covering `queryset`"""
+    bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    return [
+        (start, min(start + chunk_size, bounds['high'] + 1))
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size)
+    ]
+
+
+def run_in_processes(func, tasks, workers=1):
+    """
+    Call ``func(*task)`` for every task and yield the results as they finish.
+
+    With more than one worker the tasks run in forked processes. Database
+    connections are closed first so every child opens its own. `func` must be
+    a module level function so it can be pickled.
+    """
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield func(*task)
+        return
+
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(func, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,14 @@
+"""
+Calendar helpers shared by the apps
+"""
+
+import calendar
+from datetime import date
+
+
+def add_months(start, months):
+    """`start` moved by whole months, clamped to the last day of shorter months"""
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    month += 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
@@ -5,9 +5,10 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from accounts.models import Account
+from accounts.numbering import allocate_account_number
 from transactions.models import Transaction, FraudDetection
 from savings.models import SavingsProduct, SavingsAccount
-from investments.models import InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding
+from investments.models import InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding, InvestmentLot
 from loans.models import LoanProduct, Loan
 from bills.models import BillerCategory, Biller
 
@@ -264,7 +265,7 @@ class Command(BaseCommand):
     def create_user_accounts(self, user):
         """Create checking and savings accounts for user"""
         for account_type in ['checking', 'savings']:
-            account_number = f'{user.id:06d}{random.randint(1000, 9999)}'
+            account_number = allocate_account_number()
             Account.objects.get_or_create(
                 user=user,
                 account_number=account_number,
@@ -279,7 +280,7 @@ class Command(BaseCommand):
         """Create savings accounts for user"""
         products = SavingsProduct.objects.all()
         for product in products[:2]:  # 2 savings products per user
-            account_number = f'SAV{user.id:06d}{random.randint(1000, 9999)}'
+            account_number = allocate_account_number('savings')
             account = user.accounts.first()
             if account:
                 SavingsAccount.objects.get_or_create(
@@ -345,7 +346,7 @@ class Command(BaseCommand):
         # Add some holdings
         products = InvestmentProduct.objects.all()[:5]
         for product in products:
-            InvestmentHolding.objects.get_or_create(
+            holding, created = InvestmentHolding.objects.get_or_create(
                 portfolio=portfolio,
                 product=product,
                 defaults={
@@ -354,6 +355,12 @@ class Command(BaseCommand):
                     'current_price': product.current_price,
                 }
             )
+            if created:
+                # Sales are matched against lots, so the seeded shares get their opening lot
+                InvestmentLot.objects.create(
+                    holding=holding, quantity=holding.quantity, remaining=holding.quantity,
+                    price=holding.purchase_price, acquired_at=holding.purchase_date,
+                )
 
     def create_user_loans(self, user):
         """Create loans for user"""
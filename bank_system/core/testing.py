@@ -0,0 +1,28 @@
+"""
+Test helpers shared by the apps
+"""
+
+from contextlib import ExitStack
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin:
+    """For TestCases checking that a code path runs a fixed number of queries"""
+
+    def assertQueryCountFixed(self, few, many, using=('default',)):
+        """
+        Call `few()`, then assert `many()` runs exactly as many queries on each
+        database in `using`. Returns both results.
+        """
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in using]
+            few_result = few()
+        # Counted straight away: the next request would clear the connection's query log
+        expected = [len(queries) for queries in captured]
+        with ExitStack() as stack:
+            for alias, count in zip(using, expected):
+                stack.enter_context(self.assertNumQueries(count, using=alias))
+            many_result = many()
+        return few_result, many_result
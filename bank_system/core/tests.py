@@ -1,3 +1,123 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from investments.models import (
+    InvestmentHolding, InvestmentPlatform, InvestmentProduct, InvestmentTransaction, Portfolio, TargetAllocation,
+)
+from savings.models import InterestTransaction, SavingsAccount, SavingsGoal, SavingsProduct
+from .dates import add_months
+from .testing import QueryCountMixin
+
+# Pages checked, as (label, staff only, url for the fixture built by _populate)
+PAGES = [
+    ('portfolio list', False, lambda f: reverse('investments:portfolio_list')),
+    ('portfolio detail', False, lambda f: reverse('investments:portfolio_detail', args=[f['portfolio'].pk])),
+    ('products', False, lambda f: reverse('investments:products_list')),
+    ('buy', False, lambda f: reverse('investments:buy_investment', args=[f['portfolio'].pk])),
+    ('sell', False, lambda f: reverse('investments:sell_investment', args=[f['holding'].pk])),
+    ('rebalance', False, lambda f: reverse('investments:rebalance_portfolio', args=[f['portfolio'].pk])),
+    ('savings list', False, lambda f: reverse('savings:savings_list')),
+    ('savings detail', False, lambda f: reverse('savings:savings_detail', args=[f['savings'].pk])),
+    ('goals', False, lambda f: reverse('savings:goals_list')),
+    ('admin portfolios', True, lambda f: reverse('admin:investments_portfolio_changelist')),
+    ('admin holdings', True, lambda f: reverse('admin:investments_investmentholding_changelist')),
+    ('admin investment transactions', True, lambda f: reverse('admin:investments_investmenttransaction_changelist')),
+    ('admin savings accounts', True, lambda f: reverse('admin:savings_savingsaccount_changelist')),
+    ('admin savings goals', True, lambda f: reverse('admin:savings_savingsgoal_changelist')),
+    ('admin interest', True, lambda f: reverse('admin:savings_interesttransaction_changelist')),
+]
+
+
+def _populate(tag, rows):
+    """A customer and a staff user, with `rows` portfolios, holdings, trades, savings accounts, goals and credits"""
+    User = get_user_model()
+    user = User.objects.create_user(username=f'query-check-{tag}')
+    staff = User.objects.create_superuser(username=f'query-check-staff-{tag}', email='', password=None)
+    account = Account.objects.create(user=user, account_number=f'QC{tag.upper()}', balance=Decimal('100000'))
+
+    platform = InvestmentPlatform.objects.create(name=f'Query check {tag}', platform_type='stocks')
+    products = InvestmentProduct.objects.bulk_create([
+        InvestmentProduct(platform=platform, name=f'Product {i}', symbol=f'QC{tag}{i}', risk_level='low',
+                          current_price=Decimal('10.00'), expected_return=Decimal('5.00'))
+        for i in range(rows)
+    ])
+    portfolios = Portfolio.objects.bulk_create([
+        Portfolio(user=user, account=account, name=f'Portfolio {i}', total_invested=Decimal('100.00'),
+                  current_value=Decimal('110.00'))
+        for i in range(rows)
+    ])
+    portfolio = portfolios[0]
+    holdings = InvestmentHolding.objects.bulk_create([
+        InvestmentHolding(portfolio=portfolio, product=product, quantity=Decimal('1'),
+                          purchase_price=Decimal('9.00'), current_price=Decimal('10.00'))
+        for product in products
+    ])
+    InvestmentTransaction.objects.bulk_create([
+        InvestmentTransaction(portfolio=portfolio, product=holding.product, holding=holding, transaction_type='buy',
+                              quantity=Decimal('1'), price=Decimal('9.00'), total_amount=Decimal('9.00'))
+        for holding in holdings
+    ])
+    TargetAllocation.objects.bulk_create([
+        TargetAllocation(portfolio=portfolio, product=product, weight=Decimal(100) / rows)
+        for product in products
+    ])
+
+    savings_product = SavingsProduct.objects.create(name=f'Query check {tag}', interest_rate=Decimal('2.00'))
+    savings = SavingsAccount.objects.bulk_create([
+        SavingsAccount(user=user, product=savings_product, account=account, account_number=f'QS{tag.upper()}{i}',
+                       balance=Decimal('500.00'))
+        for i in range(rows)
+    ])
+    target_date = timezone.localdate() + timedelta(days=365)
+    SavingsGoal.objects.bulk_create([
+        SavingsGoal(user=user, savings_account=savings[0], name=f'Goal {i}', target_amount=Decimal('1000.00'),
+                    target_date=target_date)
+        for i in range(rows)
+    ])
+    InterestTransaction.objects.bulk_create([
+        InterestTransaction(savings_account=savings[0], amount=Decimal('1.00'), interest_rate=Decimal('2.00'))
+        for _ in range(rows)
+    ])
+
+    client, staff_client = Client(), Client()
+    client.force_login(user)
+    staff_client.force_login(staff)
+    return {
+        'client': client, 'staff_client': staff_client,
+        'portfolio': portfolio, 'holding': holdings[0], 'savings': savings[0],
+    }
+
+
+class PageQueryCountTests(QueryCountMixin, TestCase):
+    """Investment and savings pages run the same number of queries however many rows they show"""
+    databases = {'default', 'archive'}
+
+    def _get(self, fixture, staff, url):
+        client = fixture['staff_client'] if staff else fixture['client']
+        response = client.get(url(fixture))
+        self.assertEqual(response.status_code, 200, url(fixture))
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        few, many = _populate('few', 2), _populate('many', 12)
+        for label, staff, url in PAGES:
+            with self.subTest(label):
+                # The first requests warm per-user and per-day caches, the second ones are counted
+                self._get(few, staff, url)
+                self._get(many, staff, url)
+                self.assertQueryCountFixed(lambda: self._get(few, staff, url), lambda: self._get(many, staff, url))
+
+
+class AddMonthsTests(SimpleTestCase):
+    def test_clamps_to_month_end(self):
+        self.assertEqual(add_months(date(2024, 1, 31), 1), date(2024, 2, 29))
+        self.assertEqual(add_months(date(2023, 1, 31), 1), date(2023, 2, 28))
+
+    def test_crosses_years(self):
+        self.assertEqual(add_months(date(2024, 11, 15), 3), date(2025, 2, 15))
+        self.assertEqual(add_months(date(2024, 3, 15), -3), date(2023, 12, 15))
@@ -2,6 +2,7 @@ from django.urls import path, include
 from . import admin_views, bi_views
 from investments import admin_views as investment_admin_views
 from savings import admin_views as savings_admin_views
+from loans import admin_views as loan_admin_views
 
 app_name = 'admin_panel'
 
@@ -21,6 +22,7 @@ investment_patterns = [
     path('investment-platforms/create/', investment_admin_views.investment_platform_create, name='investment_platform_create'),
     path('investment-platforms/<int:pk>/edit/', investment_admin_views.investment_platform_edit, name='investment_platform_edit'),
     path('investment-platforms/<int:pk>/delete/', investment_admin_views.investment_platform_delete, name='investment_platform_delete'),
+    path('investment-risk/', investment_admin_views.investment_risk, name='investment_risk'),
 ]
 
 # Savings product management
@@ -31,4 +33,9 @@ savings_patterns = [
     path('savings-products/<int:pk>/delete/', savings_admin_views.savings_product_delete, name='savings_product_delete'),
 ]
 
-urlpatterns = dashboard_patterns + investment_patterns + savings_patterns
+# Loan book analytics
+loan_patterns = [
+    path('loan-book/', loan_admin_views.loan_book, name='loan_book'),
+]
+
+urlpatterns = dashboard_patterns + investment_patterns + savings_patterns + loan_patterns
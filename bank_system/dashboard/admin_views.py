@@ -9,10 +9,13 @@ from datetime import timedelta
 from django.core.serializers.json import DjangoJSONEncoder
 import json
 
+from accounts.balances import live_balance
 from accounts.models import Account
 from transactions.models import Transaction
+from transactions.archive import transaction_totals
 from savings.models import SavingsProduct, SavingsAccount
 from investments.models import InvestmentProduct, Portfolio
+from loans.rollups import book_summary
 from users.models import User
 from users.decorators import manager_required
 
@@ -94,10 +97,8 @@ def get_transaction_type_distribution():
         return data
 
     try:
-        distribution = Transaction.objects.values('transaction_type').annotate(
-            count=Count('id')
-        ).order_by('transaction_type')
-        data = {item['transaction_type']: item['count'] for item in distribution}
+        # Archived transactions included, so the split does not shift after each archive run
+        data = {kind: count for kind, (count, _) in sorted(transaction_totals().items())}
         cache.set(cache_key, data, 300)
         return data
     except:
@@ -120,18 +121,20 @@ def admin_dashboard(request):
     # Account analytics
     try:
         total_accounts = Account.objects.count()
-        total_balance = Account.objects.aggregate(total=Sum('balance'))['total'] or 0
-        avg_balance = Account.objects.aggregate(avg=Avg('balance'))['avg'] or 0
+        balances = Account.objects.aggregate(total=Sum(live_balance()), avg=Avg(live_balance()))
+        total_balance = balances['total'] or 0
+        avg_balance = balances['avg'] or 0
     except:
         total_accounts = total_balance = avg_balance = 0
 
     # Transaction analytics
     try:
-        total_transactions = Transaction.objects.count()
+        totals = transaction_totals().values()
+        total_transactions = sum(count for count, _ in totals)
         this_month_transactions = Transaction.objects.filter(
             created_at__gte=timezone.now() - timedelta(days=30)
         ).count()
-        total_transaction_volume = Transaction.objects.aggregate(total=Sum('amount'))['total'] or 0
+        total_transaction_volume = sum(volume for _, volume in totals)
     except:
         total_transactions = this_month_transactions = total_transaction_volume = 0
 
@@ -151,6 +154,13 @@ def admin_dashboard(request):
     except:
         total_investment_products = active_portfolios = total_portfolio_value = 0
 
+    # Loan analytics, precomputed by the loan book rollup
+    try:
+        loan_book = book_summary()
+        loans_90_plus = loan_book.by_bucket['90+'].loans
+    except:
+        loan_book, loans_90_plus = None, 0
+
     # Get chart data
     transaction_chart_data = get_transaction_chart_data()
     account_type_data = get_account_type_distribution()
@@ -173,6 +183,8 @@ def admin_dashboard(request):
         'total_investment_products': total_investment_products,
         'active_portfolios': active_portfolios,
         'total_portfolio_value': total_portfolio_value,
+        'loan_book': loan_book,
+        'loans_90_plus': loans_90_plus,
         # Chart data as JSON
         'transaction_chart_data_json': json.dumps(transaction_chart_data, cls=DjangoJSONEncoder),
         'account_type_data_json': json.dumps(account_type_data, cls=DjangoJSONEncoder),
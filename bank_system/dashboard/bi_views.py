@@ -13,8 +13,10 @@ from statsmodels.tsa.seasonal import seasonal_decompose
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from django.core.serializers.json import DjangoJSONEncoder
 
+from accounts.balances import live_balance
 from accounts.models import Account
-from transactions.models import Transaction
+from transactions.models import Transaction, ArchivedTransaction
+from transactions.archive import cold_watermark, transaction_totals
 from users.models import User
 from users.decorators import manager_required
 
@@ -41,8 +43,10 @@ def get_daily_transaction_data(days=90):
 def get_descriptive_analytics():
     """Get descriptive statistics for transactions"""
     try:
-        transactions = Transaction.objects.all()
-        amounts = list(transactions.values_list('amount', flat=True))
+        amounts = list(Transaction.objects.values_list('amount', flat=True))
+        if cold_watermark() is not None:
+            # Archived rows are part of the all-time distribution too
+            amounts += ArchivedTransaction.objects.values_list('amount', flat=True)
 
         if not amounts:
             return {}
@@ -125,8 +129,7 @@ def forecast_transaction_volume(data_dict, periods=30):
 def get_account_balance_analytics():
     """Get analytics about account balances"""
     try:
-        accounts = Account.objects.all()
-        balances = list(accounts.values_list('balance', flat=True))
+        balances = list(Account.objects.annotate(live=live_balance()).values_list('live', flat=True))
 
         if not balances:
             return {}
@@ -161,8 +164,8 @@ def get_user_activity_analytics():
         active_last_month = users.filter(last_login__gte=thirty_days_ago).count()
 
         # Transaction activity
-        transactions = Transaction.objects.all()
-        avg_transactions_per_user = transactions.count() / total_users if total_users > 0 else 0
+        transaction_count = sum(count for count, _ in transaction_totals().values())
+        avg_transactions_per_user = transaction_count / total_users if total_users > 0 else 0
 
         return {
             'total_users': total_users,
@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from accounts.balances import live_balance
 from accounts.models import Account
 from transactions.models import Transaction
 from savings.models import SavingsAccount, SavingsGoal
@@ -9,7 +10,7 @@ from django.db.models import Sum, Q
 @login_required
 def dashboard(request):
     accounts = Account.objects.filter(user=request.user, is_active=True)
-    total_balance = accounts.aggregate(total=Sum('balance'))['total'] or 0
+    total_balance = accounts.aggregate(total=Sum(live_balance()))['total'] or 0
 
     # Get recent transactions for user's accounts
     recent_transactions = Transaction.objects.filter(
@@ -21,8 +22,8 @@ def dashboard(request):
     total_savings = savings_accounts.aggregate(total=Sum('balance'))['total'] or 0
     total_interest_earned = savings_accounts.aggregate(total=Sum('interest_earned'))['total'] or 0
 
-    # Savings goals
-    active_goals = SavingsGoal.objects.filter(user=request.user, status='active')
+    # Savings goals, closest to completion first (served by savings_goal_progress_idx)
+    active_goals = SavingsGoal.objects.filter(user=request.user, status='active').order_by('-progress')
 
     # Investment data
     portfolios = Portfolio.objects.filter(user=request.user, status='active')
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding, InvestmentTransaction
+from .models import (
+    InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding, InvestmentTransaction, InvestmentLot, RealizedGain,
+    InvestmentOrder, TargetAllocation,
+)
+from .valuation import revalue_portfolios
 
 
 @admin.register(InvestmentPlatform)
@@ -48,7 +52,7 @@ class PortfolioAdmin(admin.ModelAdmin):
     readonly_fields = ['total_invested', 'current_value', 'total_return', 'return_percentage', 'profit_loss', 'created_at', 'updated_at']
     fieldsets = (
         ('Portfolio Information', {
-            'fields': ('user', 'account', 'name', 'description', 'status')
+            'fields': ('user', 'account', 'name', 'description', 'status', 'cost_basis_method')
         }),
         ('Financial Summary', {
             'fields': ('total_invested', 'current_value', 'total_return', 'return_percentage', 'profit_loss')
@@ -62,10 +66,7 @@ class PortfolioAdmin(admin.ModelAdmin):
 
     def update_portfolio_values(self, request, queryset):
         """Admin action to recalculate portfolio values"""
-        count = 0
-        for portfolio in queryset:
-            portfolio.update_portfolio_value()
-            count += 1
+        count = revalue_portfolios(queryset)
         self.message_user(request, f'Portfolio values updated for {count} portfolio(s).')
 
     update_portfolio_values.short_description = "Update portfolio values"
@@ -74,6 +75,8 @@ class PortfolioAdmin(admin.ModelAdmin):
 @admin.register(InvestmentHolding)
 class InvestmentHoldingAdmin(admin.ModelAdmin):
     list_display = ['product', 'portfolio', 'quantity', 'purchase_price', 'current_price', 'current_value', 'profit_loss', 'return_percentage', 'status']
+    # Join only what the change list renders, rather than every foreign key Django would follow
+    list_select_related = ['product', 'portfolio__user']
     list_filter = ['status', 'purchase_date', 'product__platform']
     search_fields = ['product__symbol', 'product__name', 'portfolio__name', 'portfolio__user__username']
     readonly_fields = ['purchase_value', 'current_value', 'profit_loss', 'return_percentage', 'purchase_date']
@@ -97,6 +100,7 @@ class InvestmentHoldingAdmin(admin.ModelAdmin):
 @admin.register(InvestmentTransaction)
 class InvestmentTransactionAdmin(admin.ModelAdmin):
     list_display = ['transaction_type', 'product', 'portfolio', 'quantity', 'price', 'total_amount', 'transaction_date']
+    list_select_related = ['product', 'portfolio__user']
     list_filter = ['transaction_type', 'transaction_date', 'product__platform']
     search_fields = ['product__symbol', 'portfolio__name', 'portfolio__user__username', 'notes']
     readonly_fields = ['transaction_date']
@@ -112,3 +116,39 @@ class InvestmentTransactionAdmin(admin.ModelAdmin):
             'fields': ('account_transaction', 'notes')
         }),
     )
+
+
+@admin.register(InvestmentLot)
+class InvestmentLotAdmin(admin.ModelAdmin):
+    list_display = ['holding', 'quantity', 'remaining', 'price', 'acquired_at']
+    list_select_related = ['holding__product', 'holding__portfolio']
+    search_fields = ['holding__product__symbol', 'holding__portfolio__name', 'holding__portfolio__user__username']
+    readonly_fields = ['holding', 'transaction', 'quantity', 'remaining', 'price', 'acquired_at']
+    date_hierarchy = 'acquired_at'
+
+
+@admin.register(RealizedGain)
+class RealizedGainAdmin(admin.ModelAdmin):
+    list_display = ['holding', 'method', 'quantity', 'cost_basis', 'proceeds', 'gain', 'realized_at']
+    list_select_related = ['holding__product', 'holding__portfolio']
+    list_filter = ['method', 'realized_at']
+    search_fields = ['holding__product__symbol', 'holding__portfolio__name', 'holding__portfolio__user__username']
+    readonly_fields = ['transaction', 'holding', 'method', 'quantity', 'cost_basis', 'proceeds', 'gain', 'realized_at']
+    date_hierarchy = 'realized_at'
+
+
+@admin.register(InvestmentOrder)
+class InvestmentOrderAdmin(admin.ModelAdmin):
+    list_display = ['portfolio', 'product', 'side', 'quantity', 'status', 'price', 'total_amount', 'created_at', 'executed_at']
+    list_select_related = ['portfolio__user', 'product']
+    list_filter = ['status', 'side', 'created_at']
+    search_fields = ['product__symbol', 'portfolio__name', 'portfolio__user__username']
+    readonly_fields = ['price', 'total_amount', 'reject_reason', 'transaction', 'executed_at', 'created_at']
+    date_hierarchy = 'created_at'
+
+
+@admin.register(TargetAllocation)
+class TargetAllocationAdmin(admin.ModelAdmin):
+    list_display = ['portfolio', 'product', 'weight', 'updated_at']
+    list_select_related = ['portfolio__user', 'product']
+    search_fields = ['product__symbol', 'portfolio__name', 'portfolio__user__username']
@@ -1,31 +1,36 @@
+import time
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from .models import InvestmentProduct, InvestmentPlatform
+from django.http import HttpResponse
+from .models import InvestmentProduct, InvestmentPlatform, Portfolio
+from .catalog import find_products, get_catalog, render_fragment
 from .admin_forms import InvestmentProductForm, InvestmentPlatformForm
+from .risk import CONFIDENCE_LEVELS, HORIZONS, book_risk, portfolio_risk, simulation_params
 from users.decorators import manager_required
 
 
 @manager_required
 def investment_products_list(request):
     """List all investment products"""
-    products = InvestmentProduct.objects.all()
-    platforms = InvestmentPlatform.objects.all()
+    catalog = get_catalog()
     is_ajax = request.GET.get('ajax') == 'true'
 
     platform_filter = request.GET.get('platform')
-    if platform_filter:
-        products = products.filter(platform_id=platform_filter)
+    products_table = render_fragment(
+        'admin_products', 'admin/investment_products_table.html', catalog, (platform_filter,),
+        {'products': find_products(catalog, platform_filter)},
+    )
+
+    # Return just the table for AJAX requests
+    if is_ajax:
+        return HttpResponse(products_table)
 
     context = {
-        'products': products,
-        'platforms': platforms,
+        'products_table': products_table,
+        'platforms': catalog.platforms,
         'current_platform': platform_filter,
     }
-
-    # Return partial template for AJAX requests (just the table)
-    if is_ajax:
-        return render(request, 'admin/investment_products_table.html', context)
-
     return render(request, 'admin/investment_products_list.html', context)
 
 
@@ -132,3 +137,38 @@ def investment_platform_delete(request, pk):
 
     context = {'platform': platform}
     return render(request, 'admin/confirm_delete.html', context)
+
+
+@manager_required
+def investment_risk(request):
+    """Monte Carlo VaR of the whole investment book and its riskiest portfolios"""
+    started = time.perf_counter()
+    try:
+        horizon = int(request.GET.get('horizon', 10))
+        confidence = float(request.GET.get('confidence', 0.95))
+    except ValueError:
+        horizon, confidence = 10, 0.95
+    if horizon not in HORIZONS:
+        horizon = 10
+    if confidence not in CONFIDENCE_LEVELS:
+        confidence = 0.95
+
+    params = simulation_params(horizon_days=horizon, confidence=confidence)
+    portfolios = Portfolio.objects.filter(status='active')
+    results = portfolio_risk(portfolios, params)
+    book = book_risk(portfolios, params)
+
+    riskiest = sorted(results.items(), key=lambda item: item[1].var, reverse=True)[:50]
+    names = Portfolio.objects.select_related('user').in_bulk([portfolio_id for portfolio_id, _ in riskiest])
+    context = {
+        'book': book,
+        'portfolios': [(names[portfolio_id], result) for portfolio_id, result in riskiest],
+        'portfolio_count': len(results),
+        # What holding the positions in one book saves over the portfolios' separate VaRs
+        'diversification': sum(result.var for result in results.values()) - book.var,
+        'params': params,
+        'horizons': HORIZONS,
+        'confidence_levels': CONFIDENCE_LEVELS,
+        'elapsed': time.perf_counter() - started,
+    }
+    return render(request, 'admin/investment_risk.html', context)
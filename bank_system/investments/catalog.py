@@ -0,0 +1,102 @@
+"""
+Investment product catalog
+
+Products and platforms change rarely but are browsed constantly, so each
+process keeps a snapshot of them: every product with its platform, plus an
+index from (platform id, risk level, is_active) to the matching products,
+with None standing for "any" in each position. Any filter combination is
+one dictionary lookup.
+
+The snapshot is tagged with a version read from the rows themselves: the
+count and latest updated_at of products and platforms, in one aggregate
+query. Saving, adding or deleting a product or platform, or the price feed
+writing new prices, moves it when the change commits, whichever process
+made it; every process notices on its next request and rebuilds with two
+queries. Rendered tables are cached per version and filter, so browsing
+the catalog never reads the products or platforms themselves.
+"""
+
+import hashlib
+import itertools
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import InvestmentPlatform, InvestmentProduct
+
+CACHE_PREFIX = 'investment_catalog:2'
+FRAGMENT_TTL = 60 * 60
+
+Catalog = namedtuple('Catalog', ['version', 'products', 'platforms', 'active_platforms', 'index'])
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current_version():
+    """Version of the committed products and platforms, as a string usable in cache keys"""
+    stamp = InvestmentPlatform.objects.aggregate(
+        platform_rows=Count('pk', distinct=True), platform_changed=Max('updated_at'),
+        product_rows=Count('products', distinct=True), product_changed=Max('products__updated_at'),
+    )
+    # A delete lowers a count, anything else saved moves a latest updated_at
+    return '-'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in stamp.values())
+
+
+def _build(version):
+    products = tuple(InvestmentProduct.objects.select_related('platform').order_by('symbol'))
+    platforms = tuple(InvestmentPlatform.objects.order_by('name'))
+    index = {}
+    for product in products:
+        for key in itertools.product(
+            (product.platform_id, None), (product.risk_level, None), (product.is_active, None)
+        ):
+            index.setdefault(key, []).append(product)
+    return Catalog(
+        version=version,
+        products=products,
+        platforms=platforms,
+        active_platforms=tuple(platform for platform in platforms if platform.is_active),
+        index={key: tuple(matches) for key, matches in index.items()},
+    )
+
+
+def get_catalog():
+    """The current Catalog, rebuilt only when its version has moved on"""
+    global _snapshot
+    # Read before building, so a change made during the build leaves the snapshot already out of date
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = _build(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+def _platform_key(value):
+    if value in (None, ''):
+        return None
+    return int(value) if str(value).isdigit() else value
+
+
+def find_products(catalog, platform=None, risk_level=None, is_active=None):
+    """Products matching the filters, `platform` may be an id or the raw query string value"""
+    return catalog.index.get((_platform_key(platform), risk_level or None, is_active), ())
+
+
+def render_fragment(name, template_name, catalog, filters, context, request=None):
+    """Render `template_name`, cached under the catalog version and `filters`, a tuple of values"""
+    # Filters come from the query string, so they are hashed into a key any cache backend accepts
+    digest = hashlib.sha1(repr(tuple(filters)).encode()).hexdigest()
+    key = f'{CACHE_PREFIX}:fragment:{name}:{catalog.version}:{digest}'
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, context, request)
+        cache.set(key, html, FRAGMENT_TTL)
+    return mark_safe(html)
@@ -0,0 +1,257 @@
+"""
+Price history
+
+Prices are kept as OHLC bars (PriceBar) per product at minute, hour and day
+resolution. The price feed records minute and day bars as ticks arrive;
+compact_bars() later rolls old minute bars up into hour bars and drops
+expired intraday data, so the table stays small while daily history is kept
+for good.
+
+Reads go through get_prices(), which pulls plain tuples with values_list()
+over the (product, resolution, ts) index and returns NumPy arrays, never
+model instances. Bar arithmetic is done in integer cents.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.batch import chunked
+from .models import InvestmentProduct, PriceBar
+
+RESOLUTION_SECONDS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+# Resolutions written straight from the price feed
+RECORDED_RESOLUTIONS = ('minute', 'day')
+
+DEFAULT_RETENTION = {'minute': 7, 'hour': 90}
+
+PriceSeries = namedtuple('PriceSeries', ['ts', 'values'])
+
+
+def _to_cents(value):
+    return int(value * 100)
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def bar_start(ts, resolution):
+    """Start of the bar containing `ts`, bars are aligned to UTC"""
+    seconds = RESOLUTION_SECONDS[resolution]
+    return datetime.fromtimestamp(int(ts.timestamp()) // seconds * seconds, tz=dt_timezone.utc)
+
+
+class BarBuilder:
+    """Accumulates price feed ticks into bars keyed by (symbol, resolution, start)"""
+
+    def __init__(self, resolutions=RECORDED_RESOLUTIONS):
+        self.resolutions = resolutions
+        self.bars = {}
+
+    def add(self, tick):
+        cents = _to_cents(tick.price)
+        for resolution in self.resolutions:
+            key = (tick.symbol, resolution, bar_start(tick.ts, resolution))
+            bar = self.bars.get(key)
+            if bar is None:
+                # open, high, low, close, ticks, first tick ts, last tick ts
+                self.bars[key] = [cents, cents, cents, cents, 1, tick.ts, tick.ts]
+                continue
+            if tick.ts < bar[5]:
+                bar[0], bar[5] = cents, tick.ts
+            if tick.ts >= bar[6]:
+                bar[3], bar[6] = cents, tick.ts
+            bar[1] = max(bar[1], cents)
+            bar[2] = min(bar[2], cents)
+            bar[4] += 1
+
+    def collect(self, ticks):
+        """Pass `ticks` through unchanged, adding every valid one to the bars"""
+        for tick in ticks:
+            if tick is not None:
+                self.add(tick)
+            yield tick
+
+    def save(self):
+        """Merge the bars into PriceBar, returns the number of bars written"""
+        symbols = {symbol for symbol, _, _ in self.bars}
+        products = dict(InvestmentProduct.objects.filter(symbol__in=symbols).values_list('symbol', 'id'))
+        by_resolution = {}
+        for (symbol, resolution, start), bar in self.bars.items():
+            if symbol in products:
+                by_resolution.setdefault(resolution, {})[(products[symbol], start)] = bar[:5]
+        return sum(merge_bars(resolution, bars) for resolution, bars in by_resolution.items())
+
+
+def merge_bars(resolution, bars, batch_size=500):
+    """
+    Upsert {(product_id, start): [open, high, low, close, ticks]} bars in
+    cents. A bar that already exists is extended: it keeps its open, takes
+    the new close and widens its high and low. Call inside a transaction.
+    """
+    written = 0
+    for keys in chunked(bars, batch_size):
+        existing = PriceBar.objects.select_for_update().filter(
+            resolution=resolution,
+            product_id__in={product_id for product_id, _ in keys},
+            ts__in={start for _, start in keys},
+        ).values_list('product_id', 'ts', 'open', 'high', 'low', 'ticks')
+        existing = {(product_id, ts): rest for product_id, ts, *rest in existing}
+
+        rows = []
+        for key in keys:
+            open_, high, low, close, ticks = bars[key]
+            if key in existing:
+                old_open, old_high, old_low, old_ticks = existing[key]
+                open_ = _to_cents(old_open)
+                high = max(high, _to_cents(old_high))
+                low = min(low, _to_cents(old_low))
+                ticks += old_ticks
+            rows.append(PriceBar(
+                product_id=key[0], resolution=resolution, ts=key[1],
+                open=_from_cents(open_), high=_from_cents(high), low=_from_cents(low), close=_from_cents(close),
+                ticks=ticks,
+            ))
+        PriceBar.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['product', 'resolution', 'ts'],
+            update_fields=['open', 'high', 'low', 'close', 'ticks'],
+        )
+        written += len(rows)
+    return written
+
+
+def get_prices(symbols, start, end, resolution='day', field='close'):
+    """
+    Bars of `symbols` with start <= ts < end as {symbol: PriceSeries}.
+
+    Each series holds a datetime64[s] array of bar start times and a float64
+    array of `field` values, oldest first. Symbols without bars get empty
+    arrays.
+    """
+    products = dict(InvestmentProduct.objects.filter(symbol__in=symbols).values_list('id', 'symbol'))
+    rows = (
+        PriceBar.objects.filter(product_id__in=list(products), resolution=resolution, ts__gte=start, ts__lt=end)
+        .order_by('product_id', 'ts')
+        .values_list('product_id', 'ts', field)
+    )
+    product_ids, stamps, values = [], [], []
+    for product_id, ts, value in rows.iterator(chunk_size=5000):
+        product_ids.append(product_id)
+        stamps.append(ts.timestamp())
+        values.append(value)
+    product_ids = np.array(product_ids, dtype=np.int64)
+    stamps = np.array(stamps, dtype=np.int64).astype('datetime64[s]')
+    values = np.array(values, dtype=np.float64)
+
+    series = {symbol: PriceSeries(stamps[:0], values[:0]) for symbol in symbols}
+    # Rows are sorted by product, so each product is one contiguous slice
+    bounds = np.flatnonzero(np.diff(product_ids)) + 1
+    for begin, stop in zip(np.r_[0, bounds], np.r_[bounds, len(product_ids)]):
+        if stop > begin:
+            series[products[int(product_ids[begin])]] = PriceSeries(stamps[begin:stop], values[begin:stop])
+    return series
+
+
+def price_matrix(symbols, start, end, resolution='day', field='close'):
+    """
+    Prices of `symbols` aligned on the union of their bar times.
+
+    Returns (datetime64 times, float array of shape (times, symbols)). Each
+    column carries its last known price forward and is NaN before its first
+    bar.
+    """
+    series = get_prices(symbols, start, end, resolution, field)
+    times = np.unique(np.concatenate([series[symbol].ts for symbol in symbols] or [np.array([], 'datetime64[s]')]))
+    matrix = np.full((len(times), len(symbols)), np.nan)
+    for column, symbol in enumerate(symbols):
+        ts, values = series[symbol]
+        if not len(ts):
+            continue
+        latest = np.searchsorted(ts, times, side='right') - 1
+        known = latest >= 0
+        matrix[known, column] = values[latest[known]]
+    return times, matrix
+
+
+def downsample(product_ids, stamps, opens, highs, lows, closes, ticks, seconds):
+    """
+    Roll bars sorted by (product, ts) up into `seconds`-long bars.
+
+    Takes and returns parallel NumPy arrays (epoch seconds and cents).
+    """
+    buckets = stamps // seconds * seconds
+    changed = (np.diff(product_ids) != 0) | (np.diff(buckets) != 0)
+    starts = np.r_[0, np.flatnonzero(changed) + 1]
+    ends = np.r_[starts[1:], len(stamps)]
+    return (
+        product_ids[starts],
+        buckets[starts],
+        opens[starts],
+        np.maximum.reduceat(highs, starts),
+        np.minimum.reduceat(lows, starts),
+        closes[ends - 1],
+        np.add.reduceat(ticks, starts),
+    )
+
+
+def _retention():
+    return {**DEFAULT_RETENTION, **getattr(settings, 'PRICE_HISTORY_RETENTION', {})}
+
+
+def compact_bars(now=None, batch_products=50):
+    """
+    Roll minute bars older than the minute retention up into hour bars and
+    delete them, then delete hour bars older than the hour retention.
+
+    Work is committed per batch of products, so an interrupted run simply
+    leaves the rest for the next one. Returns (minute bars rolled up, hour
+    bars written, hour bars deleted).
+    """
+    now = now or timezone.now()
+    retention = _retention()
+    # Cut on an hour boundary so no hour is ever split across two runs
+    minute_cutoff = bar_start(now - timedelta(days=retention['minute']), 'hour')
+    hour_cutoff = now - timedelta(days=retention['hour'])
+
+    old_minutes = PriceBar.objects.filter(resolution='minute', ts__lt=minute_cutoff)
+    product_ids = list(old_minutes.order_by().values_list('product_id', flat=True).distinct())
+    rolled = written = 0
+    for batch in chunked(product_ids, batch_products):
+        with transaction.atomic():
+            rows = list(
+                old_minutes.filter(product_id__in=batch)
+                .select_for_update()
+                .order_by('product_id', 'ts')
+                .values_list('product_id', 'ts', 'open', 'high', 'low', 'close', 'ticks')
+            )
+            if not rows:
+                continue
+            columns = [
+                np.array([row[0] for row in rows], dtype=np.int64),
+                np.array([int(row[1].timestamp()) for row in rows], dtype=np.int64),
+                *[np.array([_to_cents(row[i]) for row in rows], dtype=np.int64) for i in range(2, 6)],
+                np.array([row[6] for row in rows], dtype=np.int64),
+            ]
+            hours = downsample(*columns, seconds=RESOLUTION_SECONDS['hour'])
+            bars = {
+                (int(product_id), datetime.fromtimestamp(int(ts), tz=dt_timezone.utc)): [int(v) for v in rest]
+                for product_id, ts, *rest in zip(*hours)
+            }
+            written += merge_bars('hour', bars)
+            rolled += old_minutes.filter(product_id__in=batch).delete()[0]
+
+    expired, _ = PriceBar.objects.filter(resolution='hour', ts__lt=hour_cutoff).delete()
+    return rolled, written, expired
@@ -0,0 +1,172 @@
+"""
+Tax lots
+
+Every buy opens an InvestmentLot. A sale is matched against the holding's
+open lots according to the portfolio's cost_basis_method: the open lots of
+all holdings sold are read in one query, oldest first, into per-holding
+deques consumed from the left (FIFO) or the right (LIFO), and the shrunken
+lots are written back with a single bulk_update. Average cost prices the
+sale at the mean cost of all open lots and uses them up oldest first. Each
+sale records one RealizedGain.
+
+Holdings created outside the order path (seed data, the admin) have shares
+no lot covers; open_unlotted() gives those shares an opening lot before an
+order batch touches the holding.
+
+Profit and loss for any number of holdings is read with two grouped
+aggregates (open lots and realized gains), never per lot or per holding.
+"""
+
+from collections import deque, namedtuple
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Sum
+
+from .models import InvestmentLot, RealizedGain
+
+CENT = Decimal('0.01')
+LOT_VALUE = DecimalField(max_digits=18, decimal_places=6)
+
+LotPnL = namedtuple('LotPnL', ['open_quantity', 'cost_basis', 'market_value', 'unrealized', 'realized'])
+
+
+def lot_for(holding_id, transaction):
+    """Unsaved lot for a buy transaction"""
+    return InvestmentLot(
+        holding_id=holding_id, transaction=transaction, quantity=transaction.quantity,
+        remaining=transaction.quantity, price=transaction.price, acquired_at=transaction.transaction_date,
+    )
+
+
+def open_unlotted(holdings):
+    """
+    Create an opening lot for the shares of `holdings` (as stored) that no
+    open lot covers, priced so the holding's lots cost quantity x
+    purchase_price. Returns the lots created.
+    """
+    holdings = [holding for holding in holdings if holding.quantity > 0]
+    if not holdings:
+        return []
+    covered = {
+        holding_id: (shares, cost)
+        for holding_id, shares, cost in InvestmentLot.objects.filter(holding__in=holdings, remaining__gt=0)
+        .order_by()
+        .values_list('holding_id')
+        .annotate(shares=Sum('remaining'), cost=Sum(F('remaining') * F('price'), output_field=LOT_VALUE))
+    }
+    opening = []
+    for holding in holdings:
+        shares, cost = covered.get(holding.pk, (0, 0))
+        gap = holding.quantity - shares
+        if gap <= 0:
+            continue
+        price = ((holding.quantity * holding.purchase_price - cost) / gap).quantize(CENT)
+        opening.append(InvestmentLot(
+            holding=holding, quantity=gap, remaining=gap, price=price if price > 0 else holding.purchase_price,
+            # The holding's first shares, older than any lot a buy opened
+            acquired_at=holding.purchase_date,
+        ))
+    return InvestmentLot.objects.bulk_create(opening)
+
+
+def match_lots(lots, quantity, method):
+    """
+    Use `quantity` shares from `lots`, a list of [pk, remaining, price] oldest
+    first, in place. Returns the cost basis of the shares used; raises
+    ValueError if the lots hold fewer shares.
+    """
+    if method == 'average':
+        shares = sum(lot[1] for lot in lots)
+        cost = sum(lot[1] * lot[2] for lot in lots)
+        basis = cost * quantity / shares if shares else Decimal('0')
+        match_lots(lots, quantity, 'fifo')
+        return basis
+
+    queue = deque(lots)
+    take = queue.pop if method == 'lifo' else queue.popleft
+    basis, left = Decimal('0'), quantity
+    while left > 0:
+        if not queue:
+            raise ValueError(f'Open lots hold {quantity - left} shares, cannot sell {quantity}')
+        lot = take()
+        used = min(lot[1], left)
+        lot[1] -= used
+        left -= used
+        basis += used * lot[2]
+    return basis
+
+
+def sell_lots(sales):
+    """
+    Match sales against their holdings' open lots and record a RealizedGain
+    for each. `sales` is a list of (holding_id, sell transaction, method),
+    applied in order. Call inside a transaction.
+
+    Returns (RealizedGain list, {holding_id: cost per share of the lots left
+    open, or None}).
+    """
+    holding_ids = {holding_id for holding_id, _, _ in sales}
+    rows = (
+        InvestmentLot.objects.filter(holding_id__in=holding_ids, remaining__gt=0)
+        .select_for_update()
+        .order_by('holding_id', 'acquired_at', 'id')
+        .values_list('holding_id', 'pk', 'remaining', 'price')
+    )
+    lots, before = {holding_id: [] for holding_id in holding_ids}, {}
+    for holding_id, pk, remaining, price in rows:
+        lots[holding_id].append([pk, remaining, price])
+        before[pk] = remaining
+
+    gains = []
+    for holding_id, sale, method in sales:
+        basis = match_lots(lots[holding_id], sale.quantity, method).quantize(CENT)
+        gains.append(RealizedGain(
+            transaction=sale, holding_id=holding_id, method=method, quantity=sale.quantity,
+            cost_basis=basis, proceeds=sale.total_amount, gain=sale.total_amount - basis,
+        ))
+
+    InvestmentLot.objects.bulk_update(
+        [
+            InvestmentLot(pk=pk, remaining=remaining)
+            for held in lots.values() for pk, remaining, _ in held if remaining != before[pk]
+        ],
+        ['remaining'],
+        batch_size=500,
+    )
+    RealizedGain.objects.bulk_create(gains)
+
+    average_costs = {}
+    for holding_id, held in lots.items():
+        shares = sum(remaining for _, remaining, _ in held)
+        cost = sum(remaining * price for _, remaining, price in held)
+        average_costs[holding_id] = (cost / shares).quantize(CENT) if shares else None
+    return gains, average_costs
+
+
+def lot_pnl(holdings):
+    """{holding_id: LotPnL} for a queryset of holdings, from two grouped queries"""
+    open_lots = (
+        InvestmentLot.objects.filter(holding__in=holdings, remaining__gt=0)
+        .order_by()
+        .values_list('holding_id')
+        .annotate(
+            shares=Sum('remaining'),
+            cost=Sum(F('remaining') * F('price'), output_field=LOT_VALUE),
+            value=Sum(F('remaining') * F('holding__current_price'), output_field=LOT_VALUE),
+        )
+    )
+    realized = {
+        holding_id: Decimal(total).quantize(CENT)
+        for holding_id, total in RealizedGain.objects.filter(holding__in=holdings)
+        .order_by()
+        .values_list('holding_id')
+        .annotate(total=Sum('gain'))
+    }
+    zero = Decimal('0.00')
+    pnl = {}
+    for holding_id, shares, cost, value in open_lots:
+        cost, value = Decimal(cost).quantize(CENT), Decimal(value).quantize(CENT)
+        pnl[holding_id] = LotPnL(shares, cost, value, value - cost, realized.pop(holding_id, zero))
+    for holding_id, total in realized.items():
+        pnl[holding_id] = LotPnL(Decimal('0'), zero, zero, zero, total)
+    return pnl
@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.test.utils import override_settings
+
+from accounts.models import Account
+from investments.models import InvestmentOrder, InvestmentProduct, Portfolio
+from investments.orders import DEFAULT_BATCH_SIZE, execute_orders, place_order
+
+QUANTITY = Decimal('1')
+
+
+class Command(BaseCommand):
+    help = 'Measure order throughput with 1, 10 and 100 concurrent clients, executed inline and from the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100], help='Concurrent client counts')
+        parser.add_argument('--orders', type=int, default=20, help='Orders placed per client')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Executor batch size')
+        parser.add_argument('--product', help='Symbol to trade (defaults to the cheapest active product)')
+
+    def handle(self, *args, **options):
+        products = InvestmentProduct.objects.filter(is_active=True, current_price__gt=0)
+        if options['product']:
+            products = products.filter(symbol=options['product'])
+        product = products.order_by('current_price').first()
+        if product is None:
+            raise CommandError('No active product to trade')
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite serializes writers, so concurrent clients mostly wait on each other; '
+                'run against PostgreSQL or MySQL for meaningful numbers.'
+            ))
+
+        # Orders go to throwaway portfolios and accounts, removed again at the end
+        user = get_user_model().objects.create_user(username=f'order-benchmark-{uuid.uuid4().hex[:8]}')
+        try:
+            portfolios = self._portfolios(user, max(options['clients']), product, options['orders'])
+            for mode in ('inline', 'queued'):
+                for clients in options['clients']:
+                    with override_settings(INVESTMENT_ORDER_EXECUTION=mode):
+                        filled, errors, elapsed = self._run(
+                            portfolios[:clients], product, options['orders'], options['batch_size'], mode
+                        )
+                    self.stdout.write(
+                        f'{mode:>6} {clients:>4} clients: {filled} orders in {elapsed:.2f}s = '
+                        f'{filled / elapsed:,.0f} orders/s, {errors} errors'
+                    )
+        finally:
+            user.delete()
+
+    def _portfolios(self, user, count, product, orders):
+        # Enough for every client to fill all of its orders in every run
+        balance = (product.current_price * QUANTITY * orders * 10).quantize(Decimal('0.01'))
+        accounts = Account.objects.bulk_create([
+            Account(user=user, account_number=f'OB{uuid.uuid4().hex[:16].upper()}', balance=balance)
+            for _ in range(count)
+        ])
+        return Portfolio.objects.bulk_create([
+            Portfolio(user=user, account=account, name=f'Order benchmark {i}') for i, account in enumerate(accounts)
+        ])
+
+    def _run(self, portfolios, product, orders_per_client, batch_size, mode):
+        """Every client places buy orders on its own portfolio; in queued mode one executor drains them"""
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(portfolios) + 1)
+        placing = threading.Event()
+        placing.set()
+        placed_ids = []
+
+        def client(portfolio):
+            failed = 0
+            ids = []
+            barrier.wait()
+            try:
+                for _ in range(orders_per_client):
+                    try:
+                        ids.append(place_order(portfolio, product, 'buy', QUANTITY).pk)
+                    except DatabaseError:
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                errors.append(failed)
+                placed_ids.extend(ids)
+
+        def executor():
+            barrier.wait()
+            try:
+                while True:
+                    # Only stop on an empty batch read after the last client finished
+                    finished = not placing.is_set()
+                    try:
+                        report = execute_orders(batch_size=batch_size)
+                    except DatabaseError:
+                        continue
+                    if not (report.filled or report.rejected):
+                        if finished:
+                            break
+                        time.sleep(0.005)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client, args=(portfolio,)) for portfolio in portfolios]
+        drain = threading.Thread(target=executor if mode == 'queued' else barrier.wait)
+        for thread in threads + [drain]:
+            thread.start()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        placing.clear()
+        drain.join()
+        elapsed = time.perf_counter() - started
+
+        filled = InvestmentOrder.objects.filter(pk__in=placed_ids, status='filled').count()
+        return filled, sum(errors), elapsed
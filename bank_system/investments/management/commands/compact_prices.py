@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from investments.history import compact_bars
+
+
+class Command(BaseCommand):
+    help = 'Roll old minute price bars up into hour bars and drop expired intraday history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-products', type=int, default=50,
+                            help='Products compacted per transaction')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        rolled, written, expired = compact_bars(batch_products=options['batch_products'])
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled {rolled} minute bars into {written} hour bars, deleted {expired} expired hour bars '
+            f'in {elapsed:.2f}s'
+        ))
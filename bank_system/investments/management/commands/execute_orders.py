@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from investments.orders import DEFAULT_BATCH_SIZE, execute_orders
+
+
+class Command(BaseCommand):
+    help = 'Execute pending investment orders in micro-batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Orders per batch')
+        parser.add_argument('--watch', action='store_true', help='Keep polling for new orders')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        filled = rejected = batches = 0
+        started = time.perf_counter()
+        while True:
+            report = execute_orders(batch_size=options['batch_size'])
+            if report.filled or report.rejected:
+                filled += report.filled
+                rejected += report.rejected
+                batches += 1
+                if options['watch']:
+                    self.stdout.write(f'{report.filled} filled, {report.rejected} rejected')
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{filled} orders filled, {rejected} rejected in {batches} batches ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from investments.pricefeed import archive_files, feed_dir, ingest_files, pending_files
+
+
+class Command(BaseCommand):
+    help = 'Apply price ticks from the price feed drop folder to products, holdings and portfolios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Drop folder (defaults to PRICE_FEED_DIR)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products per bulk write')
+        parser.add_argument('--max-files', type=int, default=100, help='Files coalesced into one batch')
+        parser.add_argument('--watch', action='store_true', help='Keep polling the folder for new files')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or feed_dir()
+        ingested = False
+        while True:
+            paths = pending_files(directory)[:options['max_files']]
+            if paths:
+                report = ingest_files(paths, batch_size=options['batch_size'])
+                archive_files(paths, directory)
+                ingested = True
+                self.stdout.write(self.style.SUCCESS(
+                    f'{report.files} files, {report.ticks} ticks ({report.rejected} rejected) -> '
+                    f'{report.updated}/{report.symbols} prices changed, {report.unknown} unknown symbols, '
+                    f'{report.portfolios} portfolios revalued, {report.bars} bars written in {report.seconds:.2f}s '
+                    f'({report.ticks_per_second:,.0f} ticks/s, lag max {report.max_lag:.1f}s avg {report.mean_lag:.1f}s)'
+                ))
+                # Drain a backlog without waiting
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+        if not ingested and not options['watch']:
+            self.stdout.write('No price files waiting')
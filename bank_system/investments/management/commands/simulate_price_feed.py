@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+import random
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from investments.models import InvestmentProduct
+from investments.pricefeed import feed_dir
+
+
+class Command(BaseCommand):
+    help = 'Write random-walk price ticks for active products into the price feed drop folder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Drop folder (defaults to PRICE_FEED_DIR)')
+        parser.add_argument('--ticks', type=int, default=10000)
+        parser.add_argument('--files', type=int, default=10)
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--days', type=float, default=0,
+                            help='Spread the ticks evenly over the last N days to build price history')
+
+    def handle(self, *args, **options):
+        prices = dict(InvestmentProduct.objects.filter(is_active=True).values_list('symbol', 'current_price'))
+        if not prices:
+            raise CommandError('No active investment products to quote')
+        directory = Path(options['dir'] or feed_dir())
+        directory.mkdir(parents=True, exist_ok=True)
+
+        symbols = list(prices)
+        per_file = max(1, options['ticks'] // options['files'])
+        now = timezone.now()
+        stamp = now.strftime('%Y%m%dT%H%M%S%f')
+        span = timedelta(days=options['days'])
+        total = per_file * options['files']
+        for index in range(options['files']):
+            final = directory / f'ticks_{stamp}_{index:04d}.{options["format"]}'
+            partial = final.with_suffix('.part')
+            with open(partial, 'w', newline='') as feed:
+                if options['format'] == 'csv':
+                    writer = csv.writer(feed)
+                    writer.writerow(['symbol', 'price', 'ts'])
+                for offset in range(per_file):
+                    symbol = random.choice(symbols)
+                    step = Decimal(str(round(random.gauss(0, 0.002), 5)))
+                    prices[symbol] = max(Decimal('0.01'), (prices[symbol] * (1 + step)).quantize(Decimal('0.01')))
+                    if span:
+                        ts = (now - span * (1 - (index * per_file + offset + 1) / total)).isoformat()
+                    else:
+                        ts = timezone.now().isoformat()
+                    if options['format'] == 'csv':
+                        writer.writerow([symbol, prices[symbol], ts])
+                    else:
+                        feed.write(json.dumps({'symbol': symbol, 'price': str(prices[symbol]), 'ts': ts}) + '\n')
+            # Rename into place so the ingester never sees a half-written file
+            os.replace(partial, final)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {per_file * options["files"]} ticks for {len(symbols)} symbols to {directory}'
+        ))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("investments", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceBar",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("minute", "1 Minute"),
+                            ("hour", "1 Hour"),
+                            ("day", "1 Day"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "ts",
+                    models.DateTimeField(help_text="Start of the bar interval (UTC)"),
+                ),
+                ("open", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("high", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("low", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("close", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("ticks", models.PositiveIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_bars",
+                        to="investments.investmentproduct",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["product", "resolution", "ts"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("product", "resolution", "ts"), name="unique_price_bar")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_lots_for_holdings(apps, schema_editor):
+    """Existing holdings only know their average price, so each becomes a single lot"""
+    InvestmentHolding = apps.get_model("investments", "InvestmentHolding")
+    InvestmentLot = apps.get_model("investments", "InvestmentLot")
+    holdings = InvestmentHolding.objects.filter(quantity__gt=0).values_list(
+        "pk", "quantity", "purchase_price", "purchase_date"
+    )
+    InvestmentLot.objects.bulk_create(
+        (
+            InvestmentLot(holding_id=pk, quantity=quantity, remaining=quantity, price=price, acquired_at=purchase_date)
+            for pk, quantity, price, purchase_date in holdings.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("investments", "0002_price_bars"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="portfolio",
+            name="cost_basis_method",
+            field=models.CharField(
+                choices=[
+                    ("fifo", "First In, First Out"),
+                    ("lifo", "Last In, First Out"),
+                    ("average", "Average Cost"),
+                ],
+                default="fifo",
+                help_text="Which lots a sale is matched against",
+                max_length=10,
+            ),
+        ),
+        migrations.CreateModel(
+            name="RealizedGain",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        choices=[
+                            ("fifo", "First In, First Out"),
+                            ("lifo", "Last In, First Out"),
+                            ("average", "Average Cost"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("quantity", models.DecimalField(decimal_places=4, max_digits=12)),
+                ("cost_basis", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("proceeds", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("gain", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("realized_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "holding",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="realized_gains",
+                        to="investments.investmentholding",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="realized_gain",
+                        to="investments.investmenttransaction",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-realized_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="InvestmentLot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.DecimalField(decimal_places=4, max_digits=12)),
+                ("remaining", models.DecimalField(decimal_places=4, max_digits=12)),
+                (
+                    "price",
+                    models.DecimalField(decimal_places=2, help_text="Cost per share", max_digits=12),
+                ),
+                (
+                    "acquired_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "holding",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lots",
+                        to="investments.investmentholding",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="lot",
+                        to="investments.investmenttransaction",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["acquired_at", "id"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("remaining__gt", 0)),
+                        fields=["holding", "acquired_at", "id"],
+                        name="investment_lot_open_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(open_lots_for_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("investments", "0004_investment_orders"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TargetAllocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weight",
+                    models.DecimalField(
+                        decimal_places=2,
+                        help_text="Percent of the portfolio value",
+                        max_digits=5,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="targets",
+                        to="investments.portfolio",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="targets",
+                        to="investments.investmentproduct",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["portfolio", "-weight"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("portfolio", "product"), name="unique_target_allocation")
+                ],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F, Sum
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from decimal import Decimal
@@ -69,6 +70,11 @@ class Portfolio(models.Model):
         ('inactive', 'Inactive'),
         ('closed', 'Closed'),
     )
+    COST_BASIS_METHODS = (
+        ('fifo', 'First In, First Out'),
+        ('lifo', 'Last In, First Out'),
+        ('average', 'Average Cost'),
+    )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolios')
     account = models.ForeignKey('accounts.Account', on_delete=models.CASCADE, related_name='portfolios')
@@ -78,6 +84,8 @@ class Portfolio(models.Model):
     current_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_return = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    cost_basis_method = models.CharField(max_length=10, choices=COST_BASIS_METHODS, default='fifo',
+                                         help_text="Which lots a sale is matched against")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -100,10 +108,11 @@ class Portfolio(models.Model):
         return self.current_value - self.total_invested
 
     def update_portfolio_value(self):
-        """Recalculate portfolio value based on holdings"""
-        holdings = self.holdings.filter(status='active')
-        total_value = sum(holding.current_value for holding in holdings)
-        self.current_value = total_value
+        """Recalculate portfolio value from its holdings with a single aggregate query"""
+        total_value = self.holdings.filter(status__in=InvestmentHolding.HELD_STATUSES).aggregate(
+            total=Sum(F('quantity') * F('current_price'), output_field=models.DecimalField(max_digits=16, decimal_places=6))
+        )['total']
+        self.current_value = Decimal(total_value or 0).quantize(Decimal('0.01'))
         self.total_return = self.profit_loss
         self.save()
 
@@ -115,6 +124,8 @@ class InvestmentHolding(models.Model):
         ('sold', 'Sold'),
         ('partial_sold', 'Partially Sold'),
     )
+    # Statuses that still have shares and count towards the portfolio value
+    HELD_STATUSES = ('active', 'partial_sold')
 
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='holdings')
     product = models.ForeignKey(InvestmentProduct, on_delete=models.PROTECT, related_name='holdings')
@@ -183,3 +194,125 @@ class InvestmentTransaction(models.Model):
         if not self.total_amount:
             self.total_amount = self.quantity * self.price
         super().save(*args, **kwargs)
+
+
+class PriceBar(models.Model):
+    """Open/high/low/close prices of a product over one bar interval"""
+    RESOLUTIONS = (
+        ('minute', '1 Minute'),
+        ('hour', '1 Hour'),
+        ('day', '1 Day'),
+    )
+
+    product = models.ForeignKey(InvestmentProduct, on_delete=models.CASCADE, related_name='price_bars')
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    ts = models.DateTimeField(help_text="Start of the bar interval (UTC)")
+    open = models.DecimalField(max_digits=12, decimal_places=2)
+    high = models.DecimalField(max_digits=12, decimal_places=2)
+    low = models.DecimalField(max_digits=12, decimal_places=2)
+    close = models.DecimalField(max_digits=12, decimal_places=2)
+    ticks = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product_id} {self.resolution} {self.ts:%Y-%m-%d %H:%M} {self.close}"
+
+    class Meta:
+        ordering = ['product', 'resolution', 'ts']
+        constraints = [
+            # Also the index every range read uses: product, resolution, then time
+            models.UniqueConstraint(fields=['product', 'resolution', 'ts'], name='unique_price_bar'),
+        ]
+
+
+class InvestmentLot(models.Model):
+    """Shares bought in one purchase, kept until sales use them up"""
+    holding = models.ForeignKey(InvestmentHolding, on_delete=models.CASCADE, related_name='lots')
+    transaction = models.OneToOneField(InvestmentTransaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='lot')
+    quantity = models.DecimalField(max_digits=12, decimal_places=4)
+    remaining = models.DecimalField(max_digits=12, decimal_places=4)
+    price = models.DecimalField(max_digits=12, decimal_places=2, help_text="Cost per share")
+    acquired_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.remaining}/{self.quantity} @ ${self.price} - holding {self.holding_id}"
+
+    class Meta:
+        ordering = ['acquired_at', 'id']
+        indexes = [
+            models.Index(fields=['holding', 'acquired_at', 'id'], condition=models.Q(remaining__gt=0),
+                         name='investment_lot_open_idx'),
+        ]
+
+
+class RealizedGain(models.Model):
+    """Gain or loss realized by one sale, against the cost of the lots it used"""
+    transaction = models.OneToOneField(InvestmentTransaction, on_delete=models.CASCADE, related_name='realized_gain')
+    holding = models.ForeignKey(InvestmentHolding, on_delete=models.CASCADE, related_name='realized_gains')
+    method = models.CharField(max_length=10, choices=Portfolio.COST_BASIS_METHODS)
+    quantity = models.DecimalField(max_digits=12, decimal_places=4)
+    cost_basis = models.DecimalField(max_digits=14, decimal_places=2)
+    proceeds = models.DecimalField(max_digits=14, decimal_places=2)
+    gain = models.DecimalField(max_digits=14, decimal_places=2)
+    realized_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.gain} on {self.quantity} - holding {self.holding_id}"
+
+    class Meta:
+        ordering = ['-realized_at']
+
+
+class InvestmentOrder(models.Model):
+    """A buy or sell request waiting for, or recording, its execution"""
+    SIDES = (
+        ('buy', 'Buy'),
+        ('sell', 'Sell'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('filled', 'Filled'),
+        ('rejected', 'Rejected'),
+    )
+
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='orders')
+    product = models.ForeignKey(InvestmentProduct, on_delete=models.PROTECT, related_name='orders')
+    holding = models.ForeignKey(InvestmentHolding, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='orders', help_text="Holding to sell from")
+    side = models.CharField(max_length=4, choices=SIDES)
+    quantity = models.DecimalField(max_digits=12, decimal_places=4)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Fill price")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    reject_reason = models.CharField(max_length=200, blank=True)
+    transaction = models.OneToOneField(InvestmentTransaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='order')
+    created_at = models.DateTimeField(auto_now_add=True)
+    executed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.side.upper()} {self.quantity} x {self.product_id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The executor's queue: pending orders, oldest first
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='investment_order_pending_idx'),
+        ]
+
+
+class TargetAllocation(models.Model):
+    """Weight a portfolio aims to hold of a product, rebalanced towards by investments.rebalance"""
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='targets')
+    product = models.ForeignKey(InvestmentProduct, on_delete=models.PROTECT, related_name='targets')
+    weight = models.DecimalField(max_digits=5, decimal_places=2, help_text="Percent of the portfolio value")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id} {self.weight}% - portfolio {self.portfolio_id}"
+
+    class Meta:
+        ordering = ['portfolio', '-weight']
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'product'], name='unique_target_allocation'),
+        ]
@@ -0,0 +1,224 @@
+"""
+Investment orders
+
+Buys and sells are placed as InvestmentOrder rows and executed in
+micro-batches by execute_orders(). A batch is validated in memory against
+locked account balances and holdings, in order, then written with a fixed
+number of statements however many orders it holds:
+
+* one balance update per account, for the net amount of its orders
+* bulk_create / bulk_update for holdings, lots, realized gains, investment
+  and account transactions and the orders themselves
+* one UPDATE for total_invested and one revaluation of the touched portfolios
+
+With INVESTMENT_ORDER_EXECUTION = 'inline' the views execute the order they
+placed straight away; with 'queued' they only place it and the
+execute_orders command drains the queue.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from accounts.balances import credit, debit, shard_total
+from accounts.models import Account
+from transactions.models import Transaction
+from .lots import lot_for, open_unlotted, sell_lots
+from .models import InvestmentHolding, InvestmentOrder, InvestmentTransaction, Portfolio, InvestmentLot
+from .valuation import revalue_portfolios
+
+DEFAULT_BATCH_SIZE = 500
+CENT = Decimal('0.01')
+
+ExecutionReport = namedtuple('ExecutionReport', ['filled', 'rejected'])
+
+
+def execution_mode():
+    return getattr(settings, 'INVESTMENT_ORDER_EXECUTION', 'inline')
+
+
+def place_order(portfolio, product, side, quantity, holding=None):
+    """Place an order, executed straight away in inline mode; if execution fails the order is not kept"""
+    with transaction.atomic():
+        order = InvestmentOrder.objects.create(
+            portfolio=portfolio, product=product, holding=holding, side=side, quantity=quantity,
+        )
+        if execution_mode() == 'inline':
+            execute_orders(order_ids=[order.pk])
+            order.refresh_from_db()
+    return order
+
+
+def _pending(batch_size, order_ids):
+    orders = InvestmentOrder.objects.filter(status='pending')
+    if order_ids is not None:
+        orders = orders.filter(pk__in=order_ids)
+    if connection.features.has_select_for_update_skip_locked:
+        # Concurrent executors take disjoint batches instead of waiting on each other
+        orders = orders.select_for_update(skip_locked=True, of=('self',))
+    else:
+        orders = orders.select_for_update(of=('self',))
+    return list(orders.select_related('portfolio', 'product').order_by('pk')[:batch_size])
+
+
+def _reject(order, reason):
+    order.status = 'rejected'
+    order.reject_reason = reason
+
+
+@transaction.atomic
+def execute_orders(batch_size=DEFAULT_BATCH_SIZE, order_ids=None):
+    """Execute up to `batch_size` pending orders (or just `order_ids`), returns an ExecutionReport"""
+    orders = _pending(batch_size, order_ids)
+    if not orders:
+        return ExecutionReport(0, 0)
+    now = timezone.now()
+
+    accounts = Account.objects.select_for_update().in_bulk({order.portfolio.account_id for order in orders})
+    available = {
+        pk: shard_total(account) if account.is_hot else account.balance for pk, account in accounts.items()
+    }
+    sold_ids = {order.holding_id for order in orders if order.side == 'sell'}
+    sold = InvestmentHolding.objects.select_for_update().in_bulk(sold_ids)
+    # Buys add to the portfolio's active holding of the product, as buying always has
+    bought = {}
+    for holding in InvestmentHolding.objects.select_for_update().filter(
+        portfolio_id__in={order.portfolio_id for order in orders if order.side == 'buy'},
+        product_id__in={order.product_id for order in orders if order.side == 'buy'},
+        status='active',
+    ).order_by('-pk'):
+        # One object per row, so a holding both sold from and bought into is written once
+        bought[(holding.portfolio_id, holding.product_id)] = sold.get(holding.pk, holding)
+    open_unlotted({holding.pk: holding for holding in [*sold.values(), *bought.values()]}.values())
+
+    # Validate in order, as if the orders had run one at a time
+    filled, new_holdings = [], []
+    for order in orders:
+        holding = sold.get(order.holding_id) if order.side == 'sell' else None
+        # Sales go at the holding's price, as selling always has
+        price = holding.current_price if holding else order.product.current_price
+        total = (order.quantity * price).quantize(CENT)
+        account_id = order.portfolio.account_id
+        if order.quantity <= 0:
+            _reject(order, 'Quantity must be greater than 0')
+        elif order.side == 'buy' and not order.product.is_active:
+            _reject(order, f'{order.product.symbol} is not available')
+        elif order.side == 'buy' and available[account_id] < total:
+            _reject(order, f'Insufficient balance. Need {total}, but only have {available[account_id]}')
+        elif order.side == 'sell' and (holding is None or holding.portfolio_id != order.portfolio_id):
+            _reject(order, 'Holding not found')
+        elif order.side == 'sell' and order.quantity > holding.quantity:
+            _reject(order, f'Cannot sell more than you own. You have {holding.quantity}')
+        else:
+            order.status, order.price, order.total_amount, order.executed_at = 'filled', price, total, now
+            if order.side == 'buy':
+                available[account_id] -= total
+                key = (order.portfolio_id, order.product_id)
+                holding = bought.get(key)
+                # A holding sold from earlier in the batch is no longer active, so the buy opens a new one
+                if holding is None or holding.status != 'active':
+                    holding = bought[key] = InvestmentHolding(
+                        portfolio_id=order.portfolio_id, product_id=order.product_id, quantity=0,
+                        purchase_price=price, current_price=price, status='active',
+                    )
+                    new_holdings.append(holding)
+                order.holding = holding
+            else:
+                holding.quantity -= order.quantity
+                holding.status = 'sold' if holding.quantity == 0 else 'partial_sold'
+                available[account_id] += total
+            filled.append(order)
+        if order.status == 'rejected':
+            order.executed_at = now
+
+    _settle_accounts(filled, accounts)
+    _write_fills(filled, new_holdings, sold, now)
+    InvestmentOrder.objects.bulk_update(
+        orders, ['status', 'price', 'total_amount', 'reject_reason', 'transaction', 'executed_at'], batch_size=500
+    )
+    return ExecutionReport(len(filled), len(orders) - len(filled))
+
+
+def _settle_accounts(filled, accounts):
+    """One balance update per account for the net of its filled orders"""
+    net = {}
+    for order in filled:
+        amount = order.total_amount if order.side == 'sell' else -order.total_amount
+        net[order.portfolio.account_id] = net.get(order.portfolio.account_id, Decimal('0')) + amount
+    for account_id, amount in net.items():
+        if amount > 0:
+            credit(accounts[account_id], amount)
+        elif amount < 0 and not debit(accounts[account_id], -amount):
+            # Only a hot account's shards can fall short after validation, which would leave money unaccounted for
+            raise RuntimeError(f'Account {account_id} could not cover {-amount} after validation')
+
+
+def _write_fills(filled, new_holdings, sold, now):
+    if not filled:
+        return
+    InvestmentHolding.objects.bulk_create(new_holdings)
+    changed = {}
+    for order in filled:
+        holding = order.holding if order.side == 'buy' else sold[order.holding_id]
+        if order.side == 'buy':
+            # Re-assign so holding_id picks up the key of a holding created above
+            order.holding = holding
+            cost = holding.quantity * holding.purchase_price + order.quantity * order.price
+            holding.quantity += order.quantity
+            holding.purchase_price = (cost / holding.quantity).quantize(CENT)
+        holding.current_price = order.price
+        changed[holding.pk] = holding
+
+    trades = InvestmentTransaction.objects.bulk_create([
+        InvestmentTransaction(
+            portfolio_id=order.portfolio_id, product_id=order.product_id, holding_id=order.holding_id,
+            transaction_type=order.side, quantity=order.quantity, price=order.price,
+            total_amount=order.total_amount, transaction_date=now,
+        )
+        for order in filled
+    ])
+    for order, trade in zip(filled, trades):
+        order.transaction = trade
+
+    InvestmentLot.objects.bulk_create([
+        lot_for(order.holding_id, order.transaction) for order in filled if order.side == 'buy'
+    ])
+    sales = [order for order in filled if order.side == 'sell']
+    if sales:
+        _, average_costs = sell_lots([
+            (order.holding_id, order.transaction, order.portfolio.cost_basis_method) for order in sales
+        ])
+        for holding_id, average in average_costs.items():
+            if average is not None:
+                sold[holding_id].purchase_price = average
+    InvestmentHolding.objects.bulk_update(
+        list(changed.values()),
+        ['quantity', 'purchase_price', 'current_price', 'status'],
+        batch_size=500,
+    )
+
+    Transaction.objects.bulk_create([
+        Transaction(from_account_id=order.portfolio.account_id, transaction_type='withdrawal',
+                    amount=order.total_amount,
+                    description=f'Investment: Buy {order.quantity} x {order.product.symbol}')
+        if order.side == 'buy' else
+        Transaction(to_account_id=order.portfolio.account_id, transaction_type='deposit',
+                    amount=order.total_amount,
+                    description=f'Investment Sale: {order.quantity} x {order.product.symbol}')
+        for order in filled
+    ])
+
+    invested = {}
+    for order in filled:
+        if order.side == 'buy':
+            invested[order.portfolio_id] = invested.get(order.portfolio_id, Decimal('0')) + order.total_amount
+    if invested:
+        Portfolio.objects.filter(pk__in=invested).update(total_invested=F('total_invested') + Case(
+            *[When(pk=pk, then=Value(amount)) for pk, amount in invested.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+    revalue_portfolios(Portfolio.objects.filter(pk__in={order.portfolio_id for order in filled}))
@@ -0,0 +1,194 @@
+"""
+Portfolio performance analytics
+
+A portfolio's InvestmentTransaction history is replayed over a calendar-day
+grid: signed trade quantities accumulate into a dates x products holdings
+matrix, which is multiplied by the daily closes from investments.history to
+give the portfolio value on every day. Buys, sells and dividends are the
+cash flows. Daily returns treat buys as arriving at the start of the day and
+sells and dividends at its end:
+
+    r[d] = (value[d] + sells[d] + dividends[d]) / (value[d - 1] + buys[d]) - 1
+
+Chaining them gives the time-weighted return; the money-weighted return is
+the internal rate of return of the cash flows plus today's value, annualized
+once the history covers a year.
+Drawdown, volatility and the Sharpe ratio come from the same daily returns.
+
+Results are cached per portfolio per day under the count and newest id of
+its transactions, read in one aggregate query, so a trade added or deleted
+by any process is seen on the next request. Editing a trade in place drops
+the result through the post_save signal.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .history import get_prices
+from .models import InvestmentTransaction
+
+CACHE_PREFIX = 'portfolio_performance:2'
+DAYS_PER_YEAR = 365
+DEFAULT_RISK_FREE_RATE = 0.0
+# Newton iterations allowed for the money-weighted return
+MAX_IRR_ITERATIONS = 50
+
+
+def _key(portfolio_id, day):
+    stamp = InvestmentTransaction.objects.filter(portfolio_id=portfolio_id).aggregate(
+        trades=Count('pk'), newest=Max('pk'),
+    )
+    return f'{CACHE_PREFIX}:{portfolio_id}:{day.isoformat()}:{stamp["trades"]}:{stamp["newest"]}'
+
+
+def _seconds_to_midnight():
+    now = timezone.localtime()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def invalidate(portfolio_id):
+    cache.delete(_key(portfolio_id, timezone.localdate()))
+
+
+def daily_irr(flows, days):
+    """
+    Daily internal rate of return of investor cash flows (negative when
+    invested) made `days` days after the first, or None if it does not
+    converge. Solving per day keeps Newton's method stable for short
+    histories whose annual rate would be enormous.
+    """
+    flows = np.asarray(flows, dtype=np.float64)
+    days = np.asarray(days, dtype=np.float64)
+    if not (flows > 0).any() or not (flows < 0).any():
+        return None
+    rate = 0.0
+    for _ in range(MAX_IRR_ITERATIONS):
+        discount = (1 + rate) ** -days
+        npv = (flows * discount).sum()
+        slope = (-days * flows * discount / (1 + rate)).sum()
+        if slope == 0:
+            return None
+        step = npv / slope
+        # Keep the rate above -100%, where the discount factors stop making sense
+        rate = max(rate - step, (rate - 1) / 2)
+        if abs(step) < 1e-12:
+            return float(rate)
+    return None
+
+
+def compute_performance(trade_days, columns, kinds, quantities, amounts, prices, risk_free_rate=0.0):
+    """
+    Performance figures from trades and a days x products price matrix.
+
+    Trades are parallel arrays: day index into the price matrix, product
+    column, kind ('buy', 'sell' or 'dividend'), quantity and cash amount.
+    Returns a dict of floats with returns, drawdown and volatility in percent.
+    """
+    days, products = prices.shape
+    trade_days = np.asarray(trade_days, dtype=np.int64)
+    kinds = np.asarray(kinds)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    buy, sell, dividend = kinds == 'buy', kinds == 'sell', kinds == 'dividend'
+
+    signed = np.where(buy, quantities, np.where(sell, -np.asarray(quantities, dtype=np.float64), 0.0))
+    holdings = np.zeros((days, products))
+    np.add.at(holdings, (trade_days, np.asarray(columns, dtype=np.int64)), signed)
+    holdings = np.cumsum(holdings, axis=0)
+    values = (holdings * prices).sum(axis=1)
+
+    buys = np.bincount(trade_days[buy], weights=amounts[buy], minlength=days)
+    sells = np.bincount(trade_days[sell], weights=amounts[sell], minlength=days)
+    dividends = np.bincount(trade_days[dividend], weights=amounts[dividend], minlength=days)
+
+    base = np.r_[0.0, values[:-1]] + buys
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(base > 0, (values + sells + dividends) / base - 1, 0.0)
+    wealth = np.cumprod(1 + returns)
+    drawdowns = wealth / np.maximum.accumulate(wealth) - 1
+
+    twr = wealth[-1] - 1
+    volatility = returns.std(ddof=1) * np.sqrt(DAYS_PER_YEAR) if days > 1 else 0.0
+    excess = returns.mean() * DAYS_PER_YEAR - risk_free_rate
+    flow_days = np.flatnonzero(buys + sells + dividends)
+    irr = daily_irr(np.r_[(sells + dividends - buys)[flow_days], values[-1]], np.r_[flow_days, days - 1])
+    # Rates are only annualized over at least a year, shorter histories report the period's return
+    span = max(days - 1, 1)
+    mwr = None if irr is None else (1 + irr) ** min(span, DAYS_PER_YEAR) - 1
+    annualized = (1 + twr) ** (DAYS_PER_YEAR / span) - 1 if span >= DAYS_PER_YEAR and twr > -1 else None
+    return {
+        'days': int(days),
+        'current_value': float(values[-1]),
+        'time_weighted_return': float(twr * 100),
+        'annualized_return': float(annualized * 100) if annualized is not None else None,
+        'money_weighted_return': mwr * 100 if mwr is not None else None,
+        'max_drawdown': float(drawdowns.min() * 100),
+        'volatility': float(volatility * 100),
+        'sharpe_ratio': float(excess / volatility) if volatility > 0 else None,
+    }
+
+
+def _price_grid(symbols, first_day, today, fallback):
+    """Daily closes of `symbols` on every day from first_day to today, carried forward over gaps"""
+    grid = np.arange(np.datetime64(first_day, 'D'), np.datetime64(today, 'D') + 1)
+    start = datetime.combine(first_day, datetime.min.time(), tzinfo=dt_timezone.utc)
+    end = datetime.combine(today + timedelta(days=1), datetime.min.time(), tzinfo=dt_timezone.utc)
+    series = get_prices(symbols, start, end)
+
+    prices = np.empty((len(grid), len(symbols)))
+    for column, symbol in enumerate(symbols):
+        ts, values = series[symbol]
+        latest = np.searchsorted(ts.astype('datetime64[D]'), grid, side='right') - 1
+        # Days before the first bar are priced at the first trade
+        prices[:, column] = np.where(latest >= 0, values[np.maximum(latest, 0)] if len(ts) else 0, fallback[column])
+    return prices
+
+
+def portfolio_performance(portfolio_id, today=None):
+    """Performance figures of a portfolio as of today, or None if it has no trades"""
+    today = today or timezone.localdate()
+    key = _key(portfolio_id, today)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+
+    trades = list(
+        InvestmentTransaction.objects.filter(portfolio_id=portfolio_id, transaction_date__date__lte=today)
+        .order_by('transaction_date')
+        .values_list('product__symbol', 'product__current_price', 'transaction_type', 'quantity', 'price',
+                     'total_amount', 'transaction_date')
+    )
+    if not trades:
+        cache.set(key, {}, _seconds_to_midnight())
+        return None
+
+    products, current, fallback = {}, [], []
+    for symbol, current_price, _, _, price, _, _ in trades:
+        if symbol not in products:
+            products[symbol] = len(products)
+            current.append(float(current_price))
+            fallback.append(float(price))
+
+    # Price bars are aligned to UTC days, so trades are placed on their UTC date too
+    trade_dates = [trade[6].astimezone(dt_timezone.utc).date() for trade in trades]
+    first_day = min(trade_dates)
+    prices = _price_grid(list(products), first_day, max(today, max(trade_dates)), fallback)
+    # The last day is valued at the live price, as Portfolio.current_value is
+    prices[-1] = current
+
+    result = compute_performance(
+        trade_days=[(day - first_day).days for day in trade_dates],
+        columns=[products[trade[0]] for trade in trades],
+        kinds=[trade[2] for trade in trades],
+        quantities=np.array([trade[3] for trade in trades], dtype=np.float64),
+        amounts=[trade[5] for trade in trades],
+        prices=prices,
+        risk_free_rate=getattr(settings, 'RISK_FREE_RATE', DEFAULT_RISK_FREE_RATE) / 100,
+    )
+    cache.set(key, result, _seconds_to_midnight())
+    return result
@@ -0,0 +1,183 @@
+"""
+Market price ingestion
+
+Price ticks arrive as files in a drop folder (PRICE_FEED_DIR), either CSV
+with a ``symbol,price,ts`` header or JSON Lines with the same keys. Writers
+should create files under a temporary name and rename them into place once
+complete; only ``*.csv`` and ``*.jsonl`` files are picked up.
+
+A batch of files is read in one pass and coalesced to the latest tick per
+symbol, so a burst of ticks for one symbol costs a single write. Prices are
+written with bulk_update and pushed to holdings and portfolio values with
+the set-based statements in investments.valuation. Every tick also lands in
+the minute and day price bars kept by investments.history.
+"""
+
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.batch import chunked
+from .history import BarBuilder
+from .models import InvestmentProduct
+from .valuation import reprice_products
+
+FEED_SUFFIXES = ('.csv', '.jsonl')
+MAX_PRICE = Decimal('9999999999.99')
+
+Tick = namedtuple('Tick', ['symbol', 'price', 'ts'])
+
+
+class IngestReport(namedtuple('IngestReport', [
+    'files', 'ticks', 'rejected', 'symbols', 'updated', 'unknown', 'portfolios', 'bars', 'max_lag', 'mean_lag', 'seconds',
+])):
+    """Outcome of one ingestion batch; lags are seconds from tick timestamp to price written"""
+    __slots__ = ()
+
+    @property
+    def ticks_per_second(self):
+        return self.ticks / self.seconds if self.seconds else 0.0
+
+
+def feed_dir():
+    return Path(getattr(settings, 'PRICE_FEED_DIR', settings.BASE_DIR / 'price_feed'))
+
+
+def pending_files(directory):
+    """Complete feed files waiting in `directory`, oldest name first"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.iterdir() if path.is_file() and path.suffix in FEED_SUFFIXES)
+
+
+def _parse_tick(symbol, price, ts, default_ts):
+    """Build a Tick from raw values, or None if the tick is malformed"""
+    try:
+        price = Decimal(str(price)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        return None
+    if not symbol or not price.is_finite() or price <= 0 or price > MAX_PRICE:
+        return None
+    try:
+        stamp = parse_datetime(ts) if ts else default_ts
+    except (ValueError, TypeError):
+        # Well formed but impossible (2024-02-30), or not a string at all
+        return None
+    if stamp is None:
+        return None
+    if timezone.is_naive(stamp):
+        stamp = timezone.make_aware(stamp, dt_timezone.utc)
+    return Tick(str(symbol).strip(), price, stamp)
+
+
+def read_ticks(path):
+    """Yield (Tick or None for a rejected line) for every record in a feed file"""
+    path = Path(path)
+    # Ticks without a timestamp are taken to be as old as the file
+    default_ts = datetime.fromtimestamp(path.stat().st_mtime, tz=dt_timezone.utc)
+    # Undecodable bytes end up in a malformed tick rather than stopping the batch
+    with open(path, newline='', errors='replace') as feed:
+        if path.suffix == '.csv':
+            for row in csv.DictReader(feed):
+                yield _parse_tick(row.get('symbol'), row.get('price'), row.get('ts'), default_ts)
+        else:
+            for line in feed:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                if not isinstance(record, dict):
+                    yield None
+                    continue
+                yield _parse_tick(record.get('symbol'), record.get('price'), record.get('ts'), default_ts)
+
+
+def coalesce(ticks):
+    """Keep only the newest tick per symbol, returns ({symbol: Tick}, ticks read, ticks rejected)"""
+    latest, read, rejected = {}, 0, 0
+    for tick in ticks:
+        read += 1
+        if tick is None:
+            rejected += 1
+            continue
+        current = latest.get(tick.symbol)
+        if current is None or tick.ts >= current.ts:
+            latest[tick.symbol] = tick
+    return latest, read, rejected
+
+
+def apply_prices(latest, batch_size=500):
+    """
+    Write the coalesced prices, returns (ids of products whose price changed,
+    number of unknown symbols).
+    """
+    changed, found = [], 0
+    now = timezone.now()
+    for symbols in chunked(latest, batch_size):
+        products = list(
+            InvestmentProduct.objects.filter(symbol__in=symbols).only('id', 'symbol', 'current_price', 'updated_at')
+        )
+        found += len(products)
+        dirty = []
+        for product in products:
+            price = latest[product.symbol].price
+            if product.current_price != price:
+                product.current_price = price
+                # bulk_update skips auto_now; updated_at also moves the catalog version
+                product.updated_at = now
+                dirty.append(product)
+        InvestmentProduct.objects.bulk_update(dirty, ['current_price', 'updated_at'], batch_size=batch_size)
+        changed.extend(product.pk for product in dirty)
+    return changed, len(latest) - found
+
+
+def ingest_files(paths, batch_size=500):
+    """Ingest a batch of feed files, returns an IngestReport"""
+    started = time.perf_counter()
+    paths = list(paths)
+    ticks = (tick for path in paths for tick in read_ticks(path))
+    bars = BarBuilder()
+    latest, read, rejected = coalesce(bars.collect(ticks))
+
+    with transaction.atomic():
+        changed, unknown = apply_prices(latest, batch_size)
+        portfolios = sum(reprice_products(ids) for ids in chunked(changed, batch_size))
+        bars_written = bars.save()
+
+    written = timezone.now()
+    lags = [(written - tick.ts).total_seconds() for tick in latest.values()]
+    return IngestReport(
+        files=len(paths),
+        ticks=read,
+        rejected=rejected,
+        symbols=len(latest),
+        updated=len(changed),
+        unknown=unknown,
+        portfolios=portfolios,
+        bars=bars_written,
+        max_lag=max(lags, default=0.0),
+        mean_lag=sum(lags) / len(lags) if lags else 0.0,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def archive_files(paths, directory):
+    """Move ingested files into `directory`/processed"""
+    processed = Path(directory) / 'processed'
+    processed.mkdir(exist_ok=True)
+    for path in paths:
+        os.replace(path, processed / Path(path).name)
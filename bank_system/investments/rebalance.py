@@ -0,0 +1,168 @@
+"""
+Portfolio rebalancing
+
+A portfolio's TargetAllocation rows give the percent of its value each
+product should make up. plan_rebalance() lines the held positions and the
+targets up as arrays over the union of their products and computes every
+product's drift from its target in one pass:
+
+    drift = value * weight / 100 - held
+
+Products above target are sold down (fully when their target is zero),
+then products below target are bought with the sale proceeds plus any
+extra cash, scaled down together when the money does not stretch. Drifts
+within the tolerance are left alone, so small wobbles never trade, and buys
+under a product's min_investment are dropped.
+
+rebalance() places the resulting orders and executes them as one batch with
+investments.orders.execute_orders(), sells first so their proceeds fund the
+buys; if any order is rejected the whole rebalance is rolled back. With
+dry_run it only returns the plan.
+"""
+
+from collections import namedtuple
+from decimal import ROUND_DOWN, Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import InvestmentHolding, InvestmentOrder, InvestmentProduct, TargetAllocation
+from .orders import execute_orders
+from .valuation import HOLDING_VALUE
+
+CENT = Decimal('0.01')
+SHARE = Decimal('0.0001')
+# Drift from target, in percent of the portfolio value, left alone
+DEFAULT_TOLERANCE = Decimal('0.5')
+
+RebalanceTrade = namedtuple('RebalanceTrade', ['product_id', 'symbol', 'side', 'quantity', 'price', 'amount', 'holding_id'])
+RebalancePlan = namedtuple('RebalancePlan', ['value', 'cash', 'trades'])
+
+
+def set_targets(portfolio, weights):
+    """Replace the portfolio's targets with {product_id: weight in percent}, weights must add up to 100"""
+    weights = {product_id: Decimal(weight) for product_id, weight in weights.items() if Decimal(weight) != 0}
+    if any(weight < 0 for weight in weights.values()):
+        raise ValueError('Target weights cannot be negative')
+    if weights and sum(weights.values()) != 100:
+        raise ValueError(f'Target weights add up to {sum(weights.values())}%, not 100%')
+    with transaction.atomic():
+        portfolio.targets.all().delete()
+        TargetAllocation.objects.bulk_create([
+            TargetAllocation(portfolio=portfolio, product_id=product_id, weight=weight)
+            for product_id, weight in weights.items()
+        ])
+
+
+def current_weights(portfolio):
+    """{product_id: percent of the held value} from one grouped query"""
+    values = dict(
+        InvestmentHolding.objects.filter(portfolio=portfolio, status__in=InvestmentHolding.HELD_STATUSES)
+        .order_by()
+        .values_list('product_id')
+        .annotate(value=Sum(F('quantity') * F('current_price'), output_field=HOLDING_VALUE))
+    )
+    total = sum(values.values())
+    return {product_id: (value / total * 100).quantize(CENT) for product_id, value in values.items()} if total else {}
+
+
+def _shares(amount, price):
+    return (amount / price).quantize(SHARE, rounding=ROUND_DOWN) if price > 0 else Decimal('0')
+
+
+def plan_rebalance(portfolio, cash=Decimal('0'), tolerance=DEFAULT_TOLERANCE):
+    """
+    RebalancePlan with the trades that bring `portfolio` to its targets,
+    investing up to `cash` from its account on top of the sale proceeds.
+    Nothing is written.
+    """
+    targets = dict(portfolio.targets.values_list('product_id', 'weight'))
+    held = list(
+        InvestmentHolding.objects.filter(portfolio=portfolio, status__in=InvestmentHolding.HELD_STATUSES, quantity__gt=0)
+        .order_by('product_id', 'pk')
+        .values_list('pk', 'product_id', 'quantity', 'current_price')
+    )
+    if not targets:
+        return RebalancePlan(Decimal('0.00'), cash, [])
+    cash = min(Decimal(cash), portfolio.account.balance)
+
+    product_ids = sorted(targets.keys() | {product_id for _, product_id, _, _ in held})
+    products = InvestmentProduct.objects.only('symbol', 'current_price', 'min_investment', 'is_active').in_bulk(product_ids)
+    columns = {product_id: column for column, product_id in enumerate(product_ids)}
+
+    held_value = np.zeros(len(product_ids))
+    np.add.at(
+        held_value,
+        [columns[product_id] for _, product_id, _, _ in held],
+        [float(quantity * price) for _, _, quantity, price in held],
+    )
+    weights = np.array([float(targets.get(product_id, 0)) for product_id in product_ids])
+    total = held_value.sum() + float(cash)
+    drift = total * weights / 100 - held_value
+    trade = np.abs(drift) > total * float(tolerance) / 100
+    # Anything without a target is sold off, however small
+    trade |= (weights == 0) & (held_value > 0)
+
+    trades, proceeds = [], Decimal('0')
+    by_product = {}
+    for pk, product_id, quantity, price in held:
+        by_product.setdefault(product_id, []).append((pk, quantity, price))
+    for column in np.flatnonzero(trade & (drift < 0)):
+        product = products[product_ids[column]]
+        left = -drift[column]
+        for pk, quantity, price in by_product[product.pk]:
+            if weights[column] == 0:
+                shares = quantity
+            else:
+                shares = min(quantity, _shares(Decimal(left), price))
+            if shares <= 0:
+                break
+            amount = (shares * price).quantize(CENT)
+            trades.append(RebalanceTrade(product.pk, product.symbol, 'sell', shares, price, amount, pk))
+            proceeds += amount
+            left -= float(amount)
+
+    budget = proceeds + cash
+    buys = np.flatnonzero(trade & (drift > 0))
+    wanted = drift[buys]
+    if wanted.sum() > float(budget):
+        wanted *= float(budget) / wanted.sum()
+    for column, amount in zip(buys, wanted):
+        product = products[product_ids[column]]
+        shares = _shares(min(Decimal(amount), budget), product.current_price)
+        amount = (shares * product.current_price).quantize(CENT)
+        if not product.is_active or shares <= 0 or amount < product.min_investment or amount > budget:
+            continue
+        trades.append(RebalanceTrade(product.pk, product.symbol, 'buy', shares, product.current_price, amount, None))
+        budget -= amount
+
+    return RebalancePlan(Decimal(total).quantize(CENT), cash, trades)
+
+
+def rebalance(portfolio, cash=Decimal('0'), tolerance=DEFAULT_TOLERANCE, dry_run=False):
+    """
+    Plan and, unless `dry_run`, execute a rebalance of `portfolio`. Returns
+    (RebalancePlan, ExecutionReport or None); raises ValueError, with nothing
+    written, if an order is rejected.
+    """
+    with transaction.atomic():
+        plan = plan_rebalance(portfolio, cash, tolerance)
+        if dry_run or not plan.trades:
+            return plan, None
+        # Orders execute by id, so the sells placed first fund the buys
+        orders = InvestmentOrder.objects.bulk_create([
+            InvestmentOrder(
+                portfolio=portfolio, product_id=trade.product_id, holding_id=trade.holding_id,
+                side=trade.side, quantity=trade.quantity,
+            )
+            for trade in plan.trades
+        ])
+        order_ids = [order.pk for order in orders]
+        report = execute_orders(batch_size=len(order_ids), order_ids=order_ids)
+        if report.rejected:
+            reasons = InvestmentOrder.objects.filter(pk__in=order_ids, status='rejected').values_list(
+                'reject_reason', flat=True
+            )
+            raise ValueError(f'Rebalance cancelled: {"; ".join(reasons)}')
+    return plan, report
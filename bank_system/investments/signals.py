@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import InvestmentProduct, InvestmentTransaction
+from .performance import invalidate
+from .valuation import reprice_products
+
+
+@receiver(post_save, sender=InvestmentProduct)
+def revalue_holders(sender, instance, created, update_fields=None, **kwargs):
+    """Revalue the portfolios holding a product once a new price is committed"""
+    if created or (update_fields is not None and 'current_price' not in update_fields):
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: reprice_products([product_id]))
+
+
+@receiver(post_save, sender=InvestmentTransaction)
+@receiver(post_delete, sender=InvestmentTransaction)
+def refresh_performance(sender, instance, **kwargs):
+    """Drop the cached performance of a portfolio whose cash flows changed"""
+    portfolio_id = instance.portfolio_id
+    transaction.on_commit(lambda: invalidate(portfolio_id))
@@ -0,0 +1,621 @@
+import math
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from core.testing import QueryCountMixin
+from transactions.models import Transaction
+from .catalog import get_catalog
+from .history import compact_bars, get_prices, price_matrix
+from .lots import match_lots, open_unlotted
+from .models import (
+    InvestmentHolding, InvestmentLot, InvestmentOrder, InvestmentPlatform, InvestmentProduct, InvestmentTransaction,
+    Portfolio, PriceBar, RealizedGain,
+)
+from .orders import execute_orders, place_order
+from .performance import compute_performance, portfolio_performance
+from .pricefeed import Tick, apply_prices, read_ticks
+from .risk import DAYS_PER_YEAR, RISK_VOLATILITY, book_risk, portfolio_risk, simulation_params
+from .valuation import reprice_products, revalue_portfolios
+
+
+class PlaceOrderTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='investor')
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.product = InvestmentProduct.objects.create(
+            platform=platform, name='Acme', symbol='ACME', risk_level='low', current_price=Decimal('10.00'),
+            expected_return=5,
+        )
+        self.account = Account.objects.create(user=user, account_number='INV1', balance=Decimal('100.00'))
+        self.portfolio = Portfolio.objects.create(user=user, account=self.account, name='Main')
+
+    def test_buy_fills(self):
+        order = place_order(self.portfolio, self.product, 'buy', Decimal('3'))
+        self.assertEqual((order.status, order.total_amount), ('filled', Decimal('30.00')))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('70.00'))
+        self.assertEqual(InvestmentHolding.objects.get().quantity, Decimal('3'))
+        self.assertEqual(Transaction.objects.get().amount, Decimal('30.00'))
+
+    def test_buy_over_balance_is_rejected(self):
+        order = place_order(self.portfolio, self.product, 'buy', Decimal('11'))
+        self.assertEqual(order.status, 'rejected')
+        self.assertIn('Insufficient balance', order.reject_reason)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertFalse(InvestmentHolding.objects.exists())
+
+    def test_failed_execution_keeps_no_order(self):
+        with mock.patch('investments.orders._settle_accounts', side_effect=RuntimeError('short')):
+            with self.assertRaises(RuntimeError):
+                place_order(self.portfolio, self.product, 'buy', Decimal('3'))
+        self.assertFalse(InvestmentOrder.objects.exists())
+        self.assertEqual(execute_orders(), (0, 0))
+
+
+@override_settings(INVESTMENT_ORDER_EXECUTION='queued')
+class ExecuteOrdersQueryTests(QueryCountMixin, TestCase):
+    """Apart from one balance update per account, a batch runs the same statements however many orders it holds"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='batch')
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.product = InvestmentProduct.objects.create(
+            platform=platform, name='Acme', symbol='ACME', risk_level='low', current_price=Decimal('10.00'),
+            expected_return=5,
+        )
+        self.account = Account.objects.create(user=user, account_number='BATCH1', balance=Decimal('100.00'))
+        self.portfolio = Portfolio.objects.create(user=user, account=self.account, name='Main')
+
+    def _queue(self, filled):
+        """Ids of `filled` buys of 1 share and one buy the account cannot cover"""
+        orders = [place_order(self.portfolio, self.product, 'buy', Decimal('1')) for _ in range(filled)]
+        orders.append(place_order(self.portfolio, self.product, 'buy', Decimal('1000')))
+        return [order.pk for order in orders]
+
+    def test_query_count_does_not_grow_with_batch(self):
+        # The first fill opens the holding, later batches buy into it
+        execute_orders(order_ids=self._queue(1))
+        few, many = self._queue(1), self._queue(6)
+        reports = self.assertQueryCountFixed(
+            lambda: execute_orders(order_ids=few), lambda: execute_orders(order_ids=many),
+        )
+        self.assertEqual(reports, ((1, 1), (6, 1)))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('20.00'))
+        self.assertEqual(InvestmentHolding.objects.get().quantity, Decimal('8'))
+
+
+class RebalanceViewTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='rebalancer')
+        account = Account.objects.create(user=user, account_number='REB1', balance=Decimal('100.00'))
+        self.portfolio = Portfolio.objects.create(user=user, account=account, name='Main')
+        self.url = reverse('investments:rebalance_portfolio', args=[self.portfolio.pk])
+        self.client.force_login(user)
+
+    def test_invalid_cash_preview(self):
+        for cash in ('abc', '-5', 'NaN', 'Infinity'):
+            self.assertEqual(self.client.get(self.url, {'cash': cash}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cash': '25'}).status_code, 200)
+
+    def test_invalid_cash_rebalance(self):
+        with mock.patch('investments.views.rebalance') as rebalance:
+            response = self.client.post(self.url, {'cash': '-5'}, follow=True)
+        rebalance.assert_not_called()
+        self.assertContains(response, 'Cash to invest cannot be negative')
+
+
+class ValuationTests(TestCase):
+    """Set-based revaluation gives the totals of summing each portfolio's holdings in Python"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='valued')
+        account = Account.objects.create(user=user, account_number='VAL1', balance=Decimal('0.00'))
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.products = [
+            InvestmentProduct.objects.create(platform=platform, name=f'P{i}', symbol=f'VAL{i}', risk_level='low',
+                                             current_price=price, expected_return=5)
+            for i, price in enumerate([Decimal('10.07'), Decimal('251.33'), Decimal('0.19')])
+        ]
+        self.portfolios = [
+            Portfolio.objects.create(user=user, account=account, name=f'Portfolio {i}', total_invested=invested)
+            for i, invested in enumerate([Decimal('1000.00'), Decimal('50.00'), Decimal('0.00'), Decimal('10.00')])
+        ]
+        positions = [
+            (0, 0, '1.2345', 'active'), (0, 1, '3.5000', 'partial_sold'), (0, 2, '1000.0001', 'active'),
+            (1, 1, '7.0000', 'sold'), (1, 2, '333.3333', 'active'),
+            (3, 1, '0.0001', 'active'),
+        ]
+        for portfolio, product, quantity, status in positions:
+            InvestmentHolding.objects.create(
+                portfolio=self.portfolios[portfolio], product=self.products[product], quantity=Decimal(quantity),
+                purchase_price=Decimal('1.00'), current_price=self.products[product].current_price, status=status,
+            )
+
+    def _reference(self):
+        """{portfolio id: (current_value, total_return)}, one holding at a time"""
+        totals = {}
+        for portfolio in Portfolio.objects.all():
+            value = sum(
+                (holding.quantity * holding.current_price
+                 for holding in portfolio.holdings.all() if holding.status in InvestmentHolding.HELD_STATUSES),
+                Decimal('0'),
+            ).quantize(Decimal('0.01'))
+            totals[portfolio.pk] = (value, value - portfolio.total_invested)
+        return totals
+
+    def _stored(self):
+        return {pk: (value, ret) for pk, value, ret in
+                Portfolio.objects.values_list('pk', 'current_value', 'total_return')}
+
+    def test_revalue_matches_reference(self):
+        self.assertEqual(revalue_portfolios(), len(self.portfolios))
+        self.assertEqual(self._stored(), self._reference())
+
+    def test_reprice_touches_only_holders(self):
+        revalue_portfolios()
+        InvestmentProduct.objects.filter(pk=self.products[1].pk).update(current_price=Decimal('199.99'))
+        # Portfolios 0 and 3 hold the product, portfolio 1 only sold it
+        self.assertEqual(reprice_products([self.products[1].pk]), 2)
+        self.assertEqual(self._stored(), self._reference())
+        self.assertEqual(
+            set(InvestmentHolding.objects.filter(current_price=Decimal('199.99')).values_list('portfolio', flat=True)),
+            {self.portfolios[0].pk, self.portfolios[3].pk},
+        )
+
+
+class PriceFeedTests(TestCase):
+    """Malformed records are counted as rejected and never stop a batch"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.product = InvestmentProduct.objects.create(
+            platform=platform, name='Acme', symbol='ACME', risk_level='low', current_price=Decimal('10.00'),
+            expected_return=5,
+        )
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def _write(self, name, content, mode='w'):
+        path = self.directory / name
+        with open(path, mode) as feed:
+            feed.write(content)
+        return path
+
+    def test_malformed_jsonl_records(self):
+        path = self._write('1.jsonl', '\n'.join([
+            '{"symbol": "ACME", "price": "11.50", "ts": "2024-03-01T10:00:00Z"}',
+            '{"symbol": "ACME", "price": "12.00", "ts": "2024-02-30T00:00:00"}',
+            '{"symbol": "ACME", "price": "12.00", "ts": 1709287200}',
+            '[1, 2]',
+            '"ACME"',
+            'null',
+            '{"symbol": "ACME", "price": [12]}',
+            'not json',
+        ]))
+        ticks = list(read_ticks(path))
+        self.assertEqual(len(ticks), 8)
+        self.assertEqual(ticks[0].price, Decimal('11.50'))
+        self.assertEqual(ticks[1:], [None] * 7)
+
+    def test_malformed_csv_rows(self):
+        path = self._write('1.csv', 'symbol,price,ts\nACME,11.50,\nACME,12,2024-13-01T00:00:00\n,12,\nACME,abc,\n')
+        self.assertEqual([tick and tick.price for tick in read_ticks(path)], [Decimal('11.50'), None, None, None])
+
+    def test_bad_files_are_ingested_and_archived(self):
+        self._write('1.jsonl', '[1, 2]\n{"symbol": "ACME", "price": "1", "ts": "2024-02-30T00:00:00"}\n')
+        self._write('2.csv', b'symbol,price,ts\n\xff\xfe,1,\nACME,12.34,2024-03-01T10:00:00Z\n', mode='wb')
+        output = StringIO()
+        call_command('ingest_prices', dir=str(self.directory), stdout=output)
+        # The undecodable symbol is read as an unknown one
+        self.assertIn('4 ticks (2 rejected) -> 1/2 prices changed, 1 unknown symbols', output.getvalue())
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), ['processed'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_price, Decimal('12.34'))
+
+
+class CatalogTests(TestCase):
+    """Changes committed by another process reach a worker whose cache never heard of them"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='browser')
+        self.platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.products = [
+            InvestmentProduct.objects.create(platform=self.platform, name=f'P{i}', symbol=f'CAT{i}', risk_level='low',
+                                             current_price=Decimal('10.00'), expected_return=5)
+            for i in range(2)
+        ]
+        # The web worker's own cache, which the price feed and admin processes never write to
+        self.enterContext(mock.patch('investments.catalog.cache', LocMemCache('catalog-worker', {})))
+
+    def _prices(self):
+        return {product.symbol: product.current_price for product in get_catalog().products}
+
+    def test_follows_changes_made_elsewhere(self):
+        self.assertEqual(self._prices(), {'CAT0': Decimal('10.00'), 'CAT1': Decimal('10.00')})
+        apply_prices({'CAT0': Tick('CAT0', Decimal('12.50'), timezone.now())})
+        self.assertEqual(self._prices(), {'CAT0': Decimal('12.50'), 'CAT1': Decimal('10.00')})
+        InvestmentProduct.objects.filter(pk=self.products[1].pk).delete()
+        self.assertEqual(self._prices(), {'CAT0': Decimal('12.50')})
+        self.platform.is_active = False
+        self.platform.save()
+        self.assertEqual(get_catalog().active_platforms, ())
+
+    def test_rendered_grid_follows_prices(self):
+        self.client.force_login(self.user)
+        url = reverse('investments:products_list')
+        self.assertContains(self.client.get(url), '10.00')
+        apply_prices({'CAT1': Tick('CAT1', Decimal('17.25'), timezone.now())})
+        self.assertContains(self.client.get(url), '17.25')
+
+    def test_unchanged_catalog_is_reused(self):
+        catalog = get_catalog()
+        # Only the version is read
+        with self.assertNumQueries(1):
+            self.assertIs(get_catalog(), catalog)
+
+
+class PriceHistoryTests(TestCase):
+    """Compaction and range reads agree with grouping and filtering the bars one at a time"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.products = [
+            InvestmentProduct.objects.create(platform=platform, name=symbol, symbol=symbol, risk_level='low',
+                                             current_price=Decimal('10.00'), expected_return=5)
+            for symbol in ('HISA', 'HISB', 'HISC')
+        ]
+        self.now = datetime(2024, 6, 20, 12, 30, tzinfo=dt_timezone.utc)
+        generator = random.Random(39)
+        bars = []
+        for product in self.products[:2]:
+            # Ten days of scattered minute bars, the first three past the seven day retention
+            start = self.now - timedelta(days=10)
+            for minute in sorted(generator.sample(range(10 * 24 * 60), 600)):
+                prices = [generator.randint(900, 1100) for _ in range(4)]
+                bars.append(PriceBar(
+                    product=product, resolution='minute', ts=start + timedelta(minutes=minute),
+                    open=Decimal(prices[0]).scaleb(-2), high=Decimal(max(prices)).scaleb(-2),
+                    low=Decimal(min(prices)).scaleb(-2), close=Decimal(prices[3]).scaleb(-2),
+                    ticks=generator.randint(1, 5),
+                ))
+        for day in range(30):
+            for product in self.products:
+                if generator.random() < 0.7:
+                    bars.append(PriceBar(
+                        product=product, resolution='day', ts=self.now.replace(hour=0, minute=0) - timedelta(days=day),
+                        open=1, high=1, low=1, close=Decimal(generator.randint(100, 20000)).scaleb(-2), ticks=1,
+                    ))
+        PriceBar.objects.bulk_create(bars)
+
+    def test_compaction_matches_grouping(self):
+        cutoff = (self.now - timedelta(days=7)).replace(minute=0)
+        expected = {}
+        for bar in PriceBar.objects.filter(resolution='minute', ts__lt=cutoff).order_by('product', 'ts'):
+            key = (bar.product_id, bar.ts.replace(minute=0))
+            if key not in expected:
+                expected[key] = [bar.open, bar.high, bar.low, bar.close, bar.ticks]
+                continue
+            hour = expected[key]
+            hour[1:] = [max(hour[1], bar.high), min(hour[2], bar.low), bar.close, hour[4] + bar.ticks]
+        recent = set(PriceBar.objects.filter(resolution='minute', ts__gte=cutoff).values_list('pk', flat=True))
+        rolled = PriceBar.objects.filter(resolution='minute', ts__lt=cutoff).count()
+
+        self.assertEqual(compact_bars(self.now, batch_products=1), (rolled, len(expected), 0))
+        hours = {
+            (bar.product_id, bar.ts): [bar.open, bar.high, bar.low, bar.close, bar.ticks]
+            for bar in PriceBar.objects.filter(resolution='hour')
+        }
+        self.assertEqual(hours, expected)
+        self.assertEqual(set(PriceBar.objects.filter(resolution='minute').values_list('pk', flat=True)), recent)
+
+    def test_range_reads_match_filtering(self):
+        symbols = ['HISC', 'HISA', 'NONE', 'HISB']
+        start, end = self.now - timedelta(days=20), self.now - timedelta(days=2)
+        series = get_prices(symbols, start, end)
+        for symbol in symbols:
+            bars = PriceBar.objects.filter(product__symbol=symbol, resolution='day', ts__gte=start, ts__lt=end)
+            rows = list(bars.order_by('ts').values_list('ts', 'close'))
+            self.assertEqual([int(ts.timestamp()) for ts, _ in rows], series[symbol].ts.astype(int).tolist())
+            self.assertEqual([float(close) for _, close in rows], series[symbol].values.tolist())
+
+        times, matrix = price_matrix(symbols, start, end)
+        for row, time in enumerate(times.astype(int).tolist()):
+            for column, symbol in enumerate(symbols):
+                known = [value for ts, value in zip(series[symbol].ts.astype(int), series[symbol].values) if ts <= time]
+                if known:
+                    self.assertEqual(matrix[row, column], known[-1])
+                else:
+                    self.assertTrue(math.isnan(matrix[row, column]))
+
+
+class PerformanceTests(SimpleTestCase):
+    """compute_performance() agrees with replaying the trades one day at a time"""
+
+    def _reference(self, trades, prices, risk_free_rate):
+        holdings, previous, wealth, peak = {}, 0.0, 1.0, 1.0
+        returns, drawdown = [], 0.0
+        for day, row in enumerate(prices):
+            flows = {'buy': 0.0, 'sell': 0.0, 'dividend': 0.0}
+            for trade_day, column, kind, quantity, amount in trades:
+                if trade_day == day:
+                    flows[kind] += amount
+                    if kind != 'dividend':
+                        holdings[column] = holdings.get(column, 0.0) + (quantity if kind == 'buy' else -quantity)
+            value = sum(quantity * row[column] for column, quantity in holdings.items())
+            base = previous + flows['buy']
+            daily = (value + flows['sell'] + flows['dividend']) / base - 1 if base > 0 else 0.0
+            returns.append(daily)
+            wealth *= 1 + daily
+            peak = max(peak, wealth)
+            drawdown = min(drawdown, wealth / peak - 1)
+            previous = value
+        mean = sum(returns) / len(returns)
+        volatility = (sum((r - mean) ** 2 for r in returns) / (len(returns) - 1)) ** 0.5 * 365 ** 0.5
+        return {
+            'current_value': previous,
+            'time_weighted_return': (wealth - 1) * 100,
+            'annualized_return': (wealth ** (365 / (len(prices) - 1)) - 1) * 100,
+            'max_drawdown': drawdown * 100,
+            'volatility': volatility * 100,
+            'sharpe_ratio': (mean * 365 - risk_free_rate) / volatility,
+        }
+
+    def test_matches_daily_replay(self):
+        generator = np.random.default_rng(40)
+        days = 400
+        prices = 50 * np.cumprod(1 + generator.normal(0.0004, 0.015, size=(days, 2)), axis=0)
+        trades = [
+            (0, 0, 'buy', 10.0, 10 * prices[0, 0]),
+            (30, 1, 'buy', 5.0, 5 * prices[30, 1]),
+            (90, 0, 'dividend', 0.0, 12.5),
+            (200, 0, 'sell', 4.0, 4 * prices[200, 0]),
+            (201, 1, 'buy', 2.5, 2.5 * prices[201, 1]),
+            (399, 1, 'sell', 1.0, prices[399, 1]),
+        ]
+        result = compute_performance(*[list(column) for column in zip(*trades)], prices=prices, risk_free_rate=0.02)
+        expected = self._reference(trades, prices, 0.02)
+        self.assertEqual(result['days'], days)
+        for name, value in expected.items():
+            self.assertAlmostEqual(result[name], value, places=9, msg=name)
+
+        # The money-weighted return discounts the cash flows and final value to zero
+        rate = (1 + result['money_weighted_return'] / 100) ** (1 / 365) - 1
+        flows = [(day, (amount if kind != 'buy' else -amount)) for day, _, kind, _, amount in trades]
+        flows.append((days - 1, expected['current_value']))
+        self.assertAlmostEqual(sum(flow / (1 + rate) ** day for day, flow in flows), 0, places=6)
+
+
+class PerformanceCacheTests(TestCase):
+    """Cached figures follow trades written without signals, as another process writes them"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.enterContext(mock.patch('investments.performance.cache', LocMemCache('performance-worker', {})))
+        user = get_user_model().objects.create_user(username='performer')
+        account = Account.objects.create(user=user, account_number='PRF1', balance=Decimal('0.00'))
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.product = InvestmentProduct.objects.create(
+            platform=platform, name='Acme', symbol='PRF', risk_level='low', current_price=Decimal('20.00'),
+            expected_return=5,
+        )
+        self.portfolio = Portfolio.objects.create(user=user, account=account, name='Growth')
+        self._trade('buy', '10')
+
+    def _trade(self, kind, quantity):
+        return InvestmentTransaction.objects.bulk_create([InvestmentTransaction(
+            portfolio=self.portfolio, product=self.product, transaction_type=kind, quantity=Decimal(quantity),
+            price=Decimal('10.00'), total_amount=Decimal(quantity) * 10,
+        )])[0]
+
+    def test_new_and_deleted_trades_move_the_figures(self):
+        self.assertEqual(portfolio_performance(self.portfolio.pk)['current_value'], 200.0)
+        sale = self._trade('sell', '4')
+        self.assertEqual(portfolio_performance(self.portfolio.pk)['current_value'], 120.0)
+        InvestmentTransaction.objects.filter(pk=sale.pk).delete()
+        self.assertEqual(portfolio_performance(self.portfolio.pk)['current_value'], 200.0)
+
+
+class RiskTests(TestCase):
+    """Seeded VaR is reproducible and matches simulating each path by hand"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username='risky')
+        account = Account.objects.create(user=user, account_number='RISK1', balance=Decimal('0.00'))
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.products = [
+            InvestmentProduct.objects.create(platform=platform, name=level, symbol=f'RSK{i}', risk_level=level,
+                                             current_price=Decimal('20.00'), expected_return=expected)
+            for i, (level, expected) in enumerate([('low', 3), ('high', 9), ('very_high', 15)])
+        ]
+        self.portfolios = [
+            Portfolio.objects.create(user=user, account=account, name=f'Portfolio {i}') for i in range(3)
+        ]
+        for portfolio, product, quantity in [(0, 0, 10), (0, 1, 5), (1, 1, 20), (1, 2, 2), (2, 2, 7)]:
+            InvestmentHolding.objects.create(
+                portfolio=self.portfolios[portfolio], product=self.products[product], quantity=Decimal(quantity),
+                purchase_price=Decimal('20.00'), current_price=Decimal('20.00'),
+            )
+        self.params = simulation_params(horizon_days=10, confidence=0.95, paths=2000, seed=41)
+
+    def _reference(self, positions):
+        """(expected pnl, VaR) of {product: value}, drawing and pricing one path at a time"""
+        years = self.params.horizon_days / DAYS_PER_YEAR
+        rho = self.params.correlation
+        market = np.random.default_rng([self.params.seed, 0]).standard_normal(self.params.paths)
+        own = {
+            product.pk: np.random.default_rng([self.params.seed, product.pk]).standard_normal(self.params.paths)
+            for product in self.products
+        }
+        products = {product.pk: product for product in self.products}
+        pnl = []
+        for path in range(self.params.paths):
+            total = 0.0
+            for pk, value in positions.items():
+                sigma = RISK_VOLATILITY[products[pk].risk_level]
+                shock = math.sqrt(rho) * market[path] + math.sqrt(1 - rho) * own[pk][path]
+                drift = float(products[pk].expected_return) / 100
+                total += value * math.expm1((drift - sigma ** 2 / 2) * years + sigma * math.sqrt(years) * shock)
+            pnl.append(total)
+        return sum(pnl) / len(pnl), float(np.quantile([-p for p in pnl], self.params.confidence))
+
+    def test_matches_path_by_path_simulation(self):
+        results = portfolio_risk(Portfolio.objects.all(), self.params, chunk_size=2)
+        positions = [{self.products[0].pk: 200.0, self.products[1].pk: 100.0},
+                     {self.products[1].pk: 400.0, self.products[2].pk: 40.0},
+                     {self.products[2].pk: 140.0}]
+        for portfolio, held in zip(self.portfolios, positions):
+            expected, var = self._reference(held)
+            self.assertAlmostEqual(results[portfolio.pk].expected_pnl, expected, places=9)
+            self.assertAlmostEqual(results[portfolio.pk].var, var, places=9)
+
+        totals = {}
+        for held in positions:
+            for pk, value in held.items():
+                totals[pk] = totals.get(pk, 0.0) + value
+        expected, var = self._reference(totals)
+        self.assertAlmostEqual(book_risk(Portfolio.objects.all(), self.params).var, var, places=9)
+
+    def test_seeded_results_are_reproducible(self):
+        first = portfolio_risk(Portfolio.objects.all(), self.params)
+        cache.clear()
+        self.assertEqual(portfolio_risk(Portfolio.objects.all(), self.params), first)
+        cache.clear()
+        # Chunking and new products do not move any portfolio's scenarios, only the rounding of the sums
+        existing = self.portfolios[0]
+        product = InvestmentProduct.objects.create(platform=self.products[0].platform, name='New', symbol='RSKNEW',
+                                                   risk_level='medium', current_price=1, expected_return=1)
+        portfolio = Portfolio.objects.create(user=existing.user, account=existing.account, name='New')
+        InvestmentHolding.objects.create(portfolio=portfolio, product=product, quantity=1, purchase_price=1,
+                                         current_price=1)
+        chunked = portfolio_risk(Portfolio.objects.all(), self.params, chunk_size=1)
+        for portfolio in self.portfolios:
+            for got, expected in zip(chunked[portfolio.pk], first[portfolio.pk]):
+                self.assertAlmostEqual(got, expected, places=9)
+        other_seed = portfolio_risk(Portfolio.objects.all(), self.params._replace(seed=42))
+        self.assertNotEqual(other_seed[self.portfolios[0].pk].var, first[self.portfolios[0].pk].var)
+
+
+class MatchLotsTests(SimpleTestCase):
+    """Lot matching agrees with taking shares one at a time from a list of share prices"""
+
+    def _reference(self, lots, quantity, method):
+        shares = [price for _, remaining, price in lots for _ in range(int(remaining))]
+        if method == 'average':
+            return sum(shares, Decimal('0')) * quantity / len(shares)
+        taken = shares[:quantity] if method == 'fifo' else shares[len(shares) - quantity:]
+        return sum(taken, Decimal('0'))
+
+    def test_matches_share_by_share(self):
+        generator = random.Random(42)
+        for _ in range(50):
+            lots = [[pk, Decimal(generator.randint(1, 8)), Decimal(generator.randint(100, 999)).scaleb(-2)]
+                    for pk in range(generator.randint(1, 6))]
+            quantity = generator.randint(1, int(sum(lot[1] for lot in lots)))
+            for method in ('fifo', 'lifo', 'average'):
+                with self.subTest(lots=lots, quantity=quantity, method=method):
+                    matched = [list(lot) for lot in lots]
+                    basis = match_lots(matched, Decimal(quantity), method)
+                    self.assertEqual(basis.quantize(Decimal('0.0001')),
+                                     self._reference(lots, quantity, method).quantize(Decimal('0.0001')))
+                    self.assertEqual(sum(lot[1] for lot in matched), sum(lot[1] for lot in lots) - quantity)
+                    # Average cost uses the lots up oldest first, like FIFO
+                    if method != 'lifo':
+                        fifo = [list(lot) for lot in lots]
+                        match_lots(fifo, Decimal(quantity), 'fifo')
+                        self.assertEqual(matched, fifo)
+
+    def test_short_lots_raise(self):
+        with self.assertRaises(ValueError):
+            match_lots([[1, Decimal('2'), Decimal('5.00')]], Decimal('3'), 'fifo')
+
+
+class SellLotsTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='seller')
+        platform = InvestmentPlatform.objects.create(name='Broker', platform_type='stocks')
+        self.product = InvestmentProduct.objects.create(
+            platform=platform, name='Acme', symbol='ACME', risk_level='low', current_price=Decimal('10.00'),
+            expected_return=5,
+        )
+        self.account = Account.objects.create(user=user, account_number='SELL1', balance=Decimal('1000.00'))
+        self.portfolio = Portfolio.objects.create(user=user, account=self.account, name='Main')
+
+    def _buy(self, price, quantity):
+        InvestmentProduct.objects.filter(pk=self.product.pk).update(current_price=price)
+        self.product.refresh_from_db()
+        return place_order(self.portfolio, self.product, 'buy', Decimal(quantity))
+
+    def _sell(self, quantity):
+        holding = InvestmentHolding.objects.get(status__in=InvestmentHolding.HELD_STATUSES)
+        order = place_order(self.portfolio, self.product, 'sell', Decimal(quantity), holding=holding)
+        self.assertEqual(order.status, 'filled', order.reject_reason)
+        return RealizedGain.objects.get(transaction=order.transaction)
+
+    def test_cost_basis_methods(self):
+        for method, basis in [('fifo', Decimal('70.00')), ('lifo', Decimal('110.00')), ('average', Decimal('90.00'))]:
+            with self.subTest(method), transaction.atomic():
+                Portfolio.objects.filter(pk=self.portfolio.pk).update(cost_basis_method=method)
+                self.portfolio.refresh_from_db()
+                for price in ('5.00', '9.00', '13.00'):
+                    self._buy(price, 5)
+                gain = self._sell(10)
+                # Sales go at the holding's last price
+                self.assertEqual((gain.method, gain.cost_basis, gain.proceeds), (method, basis, Decimal('130.00')))
+                self.assertEqual(sum(InvestmentLot.objects.values_list('remaining', flat=True)), Decimal('5'))
+                transaction.set_rollback(True)
+
+    def test_unlotted_holding_gets_an_opening_lot(self):
+        # As created by seed data or the admin, with no lots
+        holding = InvestmentHolding.objects.create(portfolio=self.portfolio, product=self.product,
+                                                   quantity=Decimal('10'), purchase_price=Decimal('4.00'),
+                                                   current_price=Decimal('10.00'))
+        self._buy('12.00', 5)
+        self.assertEqual(InvestmentHolding.objects.get(pk=holding.pk).quantity, Decimal('15'))
+
+        gain = self._sell(12)
+        self.assertEqual((gain.cost_basis, gain.gain), (Decimal('64.00'), Decimal('80.00')))
+        opening = InvestmentLot.objects.get(holding=holding, transaction=None)
+        self.assertEqual((opening.quantity, opening.remaining, opening.price),
+                         (Decimal('10'), Decimal('0'), Decimal('4.00')))
+        self.assertEqual(InvestmentLot.objects.filter(holding=holding).count(), 2)
+        self.assertEqual(self._sell(3).cost_basis, Decimal('36.00'))
+
+    def test_partly_lotted_holding_keeps_its_cost(self):
+        # 5 shares lotted at 12.00 and 10 more whose price only the 6.67 average remembers
+        self._buy('12.00', 5)
+        holding = InvestmentHolding.objects.get()
+        InvestmentHolding.objects.filter(pk=holding.pk).update(quantity=15, purchase_price=Decimal('6.67'))
+        holding.refresh_from_db()
+        opening, = open_unlotted([holding])
+        self.assertEqual((opening.remaining, opening.price), (Decimal('10'), Decimal('4.00')))
+        self.assertEqual(open_unlotted([holding]), [])
@@ -9,5 +9,6 @@ urlpatterns = [
     path('create/', views.create_portfolio, name='create_portfolio'),
     path('products/', views.products_list, name='products_list'),
     path('<int:portfolio_id>/buy/', views.buy_investment, name='buy_investment'),
+    path('<int:pk>/rebalance/', views.rebalance_portfolio, name='rebalance_portfolio'),
     path('holdings/<int:holding_id>/sell/', views.sell_investment, name='sell_investment'),
 ]
@@ -0,0 +1,65 @@
+"""
+Portfolio revaluation
+
+Portfolio.current_value and total_return are derived from the holdings. Here
+they are recomputed in the database: one UPDATE with a correlated SUM
+subquery revalues any set of portfolios, and a price change only touches
+the holdings of that product and the portfolios that own them.
+"""
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import InvestmentHolding, InvestmentProduct, Portfolio
+
+HOLDING_VALUE = DecimalField(max_digits=16, decimal_places=6)
+
+
+def _holdings_value():
+    """Correlated subquery: market value of the held positions of the outer portfolio"""
+    value = (
+        InvestmentHolding.objects.filter(portfolio=OuterRef('pk'), status__in=InvestmentHolding.HELD_STATUSES)
+        .order_by()
+        .values('portfolio')
+        .annotate(total=Sum(F('quantity') * F('current_price'), output_field=HOLDING_VALUE))
+        .values('total')
+    )
+    return Coalesce(Subquery(value), Value(0), output_field=HOLDING_VALUE)
+
+
+def revalue_portfolios(portfolios=None):
+    """Recompute current_value and total_return for `portfolios` (default all) in one UPDATE"""
+    if portfolios is None:
+        portfolios = Portfolio.objects.all()
+    return portfolios.update(
+        current_value=_holdings_value(),
+        total_return=_holdings_value() - F('total_invested'),
+        updated_at=timezone.now(),
+    )
+
+
+def portfolios_holding(product_ids):
+    """Portfolios with a held position in any of `product_ids`"""
+    holders = InvestmentHolding.objects.filter(
+        product_id__in=product_ids, status__in=InvestmentHolding.HELD_STATUSES
+    ).values('portfolio_id')
+    return Portfolio.objects.filter(pk__in=holders)
+
+
+@transaction.atomic
+def reprice_products(product_ids):
+    """
+    Push the current price of `product_ids` into their held positions and
+    revalue only the portfolios affected. Returns the number of portfolios
+    revalued.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    price = InvestmentProduct.objects.filter(pk=OuterRef('product_id')).values('current_price')
+    InvestmentHolding.objects.filter(
+        product_id__in=product_ids, status__in=InvestmentHolding.HELD_STATUSES
+    ).update(current_price=Subquery(price))
+    return revalue_portfolios(portfolios_holding(product_ids))
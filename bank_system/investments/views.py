@@ -2,23 +2,34 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseBadRequest
 from django.utils import timezone
-from decimal import Decimal
-
-from .models import InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding, InvestmentTransaction
+from decimal import Decimal, InvalidOperation
+
+from .models import InvestmentPlatform, InvestmentProduct, Portfolio, InvestmentHolding
+from .catalog import find_products, get_catalog, render_fragment
+from .lots import lot_pnl
+from .orders import place_order
+from .performance import portfolio_performance
+from .rebalance import DEFAULT_TOLERANCE, current_weights, plan_rebalance, rebalance, set_targets
 from accounts.models import Account
-from transactions.models import Transaction
 
 
 @login_required
 def portfolio_list(request):
     """List all portfolios for the user"""
-    portfolios = Portfolio.objects.filter(user=request.user)
+    portfolios = Portfolio.objects.filter(user=request.user).select_related('account')
     platforms = InvestmentPlatform.objects.filter(is_active=True)
 
-    # Calculate totals
-    total_invested = sum(p.total_invested for p in portfolios)
-    total_value = sum(p.current_value for p in portfolios)
+    # Totals in one aggregate rather than summing the portfolios in Python
+    totals = portfolios.aggregate(
+        total_invested=Coalesce(Sum('total_invested'), Value(Decimal('0.00'))),
+        total_value=Coalesce(Sum('current_value'), Value(Decimal('0.00'))),
+    )
+    total_invested = totals['total_invested']
+    total_value = totals['total_value']
     total_return = total_value - total_invested
 
     context = {
@@ -34,14 +45,19 @@ def portfolio_list(request):
 @login_required
 def portfolio_detail(request, pk):
     """Detail view for a portfolio"""
-    portfolio = get_object_or_404(Portfolio, pk=pk, user=request.user)
-    holdings = portfolio.holdings.filter(status='active')
-    transactions = portfolio.transactions.all()[:10]
+    portfolio = get_object_or_404(Portfolio.objects.select_related('account'), pk=pk, user=request.user)
+    holdings = list(portfolio.holdings.filter(status__in=InvestmentHolding.HELD_STATUSES).select_related('product'))
+    transactions = portfolio.transactions.select_related('product')[:10]
+    pnl = lot_pnl(portfolio.holdings.all())
+    for holding in holdings:
+        holding.pnl = pnl.get(holding.pk)
 
     context = {
         'portfolio': portfolio,
         'holdings': holdings,
         'transactions': transactions,
+        'performance': portfolio_performance(portfolio.pk),
+        'realized_gain': sum((result.realized for result in pnl.values()), Decimal('0.00')),
     }
     return render(request, 'investments/portfolio_detail.html', context)
 
@@ -54,6 +70,9 @@ def create_portfolio(request):
         account_id = request.POST.get('account')
         name = request.POST.get('name')
         description = request.POST.get('description', '')
+        cost_basis_method = request.POST.get('cost_basis_method', 'fifo')
+        if cost_basis_method not in dict(Portfolio.COST_BASIS_METHODS):
+            cost_basis_method = 'fifo'
 
         try:
             account = Account.objects.get(pk=account_id, user=request.user)
@@ -62,7 +81,8 @@ def create_portfolio(request):
                 user=request.user,
                 account=account,
                 name=name,
-                description=description
+                description=description,
+                cost_basis_method=cost_basis_method,
             )
 
             messages.success(request, f'Portfolio "{name}" created successfully!')
@@ -75,6 +95,7 @@ def create_portfolio(request):
     accounts = Account.objects.filter(user=request.user, is_active=True)
     context = {
         'accounts': accounts,
+        'cost_basis_methods': Portfolio.COST_BASIS_METHODS,
     }
     return render(request, 'investments/create_portfolio.html', context)
 
@@ -85,18 +106,17 @@ def products_list(request):
     platform_filter = request.GET.get('platform')
     risk_filter = request.GET.get('risk')
 
-    products = InvestmentProduct.objects.filter(is_active=True)
-
-    if platform_filter:
-        products = products.filter(platform_id=platform_filter)
-    if risk_filter:
-        products = products.filter(risk_level=risk_filter)
-
-    platforms = InvestmentPlatform.objects.filter(is_active=True)
+    # Served from the catalog snapshot; the grid is cached per filter and display currency
+    catalog = get_catalog()
+    currency = request.user.preferences.currency if hasattr(request.user, 'preferences') else 'USD'
+    products_html = render_fragment(
+        'products', 'investments/products_grid.html', catalog, (platform_filter, risk_filter, currency),
+        {'products': find_products(catalog, platform_filter, risk_filter, is_active=True)}, request,
+    )
 
     context = {
-        'products': products,
-        'platforms': platforms,
+        'products_html': products_html,
+        'platforms': catalog.active_platforms,
     }
     return render(request, 'investments/products_list.html', context)
 
@@ -105,7 +125,7 @@ def products_list(request):
 @transaction.atomic
 def buy_investment(request, portfolio_id):
     """Buy an investment product"""
-    portfolio = get_object_or_404(Portfolio, pk=portfolio_id, user=request.user)
+    portfolio = get_object_or_404(Portfolio.objects.select_related('account'), pk=portfolio_id, user=request.user)
 
     if request.method == 'POST':
         product_id = request.POST.get('product')
@@ -126,72 +146,21 @@ def buy_investment(request, portfolio_id):
 
             product = InvestmentProduct.objects.get(pk=product_id, is_active=True)
 
-            # Calculate total cost and round to 2 decimal places (matching balance field precision)
-            total_cost = (quantity * product.current_price).quantize(Decimal('0.01'))
-
-            # Ensure balance is treated as Decimal and convert to 2 decimal places for comparison
-            account_balance = Decimal(str(portfolio.account.balance)).quantize(Decimal('0.01'))
-
-            # Check account balance
-            if account_balance < total_cost:
-                messages.error(request, f'Insufficient balance. Need {total_cost}, but only have {account_balance}')
+            order = place_order(portfolio, product, 'buy', quantity)
+            if order.status == 'rejected':
+                messages.error(request, order.reject_reason)
                 return redirect('investments:buy_investment', portfolio_id=portfolio_id)
-
-            # Deduct from account
-            portfolio.account.balance -= total_cost
-            portfolio.account.save()
-
-            # Create or update holding
-            holding, created = InvestmentHolding.objects.get_or_create(
-                portfolio=portfolio,
-                product=product,
-                status='active',
-                defaults={
-                    'quantity': quantity,
-                    'purchase_price': product.current_price,
-                    'current_price': product.current_price,
-                }
-            )
-
-            if not created:
-                # Update existing holding
-                total_quantity = holding.quantity + quantity
-                weighted_avg_price = ((holding.quantity * holding.purchase_price) + (quantity * product.current_price)) / total_quantity
-                holding.quantity = total_quantity
-                holding.purchase_price = weighted_avg_price
-                holding.save()
-
-            # Create transaction record
-            InvestmentTransaction.objects.create(
-                portfolio=portfolio,
-                product=product,
-                holding=holding,
-                transaction_type='buy',
-                quantity=quantity,
-                price=product.current_price,
-                total_amount=total_cost
-            )
-
-            # Update portfolio
-            portfolio.total_invested += total_cost
-            portfolio.update_portfolio_value()
-
-            # Create account transaction
-            Transaction.objects.create(
-                from_account=portfolio.account,
-                transaction_type='withdrawal',
-                amount=total_cost,
-                description=f'Investment: Buy {quantity} x {product.symbol}'
-            )
-
-            messages.success(request, f'Successfully purchased {quantity} shares of {product.symbol}!')
+            if order.status == 'pending':
+                messages.info(request, f'Order to buy {quantity} x {product.symbol} placed, it will execute shortly.')
+            else:
+                messages.success(request, f'Successfully purchased {quantity} shares of {product.symbol}!')
             return redirect('investments:portfolio_detail', pk=portfolio_id)
 
         except Exception as e:
             messages.error(request, f'Error purchasing investment: {str(e)}')
             return redirect('investments:buy_investment', portfolio_id=portfolio_id)
 
-    products = InvestmentProduct.objects.filter(is_active=True)
+    products = InvestmentProduct.objects.filter(is_active=True).select_related('platform')
     context = {
         'portfolio': portfolio,
         'products': products,
@@ -203,7 +172,9 @@ def buy_investment(request, portfolio_id):
 @transaction.atomic
 def sell_investment(request, holding_id):
     """Sell an investment holding"""
-    holding = get_object_or_404(InvestmentHolding, pk=holding_id, portfolio__user=request.user)
+    holding = get_object_or_404(
+        InvestmentHolding.objects.select_related('product', 'portfolio__account'), pk=holding_id, portfolio__user=request.user
+    )
 
     if request.method == 'POST':
         quantity_str = request.POST.get('quantity', '').strip()
@@ -226,45 +197,19 @@ def sell_investment(request, holding_id):
                 messages.error(request, f'Cannot sell more than you own. You have {holding.quantity}')
                 return redirect('investments:sell_investment', holding_id=holding_id)
 
-            # Calculate sale value and round to 2 decimal places
-            sale_value = (quantity * holding.current_price).quantize(Decimal('0.01'))
-
-            # Add to account
-            holding.portfolio.account.balance += sale_value
-            holding.portfolio.account.save()
-
-            # Update holding
-            if quantity == holding.quantity:
-                holding.status = 'sold'
-                holding.quantity = 0
+            order = place_order(holding.portfolio, holding.product, 'sell', quantity, holding=holding)
+            if order.status == 'rejected':
+                messages.error(request, order.reject_reason)
+                return redirect('investments:sell_investment', holding_id=holding_id)
+            if order.status == 'pending':
+                messages.info(request, f'Order to sell {quantity} x {holding.product.symbol} placed, it will execute shortly.')
             else:
-                holding.quantity -= quantity
-                holding.status = 'partial_sold'
-            holding.save()
-
-            # Create transaction record
-            InvestmentTransaction.objects.create(
-                portfolio=holding.portfolio,
-                product=holding.product,
-                holding=holding,
-                transaction_type='sell',
-                quantity=quantity,
-                price=holding.current_price,
-                total_amount=sale_value
-            )
-
-            # Update portfolio
-            holding.portfolio.update_portfolio_value()
-
-            # Create account transaction
-            Transaction.objects.create(
-                to_account=holding.portfolio.account,
-                transaction_type='deposit',
-                amount=sale_value,
-                description=f'Investment Sale: {quantity} x {holding.product.symbol}'
-            )
-
-            messages.success(request, f'Successfully sold {quantity} shares of {holding.product.symbol}!')
+                gain = order.transaction.realized_gain.gain
+                messages.success(
+                    request,
+                    f'Successfully sold {quantity} shares of {holding.product.symbol} '
+                    f'({"gain" if gain >= 0 else "loss"} of {abs(gain)})!'
+                )
             return redirect('investments:portfolio_detail', pk=holding.portfolio.pk)
 
         except Exception as e:
@@ -275,3 +220,70 @@ def sell_investment(request, holding_id):
         'holding': holding,
     }
     return render(request, 'investments/sell_investment.html', context)
+
+
+def _parse_cash(value):
+    """Cash to invest on top of sale proceeds, raises ValueError unless it is a non-negative amount"""
+    try:
+        cash = Decimal(value or '0')
+    except InvalidOperation:
+        raise ValueError('Invalid cash amount')
+    if not cash.is_finite():
+        raise ValueError('Invalid cash amount')
+    if cash < 0:
+        raise ValueError('Cash to invest cannot be negative')
+    return cash
+
+
+@login_required
+def rebalance_portfolio(request, pk):
+    """Set target allocations and rebalance a portfolio to them"""
+    portfolio = get_object_or_404(Portfolio.objects.select_related('account'), pk=pk, user=request.user)
+
+    if request.method == 'POST':
+        try:
+            if request.POST.get('action') == 'targets':
+                set_targets(portfolio, {
+                    int(name[len('weight_'):]): Decimal(value or '0')
+                    for name, value in request.POST.items() if name.startswith('weight_')
+                })
+                messages.success(request, 'Target allocation saved.')
+                return redirect('investments:rebalance_portfolio', pk=pk)
+
+            try:
+                cash = _parse_cash(request.POST.get('cash'))
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('investments:rebalance_portfolio', pk=pk)
+            plan, report = rebalance(portfolio, cash=cash, tolerance=DEFAULT_TOLERANCE)
+            if report is None:
+                messages.info(request, 'Portfolio is already within its target allocation.')
+            else:
+                messages.success(request, f'Rebalanced with {report.filled} trades.')
+            return redirect('investments:portfolio_detail', pk=pk)
+
+        except Exception as e:
+            messages.error(request, f'Error rebalancing portfolio: {str(e)}')
+            return redirect('investments:rebalance_portfolio', pk=pk)
+
+    targets = dict(portfolio.targets.values_list('product_id', 'weight'))
+    weights = current_weights(portfolio)
+    products = list(InvestmentProduct.objects.filter(
+        Q(is_active=True) | Q(pk__in=targets.keys() | weights.keys())
+    ))
+    for product in products:
+        product.target_weight = targets.get(product.pk)
+        product.current_weight = weights.get(product.pk)
+
+    try:
+        cash = _parse_cash(request.GET.get('cash'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    context = {
+        'portfolio': portfolio,
+        'products': products,
+        'plan': plan_rebalance(portfolio, cash=cash),
+        'tolerance': DEFAULT_TOLERANCE,
+    }
+    return render(request, 'investments/rebalance_portfolio.html', context)
+
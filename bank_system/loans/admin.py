@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import LoanProduct, Loan, LoanPayment
+from .models import LoanProduct, Loan, LoanPayment, LoanBookRollup, LoanPreApproval
 
 @admin.register(LoanProduct)
 class LoanProductAdmin(admin.ModelAdmin):
@@ -53,7 +53,24 @@ class LoanAdmin(admin.ModelAdmin):
 
 @admin.register(LoanPayment)
 class LoanPaymentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'loan', 'amount', 'is_paid', 'payment_date')
+    list_display = ('id', 'loan', 'installment', 'amount', 'principal', 'interest', 'balance_after', 'is_paid', 'payment_date')
     list_filter = ('is_paid', 'payment_date')
     search_fields = ('loan__id', 'loan__user__username')
     readonly_fields = ('payment_date',)
+
+
+@admin.register(LoanBookRollup)
+class LoanBookRollupAdmin(admin.ModelAdmin):
+    list_display = ('loan_type', 'status', 'bucket', 'loans', 'outstanding', 'overdue', 'interest_income', 'updated_at')
+    list_filter = ('loan_type', 'status', 'bucket')
+    # Maintained by loans.rollups, edits here would only be overwritten
+    readonly_fields = ('loan_type', 'status', 'bucket', 'loans', 'principal', 'outstanding', 'overdue',
+                       'interest_income', 'collected', 'updated_at')
+
+
+@admin.register(LoanPreApproval)
+class LoanPreApprovalAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'amount', 'term', 'monthly_payment', 'expires_at')
+    list_filter = ('product',)
+    search_fields = ('user__username',)
+    list_select_related = ('user', 'product')
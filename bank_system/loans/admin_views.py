@@ -0,0 +1,31 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.shortcuts import render
+
+from .models import LoanBookRollup, LoanProduct
+from .rollups import BUCKETS, book_summary, loss_rates
+from users.decorators import manager_required
+
+
+@manager_required
+def loan_book(request):
+    """Aging, exposure and expected loss of the loan book, read from the rollup"""
+    summary = book_summary()
+    loan_types = dict(LoanProduct.LOAN_TYPES)
+    rates = loss_rates()
+    context = {
+        'summary': summary,
+        'buckets': [(bucket, rates.get(bucket, 0), summary.by_bucket[bucket]) for bucket, _ in BUCKETS],
+        'exposure': [(loan_types.get(loan_type, loan_type), line) for loan_type, line in summary.by_type.items()],
+        'updated_at': LoanBookRollup.objects.aggregate(latest=Max('updated_at'))['latest'],
+        'aging_data_json': json.dumps(
+            {bucket: line.outstanding for bucket, line in summary.by_bucket.items()}, cls=DjangoJSONEncoder
+        ),
+        'exposure_data_json': json.dumps(
+            {loan_types.get(loan_type, loan_type): line.outstanding for loan_type, line in summary.by_type.items()},
+            cls=DjangoJSONEncoder,
+        ),
+    }
+    return render(request, 'admin/loan_book.html', context)
@@ -0,0 +1,176 @@
+"""
+Loan amortization
+
+Schedules are computed for many loans at once as loans x periods NumPy
+arrays in integer cents. The level payment is
+
+    payment = principal * r / (1 - (1 + r) ** -n)
+
+rounded to the cent, with r the monthly rate. Each period charges interest
+on the balance left, rounded to the cent, and the rest of the payment
+repays principal. The recurrence runs period by period but across every
+loan at once, so a batch costs one vector step per month of its longest
+loan. The last period repays whatever balance is left, so principal
+payments always add up to the amount borrowed exactly.
+
+write_schedules() turns schedules into LoanPayment rows with bulk_create,
+one row per installment, due monthly from disbursement.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from core.batch import chunked
+from core.dates import add_months
+from .models import Loan, LoanPayment
+
+DEFAULT_CHUNK_SIZE = 5000
+# Loans whose repayments are due
+SCHEDULED_STATUSES = ('approved', 'active')
+
+Schedule = namedtuple('Schedule', ['payment', 'interest', 'principal', 'balance'])
+Installment = namedtuple('Installment', ['installment', 'due_date', 'payment', 'interest', 'principal', 'balance'])
+
+
+def _cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def payment_cents(principal, annual_rate, terms):
+    """Level monthly payments in cents for arrays of principals (cents), annual rates (percent) and terms"""
+    principal = np.asarray(principal, dtype=np.float64)
+    rate = np.asarray(annual_rate, dtype=np.float64) / 1200
+    terms = np.asarray(terms, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # -expm1(-n * log1p(r)) is 1 - (1 + r) ** -n without losing precision for small rates
+        level = principal * rate / -np.expm1(-terms * np.log1p(rate))
+    level = np.where(rate > 0, level, principal / terms)
+    return np.floor(level + 0.5).astype(np.int64)
+
+
+def monthly_payment(principal, annual_rate, terms):
+    """Level monthly payment of one loan as a Decimal"""
+    return _from_cents(payment_cents([_cents(principal)], [float(annual_rate)], [terms])[0])
+
+
+def amortize(principal, annual_rate, terms):
+    """
+    Schedule of loans given as arrays of principals (cents), annual rates
+    (percent) and terms (months). Every Schedule field is a loans x periods
+    int64 array in cents, zero after a loan's last period.
+    """
+    principal = np.asarray(principal, dtype=np.int64)
+    rate = np.asarray(annual_rate, dtype=np.float64) / 1200
+    terms = np.asarray(terms, dtype=np.int64)
+    level = payment_cents(principal, annual_rate, terms)
+    periods = int(terms.max()) if len(terms) else 0
+
+    shape = (len(principal), periods)
+    payment, interest, repaid, balance = (np.zeros(shape, dtype=np.int64) for _ in range(4))
+    left = principal.copy()
+    for period in range(periods):
+        running = period < terms
+        charged = np.floor(left * rate + 0.5).astype(np.int64)
+        # The final period clears the balance, absorbing every rounding cent
+        part = np.where(period == terms - 1, left, np.clip(level - charged, 0, left))
+        charged[~running] = 0
+        part[~running] = 0
+        left -= part
+        interest[:, period] = charged
+        repaid[:, period] = part
+        payment[:, period] = charged + part
+        balance[:, period] = left
+    return Schedule(payment, interest, repaid, balance)
+
+
+def _start(loan):
+    return loan.disbursement_date or loan.approval_date or loan.application_date
+
+
+def due_dates(start, terms):
+    """Monthly due dates after `start`, on the same local day and time"""
+    start = timezone.localtime(start)
+    return [
+        datetime.combine(add_months(start.date(), month), start.timetz()) for month in range(1, terms + 1)
+    ]
+
+
+def loan_schedule(loan):
+    """Installments of one loan, in Decimals, reconciled exactly against its principal"""
+    schedule = amortize([_cents(loan.principal_amount)], [float(loan.interest_rate)], [loan.loan_term])
+    return [
+        Installment(
+            period + 1, due, _from_cents(schedule.payment[0, period]), _from_cents(schedule.interest[0, period]),
+            _from_cents(schedule.principal[0, period]), _from_cents(schedule.balance[0, period]),
+        )
+        for period, due in enumerate(due_dates(_start(loan), loan.loan_term))
+    ]
+
+
+def book_schedules(loans, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (loan ids, terms, Schedule) for `loans` (a queryset) a chunk at a
+    time, so the arrays of a large book never have to fit in memory at once.
+    """
+    rows = (
+        loans.filter(loan_term__gt=0)
+        .order_by('pk')
+        .values_list('pk', 'principal_amount', 'interest_rate', 'loan_term')
+    )
+    for chunk in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+        ids = np.array([row[0] for row in chunk], dtype=np.int64)
+        terms = np.array([row[3] for row in chunk], dtype=np.int64)
+        schedule = amortize(
+            [_cents(row[1]) for row in chunk], [float(row[2]) for row in chunk], terms,
+        )
+        yield ids, terms, schedule
+
+
+def write_schedules(loans, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=2000):
+    """
+    Write LoanPayment rows for every installment of `loans` (a queryset) and
+    set their monthly_payment and maturity_date. Installments that already
+    exist are left alone, so paid rows are never touched and reruns only fill
+    gaps. Returns (loans scheduled, installment rows offered).
+    """
+    scheduled = offered = 0
+    for ids, terms, schedule in book_schedules(loans, chunk_size):
+        starts = {
+            pk: disbursed or approved or applied
+            for pk, disbursed, approved, applied in Loan.objects.filter(pk__in=ids.tolist()).values_list(
+                'pk', 'disbursement_date', 'approval_date', 'application_date'
+            )
+        }
+
+        payments, updates = [], []
+        for row, (loan_id, term) in enumerate(zip(ids.tolist(), terms.tolist())):
+            dates = due_dates(starts[loan_id], term)
+            payments.extend(
+                LoanPayment(
+                    loan_id=loan_id, installment=period + 1, payment_date=dates[period], is_paid=False,
+                    amount=_from_cents(schedule.payment[row, period]),
+                    interest=_from_cents(schedule.interest[row, period]),
+                    principal=_from_cents(schedule.principal[row, period]),
+                    balance_after=_from_cents(schedule.balance[row, period]),
+                )
+                for period in range(term)
+            )
+            updates.append(Loan(
+                pk=loan_id, monthly_payment=_from_cents(schedule.payment[row, 0]), maturity_date=dates[-1],
+            ))
+
+        with transaction.atomic():
+            LoanPayment.objects.bulk_create(payments, batch_size=batch_size, ignore_conflicts=True)
+            Loan.objects.bulk_update(updates, ['monthly_payment', 'maturity_date'], batch_size=batch_size)
+        scheduled += len(updates)
+        offered += len(payments)
+    return scheduled, offered
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from loans.amortization import DEFAULT_CHUNK_SIZE, SCHEDULED_STATUSES, write_schedules
+from loans.models import Loan
+
+
+class Command(BaseCommand):
+    help = 'Write amortization schedules (LoanPayment installments) for approved and active loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Loans per batch')
+        parser.add_argument('--loan', type=int, action='append', help='Only this loan id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        loans = Loan.objects.filter(status__in=SCHEDULED_STATUSES)
+        if options['loan']:
+            loans = loans.filter(pk__in=options['loan'])
+        scheduled, offered = write_schedules(loans, chunk_size=options['chunk_size'])
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Scheduled {scheduled} loans ({offered} installments, existing ones kept) in {elapsed:.2f}s'
+        ))
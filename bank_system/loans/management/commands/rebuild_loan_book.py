@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loans.rollups import DEFAULT_CHUNK_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute every loan book position and rebuild the rollup from them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Loans per id range')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        loans = rebuild(chunk_size=options['chunk_size'], workers=options['workers'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {loans} loans in {elapsed:.2f}s'))
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime, time as day_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from loans.servicing import DEFAULT_CHUNK_SIZE, default_after_days, service_loans
+
+
+class Command(BaseCommand):
+    help = 'Collect due loan installments from linked accounts and complete or default loans (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Collect installments due by the end of YYYY-MM-DD (defaults to now)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Loans per id range')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--default-after', type=int, help='Days overdue before a loan defaults')
+
+    def handle(self, *args, **options):
+        as_of = timezone.now()
+        if options['as_of']:
+            day = parse_date(options['as_of'])
+            if day is None:
+                raise CommandError('--as-of must look like YYYY-MM-DD')
+            as_of = timezone.make_aware(datetime.combine(day, day_time.max))
+        default_after = options['default_after']
+        if default_after is None:
+            default_after = default_after_days()
+
+        self.stdout.write(self.style.WARNING(f'Servicing loans due by {as_of:%Y-%m-%d %H:%M}...'))
+        started = time.perf_counter()
+        report = service_loans(
+            as_of, chunk_size=options['chunk_size'], workers=options['workers'], default_after=default_after,
+        )
+        elapsed = time.perf_counter() - started
+        rate = report.installments / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{report.loans} active loans checked, {report.installments} installments collected '
+            f'(${report.collected}), {report.missed} missed'
+        )
+        self.stdout.write(f'{report.completed} loans completed, {report.defaulted} defaulted')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {elapsed:.2f}s ({rate:,.0f} installments/s, {report.loans / elapsed if elapsed else 0:,.0f} loans/s)'
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0001_initial"),
+        ("transactions", "0004_transaction_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loanpayment",
+            name="balance_after",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Balance left once this payment is made",
+                max_digits=12,
+            ),
+        ),
+        migrations.AddField(
+            model_name="loanpayment",
+            name="installment",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="Period number in the amortization schedule",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="loanpayment",
+            name="interest",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="loanpayment",
+            name="principal",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="loanpayment",
+            name="payment_date",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Due date for scheduled installments",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="loanpayment",
+            constraint=models.UniqueConstraint(fields=("loan", "installment"), name="unique_loan_installment"),
+        ),
+    ]
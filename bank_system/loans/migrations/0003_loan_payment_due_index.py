@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0002_loan_schedules"),
+        ("transactions", "0004_transaction_archive"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="loanpayment",
+            index=models.Index(fields=["is_paid", "payment_date"], name="loanpayment_due_idx"),
+        ),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0003_loan_payment_due_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoanPosition",
+            fields=[
+                (
+                    "loan",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="position",
+                        serialize=False,
+                        to="loans.loan",
+                    ),
+                ),
+                (
+                    "loan_type",
+                    models.CharField(
+                        choices=[
+                            ("personal", "Personal Loan"),
+                            ("auto", "Auto Loan"),
+                            ("home", "Home Loan"),
+                            ("education", "Education Loan"),
+                            ("business", "Business Loan"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending Approval"),
+                            ("approved", "Approved"),
+                            ("active", "Active"),
+                            ("completed", "Completed"),
+                            ("rejected", "Rejected"),
+                            ("defaulted", "Defaulted"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.CharField(
+                        help_text="Aging bucket of the oldest overdue installment",
+                        max_length=10,
+                    ),
+                ),
+                ("days_past_due", models.IntegerField(default=0)),
+                (
+                    "principal",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "outstanding",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "overdue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "interest_income",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "collected",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LoanBookRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "loan_type",
+                    models.CharField(
+                        choices=[
+                            ("personal", "Personal Loan"),
+                            ("auto", "Auto Loan"),
+                            ("home", "Home Loan"),
+                            ("education", "Education Loan"),
+                            ("business", "Business Loan"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending Approval"),
+                            ("approved", "Approved"),
+                            ("active", "Active"),
+                            ("completed", "Completed"),
+                            ("rejected", "Rejected"),
+                            ("defaulted", "Defaulted"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("bucket", models.CharField(max_length=10)),
+                ("loans", models.IntegerField(default=0)),
+                (
+                    "principal",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                (
+                    "outstanding",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                (
+                    "overdue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                (
+                    "interest_income",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                (
+                    "collected",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["loan_type", "status", "bucket"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("loan_type", "status", "bucket"),
+                        name="unique_loan_book_rollup",
+                    )
+                ],
+            },
+        ),
+    ]
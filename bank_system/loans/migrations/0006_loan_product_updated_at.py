@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0005_loan_preapprovals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="loanproduct",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -25,6 +25,7 @@ class LoanProduct(models.Model):
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name}"
@@ -68,22 +69,23 @@ class Loan(models.Model):
         ordering = ['-application_date']
 
     def calculate_monthly_payment(self):
-        """Calculate EMI (Equated Monthly Installment)"""
-        if self.principal_amount and self.loan_term and self.interest_rate:
-            monthly_rate = self.interest_rate / 12 / 100
-            n = self.loan_term
-            if monthly_rate == 0:
-                return self.principal_amount / n
-            else:
-                return self.principal_amount * (monthly_rate * (1 + monthly_rate) ** n) / ((1 + monthly_rate) ** n - 1)
+        """Calculate EMI (Equated Monthly Installment), rounded to the cent as the schedule charges it"""
+        from .amortization import monthly_payment
+
+        if self.principal_amount and self.loan_term:
+            return monthly_payment(self.principal_amount, self.interest_rate or 0, self.loan_term)
         return 0
 
 
 class LoanPayment(models.Model):
     """Track loan payments"""
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='payments')
+    installment = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Period number in the amortization schedule")
     amount = models.DecimalField(max_digits=12, decimal_places=2)
-    payment_date = models.DateTimeField(auto_now_add=True)
+    principal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    interest = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Balance left once this payment is made")
+    payment_date = models.DateTimeField(default=timezone.now, help_text="Due date for scheduled installments")
     is_paid = models.BooleanField(default=False)
     paid_date = models.DateTimeField(null=True, blank=True)
     transaction = models.OneToOneField('transactions.Transaction', on_delete=models.SET_NULL, null=True, blank=True)
@@ -93,3 +95,72 @@ class LoanPayment(models.Model):
 
     class Meta:
         ordering = ['payment_date']
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'installment'], name='unique_loan_installment'),
+        ]
+        indexes = [
+            # Due installments for the servicing batch (see loans.servicing)
+            models.Index(fields=['is_paid', 'payment_date'], name='loanpayment_due_idx'),
+        ]
+
+
+class LoanPosition(models.Model):
+    """A loan's last contribution to the loan book rollup (see loans.rollups)"""
+    loan = models.OneToOneField(Loan, on_delete=models.CASCADE, primary_key=True, related_name='position')
+    loan_type = models.CharField(max_length=20, choices=LoanProduct.LOAN_TYPES)
+    status = models.CharField(max_length=20, choices=Loan.STATUS_CHOICES)
+    bucket = models.CharField(max_length=10, help_text="Aging bucket of the oldest overdue installment")
+    days_past_due = models.IntegerField(default=0)
+    principal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overdue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    interest_income = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Loan #{self.loan_id} in {self.loan_type}/{self.status}/{self.bucket}"
+
+
+class LoanBookRollup(models.Model):
+    """Loan book totals for one loan type, status and aging bucket"""
+    loan_type = models.CharField(max_length=20, choices=LoanProduct.LOAN_TYPES)
+    status = models.CharField(max_length=20, choices=Loan.STATUS_CHOICES)
+    bucket = models.CharField(max_length=10)
+    loans = models.IntegerField(default=0)
+    principal = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    overdue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    interest_income = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    collected = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.loan_type}/{self.status}/{self.bucket}: {self.loans} loans"
+
+    class Meta:
+        ordering = ['loan_type', 'status', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['loan_type', 'status', 'bucket'], name='unique_loan_book_rollup'),
+        ]
+
+
+class LoanPreApproval(models.Model):
+    """The largest amount of a product a customer could borrow, from the pre-approval batch (see loans.pricing)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loan_preapprovals')
+    product = models.ForeignKey(LoanProduct, on_delete=models.CASCADE, related_name='preapprovals')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    term = models.IntegerField(help_text="Loan term in months")
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    monthly_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.product.name} up to {self.amount}"
+
+    class Meta:
+        ordering = ['user', '-amount']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_loan_preapproval'),
+        ]
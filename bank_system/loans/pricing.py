@@ -0,0 +1,236 @@
+"""
+Loan quotes and affordability
+
+quote_grid() prices every active LoanProduct for a grid of amounts and
+terms in one vectorized loans.amortization.amortize() call, so the monthly
+payment and the total interest of each offer match the schedule the loan
+would be booked with, to the cent. Combinations outside a product's amount
+or term range are not offered. Grids are memoized per product version, the
+count and latest updated_at of the products read in one aggregate query:
+saving, adding or deleting a product moves it when the change commits, and
+every process prices with the new rows on its next quote.
+
+affordability() reads, for any number of customers in one query, the
+balance of their active accounts (summing the shards of hot accounts) and
+the monthly payments of their approved and active loans. A customer should
+keep LOAN_RESERVE_MONTHS of debt service in their accounts, so the most a
+new loan may add is
+
+    max_payment = balance / reserve months - existing payments
+
+and customers with a defaulted loan are offered nothing.
+
+preapprove() turns that into LoanPreApproval rows for every active
+customer: the largest amount of each product they can afford over its
+longest term. Customers are processed in parallel id ranges and each range
+replaces its own pre-approvals, so the batch can be rerun at any time.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, Exists, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.balances import live_balance
+from accounts.models import Account
+from core.batch import id_ranges, run_in_processes
+from .amortization import amortize, payment_cents
+from .models import Loan, LoanPreApproval, LoanProduct
+
+MAX_QUOTE_VALUES = 10
+# Largest amount a LoanProduct can lend (max_digits=12) and longest term quoted, in months
+MAX_QUOTE_AMOUNT = Decimal('9999999999.99')
+MAX_QUOTE_TERM = 600
+DEFAULT_RESERVE_MONTHS = 6
+DEFAULT_CHUNK_SIZE = 2000
+PREAPPROVAL_DAYS = 30
+# Loans whose monthly payments the customer already owes
+DEBT_SERVICE_STATUSES = ('approved', 'active')
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal('0.01')
+
+QuoteGrid = namedtuple('QuoteGrid', ['products', 'amounts', 'terms', 'payment', 'interest', 'offered'])
+Quote = namedtuple(
+    'Quote', ['product_id', 'product', 'loan_type', 'interest_rate', 'amount', 'term', 'monthly_payment',
+              'total_interest', 'total_cost']
+)
+Affordability = namedtuple('Affordability', ['balance', 'debt_service', 'has_default', 'max_payment'])
+PreapprovalReport = namedtuple('PreapprovalReport', ['customers', 'approved', 'offers'])
+
+
+def _cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def reserve_months():
+    return getattr(settings, 'LOAN_RESERVE_MONTHS', DEFAULT_RESERVE_MONTHS)
+
+
+def product_version():
+    """Version of the committed products: a delete lowers the count, anything else saved moves updated_at"""
+    stamp = LoanProduct.objects.aggregate(products=Count('pk'), changed=Max('updated_at'))
+    return stamp['products'], stamp['changed']
+
+
+def _active_products():
+    return tuple(
+        LoanProduct.objects.filter(is_active=True)
+        .order_by('pk')
+        .values_list('pk', 'name', 'loan_type', 'interest_rate', 'min_amount', 'max_amount', 'min_term', 'max_term')
+    )
+
+
+@lru_cache(maxsize=128)
+def _quote_grid(version, amounts, terms):
+    """QuoteGrid of the products of `version`, its arrays are products x amounts x terms and read-only"""
+    products = _active_products()
+    shape = (len(products), len(amounts), len(terms))
+    rates = np.array([float(product[3]) for product in products], dtype=np.float64)[:, None, None]
+    principal = np.array([_cents(amount) for amount in amounts], dtype=np.int64)[None, :, None]
+    months = np.array(terms, dtype=np.int64)[None, None, :]
+    low = np.array([_cents(product[4]) for product in products], dtype=np.int64)[:, None, None]
+    high = np.array([_cents(product[5]) for product in products], dtype=np.int64)[:, None, None]
+    shortest = np.array([product[6] for product in products], dtype=np.int64)[:, None, None]
+    longest = np.array([product[7] for product in products], dtype=np.int64)[:, None, None]
+    offered = (principal >= low) & (principal <= high) & (months >= shortest) & (months <= longest)
+
+    payment, interest = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+    if offered.any():
+        # Only the offered cells are amortized, as one batch of loans
+        schedule = amortize(*(np.broadcast_to(array, shape)[offered] for array in (principal, rates, months)))
+        payment[offered] = schedule.payment[:, 0]
+        interest[offered] = schedule.interest.sum(axis=1)
+    for array in (payment, interest, offered):
+        array.flags.writeable = False
+    return QuoteGrid(products, amounts, terms, payment, interest, offered)
+
+
+def quote_grid(amounts, terms):
+    """Memoized QuoteGrid for every active product at each amount and term"""
+    return _quote_grid(
+        product_version(), tuple(Decimal(amount) for amount in amounts), tuple(int(term) for term in terms),
+    )
+
+
+def quotes(grid, max_payment=None):
+    """The offers in `grid` as Quotes, only those with a monthly payment up to `max_payment` if given"""
+    offered = grid.offered
+    if max_payment is not None:
+        offered = offered & (grid.payment <= _cents(max_payment))
+    results = []
+    for product, amount, term in zip(*np.nonzero(offered)):
+        pk, name, loan_type, rate = grid.products[product][:4]
+        payment = _from_cents(grid.payment[product, amount, term])
+        interest = _from_cents(grid.interest[product, amount, term])
+        results.append(Quote(
+            pk, name, loan_type, rate, grid.amounts[amount], grid.terms[term], payment, interest,
+            grid.amounts[amount] + interest,
+        ))
+    return results
+
+
+def affordability(user_ids):
+    """{user_id: Affordability} for `user_ids`, read with a single query"""
+    balances = (
+        Account.objects.filter(user=OuterRef('pk'), is_active=True)
+        .order_by()
+        .values('user')
+        .annotate(total=Sum(live_balance()))
+        .values('total')
+    )
+    payments = (
+        Loan.objects.filter(user=OuterRef('pk'), status__in=DEBT_SERVICE_STATUSES)
+        .order_by()
+        .values('user')
+        .annotate(total=Sum('monthly_payment'))
+        .values('total')
+    )
+    rows = (
+        get_user_model().objects.filter(pk__in=user_ids)
+        .annotate(
+            balance=Coalesce(Subquery(balances), Value(Decimal('0.00')), output_field=MONEY),
+            debt_service=Coalesce(Subquery(payments), Value(Decimal('0.00')), output_field=MONEY),
+            has_default=Exists(Loan.objects.filter(user=OuterRef('pk'), status='defaulted')),
+        )
+        .values_list('pk', 'balance', 'debt_service', 'has_default')
+    )
+    months = reserve_months()
+    result = {}
+    for pk, balance, debt_service, has_default in rows:
+        # Sums can come back without their scale (SQLite), amounts are reported in cents
+        balance, debt_service = balance.quantize(CENT), debt_service.quantize(CENT)
+        room = Decimal(0) if has_default else max(balance / months - debt_service, Decimal(0))
+        result[pk] = Affordability(balance, debt_service, has_default, room.quantize(CENT, rounding=ROUND_DOWN))
+    return result
+
+
+def max_principal(max_payment, annual_rate, terms):
+    """Largest principals in cents whose level payment fits `max_payment` (cents), vectorized"""
+    max_payment = np.asarray(max_payment, dtype=np.float64)
+    rate = np.asarray(annual_rate, dtype=np.float64) / 1200
+    terms = np.asarray(terms, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(rate > 0, -np.expm1(-terms * np.log1p(rate)) / rate, terms)
+    return np.floor(max_payment * factor).astype(np.int64)
+
+
+def preapprove_chunk(start_id, end_id, expires_at):
+    """Worker: replace the pre-approvals of customers with start_id <= pk < end_id"""
+    customers = list(
+        get_user_model().objects.filter(pk__gte=start_id, pk__lt=end_id, role='customer', is_active=True)
+        .values_list('pk', flat=True)
+    )
+    products = _active_products()
+    offers = []
+    if customers and products:
+        room = affordability(customers)
+        budget = np.array([_cents(room[pk].max_payment) for pk in customers], dtype=np.int64)[:, None]
+        rates = np.array([float(product[3]) for product in products])[None, :]
+        low = np.array([_cents(product[4]) for product in products])[None, :]
+        high = np.array([_cents(product[5]) for product in products])[None, :]
+        terms = np.array([product[7] for product in products])[None, :]
+
+        # Whole currency units only, so the rounded payment never exceeds the budget
+        amounts = np.minimum(max_principal(budget, rates, terms) // 100 * 100, high)
+        payments = payment_cents(amounts, rates, terms)
+        approved = (amounts >= low) & (amounts > 0) & (payments <= budget)
+        for row, column in zip(*np.nonzero(approved)):
+            product = products[column]
+            offers.append(LoanPreApproval(
+                user_id=customers[row], product_id=product[0], amount=_from_cents(amounts[row, column]),
+                term=product[7], interest_rate=product[3], monthly_payment=_from_cents(payments[row, column]),
+                expires_at=expires_at,
+            ))
+
+    with transaction.atomic():
+        LoanPreApproval.objects.filter(user_id__gte=start_id, user_id__lt=end_id).delete()
+        LoanPreApproval.objects.bulk_create(offers)
+    return PreapprovalReport(len(customers), len({offer.user_id for offer in offers}), len(offers))
+
+
+def preapprove(chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Pre-approve every active customer for what they can afford, returns a PreapprovalReport"""
+    expires_at = timezone.now() + timedelta(days=PREAPPROVAL_DAYS)
+    tasks = [
+        (start, end, expires_at)
+        for start, end in id_ranges(get_user_model().objects.filter(role='customer'), chunk_size)
+    ]
+    if connection.vendor == 'sqlite':
+        # SQLite allows a single writer, parallel chunks would only fail with "database is locked"
+        workers = 1
+    totals = [0, 0, 0]
+    for report in run_in_processes(preapprove_chunk, tasks, workers):
+        totals = [total + value for total, value in zip(totals, report)]
+    return PreapprovalReport(*totals)
@@ -0,0 +1,212 @@
+"""
+Loan book rollups
+
+LoanBookRollup keeps the loan book summed by loan type, status and aging
+bucket (how far past due a loan's oldest unpaid installment is), so the
+admin pages read a few dozen rows instead of scanning loans and their
+payments. Each loan's share of those sums is stored as its LoanPosition.
+
+refresh_positions() recomputes the positions of some loans from Loan and
+LoanPayment with two grouped queries and adds the difference between the
+new and the stored positions to the rollup rows, so the rollup follows any
+change, in any order, without being rebuilt. The servicing batch refreshes
+every loan it visits each night, which is also how loans move from one
+aging bucket to the next; saving a loan or a payment refreshes that loan
+once the change is committed.
+
+rebuild() recomputes every position in parallel id ranges and replaces the
+rollup with their totals, for the first backfill or after a loan type
+changes. It should not overlap a servicing run.
+
+Expected losses are not stored: book_summary() applies
+LOAN_EXPECTED_LOSS_RATES to the outstanding balance of each bucket, so new
+rates take effect immediately.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Min, Q, Sum
+from django.utils import timezone
+
+from core.batch import id_ranges, run_in_processes
+from .models import Loan, LoanBookRollup, LoanPayment, LoanPosition
+
+DEFAULT_CHUNK_SIZE = 5000
+# (bucket, most days past due it holds), oldest last
+BUCKETS = (('current', 0), ('1-30', 30), ('31-60', 60), ('61-90', 90), ('90+', None))
+# Statuses whose outstanding balance is money lent out
+EXPOSED_STATUSES = ('active', 'defaulted')
+# Share of the outstanding balance expected to be lost, by bucket
+DEFAULT_LOSS_RATES = {'current': 0.01, '1-30': 0.05, '31-60': 0.15, '61-90': 0.35, '90+': 0.75}
+METRICS = ('loans', 'principal', 'outstanding', 'overdue', 'interest_income', 'collected')
+
+BookSummary = namedtuple(
+    'BookSummary', ['loans', 'outstanding', 'overdue', 'interest_income', 'expected_loss', 'by_bucket', 'by_type']
+)
+BookLine = namedtuple('BookLine', ['loans', 'outstanding', 'overdue', 'expected_loss'])
+
+
+def loss_rates():
+    return getattr(settings, 'LOAN_EXPECTED_LOSS_RATES', DEFAULT_LOSS_RATES)
+
+
+def aging_bucket(days_past_due):
+    for bucket, most in BUCKETS:
+        if most is None or days_past_due <= most:
+            return bucket
+
+
+def compute_positions(loan_ids, as_of=None):
+    """Unsaved LoanPosition rows for the loans in `loan_ids` as of `as_of`"""
+    as_of = as_of or timezone.now()
+    due = Q(is_paid=False, payment_date__lte=as_of)
+    payments = {
+        row['loan_id']: row
+        for row in LoanPayment.objects.filter(loan_id__in=loan_ids)
+        .order_by()
+        .values('loan_id')
+        .annotate(
+            overdue=Sum('amount', filter=due),
+            oldest=Min('payment_date', filter=due),
+            interest_income=Sum('interest', filter=Q(is_paid=True)),
+        )
+    }
+    loans = Loan.objects.filter(pk__in=loan_ids).values_list(
+        'pk', 'product__loan_type', 'status', 'principal_amount', 'remaining_balance', 'total_paid'
+    )
+    positions = []
+    for pk, loan_type, status, principal, outstanding, collected in loans:
+        row = payments.get(pk, {})
+        days = (as_of - row['oldest']).days if row.get('oldest') else 0
+        positions.append(LoanPosition(
+            loan_id=pk, loan_type=loan_type, status=status, bucket=aging_bucket(days), days_past_due=days,
+            principal=principal, outstanding=outstanding, overdue=row.get('overdue') or 0,
+            interest_income=row.get('interest_income') or 0, collected=collected,
+        ))
+    return positions
+
+
+def _key(position):
+    return position.loan_type, position.status, position.bucket
+
+
+def _add(totals, position, sign=1):
+    vector = totals.setdefault(_key(position), [0] * len(METRICS))
+    vector[0] += sign
+    for column, metric in enumerate(METRICS[1:], start=1):
+        vector[column] += sign * getattr(position, metric)
+
+
+def _apply(deltas):
+    """Add {(loan_type, status, bucket): metric deltas} to the rollup rows"""
+    now = timezone.now()
+    # Rows are locked in key order so concurrent refreshes cannot deadlock
+    for key in sorted(deltas):
+        delta = deltas[key]
+        if not any(delta):
+            continue
+        loan_type, status, bucket = key
+        row, _ = LoanBookRollup.objects.get_or_create(loan_type=loan_type, status=status, bucket=bucket)
+        LoanBookRollup.objects.filter(pk=row.pk).update(
+            updated_at=now, **{metric: F(metric) + value for metric, value in zip(METRICS, delta)}
+        )
+
+
+def refresh_positions(loan_ids, as_of=None):
+    """Bring the positions of `loan_ids`, and with them the rollup, up to date"""
+    loan_ids = sorted(set(loan_ids))
+    if not loan_ids:
+        return
+    with transaction.atomic():
+        # Locking the loans keeps two refreshes of the same loan from both adding it
+        list(Loan.objects.select_for_update().filter(pk__in=loan_ids).order_by('pk').values_list('pk'))
+        stored = LoanPosition.objects.filter(loan_id__in=loan_ids).in_bulk()
+        positions = compute_positions(loan_ids, as_of)
+        deltas = {}
+        for position in stored.values():
+            _add(deltas, position, -1)
+        for position in positions:
+            _add(deltas, position)
+        LoanPosition.objects.bulk_create(
+            positions, update_conflicts=True, unique_fields=['loan'],
+            update_fields=['loan_type', 'status', 'bucket', 'days_past_due', *METRICS[1:]],
+        )
+        _apply(deltas)
+
+
+def drop_positions(loan_ids):
+    """Take loans that are about to be deleted out of the rollup"""
+    with transaction.atomic():
+        stored = LoanPosition.objects.select_for_update().filter(loan_id__in=loan_ids)
+        deltas = {}
+        for position in stored:
+            _add(deltas, position, -1)
+        stored.delete()
+        _apply(deltas)
+
+
+def rebuild_chunk(start_id, end_id, as_of):
+    """Worker: recompute positions of loans with start_id <= pk < end_id, returns their rollup totals"""
+    with transaction.atomic():
+        loan_ids = list(Loan.objects.filter(pk__gte=start_id, pk__lt=end_id).values_list('pk', flat=True))
+        positions = compute_positions(loan_ids, as_of)
+        LoanPosition.objects.filter(loan_id__gte=start_id, loan_id__lt=end_id).delete()
+        LoanPosition.objects.bulk_create(positions)
+    totals = {}
+    for position in positions:
+        _add(totals, position)
+    return totals
+
+
+def rebuild(as_of=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Recompute every position and replace the rollup, returns the number of loans"""
+    as_of = as_of or timezone.now()
+    tasks = [(start, end, as_of) for start, end in id_ranges(Loan.objects.all(), chunk_size)]
+    if connection.vendor == 'sqlite':
+        # SQLite allows a single writer, parallel chunks would only fail with "database is locked"
+        workers = 1
+    totals = {}
+    for chunk in run_in_processes(rebuild_chunk, tasks, workers):
+        for key, vector in chunk.items():
+            merged = totals.setdefault(key, [0] * len(METRICS))
+            totals[key] = [total + value for total, value in zip(merged, vector)]
+
+    with transaction.atomic():
+        LoanBookRollup.objects.all().delete()
+        LoanBookRollup.objects.bulk_create([
+            LoanBookRollup(loan_type=loan_type, status=status, bucket=bucket, **dict(zip(METRICS, vector)))
+            for (loan_type, status, bucket), vector in sorted(totals.items())
+        ])
+    return sum(vector[0] for vector in totals.values())
+
+
+def book_summary():
+    """BookSummary of the loans lent out, and interest earned on all loans, from the rollup rows"""
+    rates = loss_rates()
+    rows = LoanBookRollup.objects.filter(loans__gt=0)
+    by_bucket = {bucket: [0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')] for bucket, _ in BUCKETS}
+    by_type = {}
+    interest_income = Decimal('0.00')
+    for row in rows:
+        interest_income += row.interest_income
+        if row.status not in EXPOSED_STATUSES:
+            continue
+        loss = (row.outstanding * Decimal(str(rates.get(row.bucket, 0)))).quantize(Decimal('0.01'))
+        for line in (by_bucket[row.bucket], by_type.setdefault(row.loan_type, [0] + [Decimal('0.00')] * 3)):
+            line[0] += row.loans
+            line[1] += row.outstanding
+            line[2] += row.overdue
+            line[3] += loss
+    by_bucket = {bucket: BookLine(*line) for bucket, line in by_bucket.items()}
+    return BookSummary(
+        loans=sum(line.loans for line in by_bucket.values()),
+        outstanding=sum((line.outstanding for line in by_bucket.values()), Decimal('0.00')),
+        overdue=sum((line.overdue for line in by_bucket.values()), Decimal('0.00')),
+        interest_income=interest_income,
+        expected_loss=sum((line.expected_loss for line in by_bucket.values()), Decimal('0.00')),
+        by_bucket=by_bucket,
+        by_type={loan_type: BookLine(*line) for loan_type, line in sorted(by_type.items())},
+    )
@@ -0,0 +1,176 @@
+"""
+Nightly loan servicing
+
+Active loans are processed in primary key ranges. For each range the loans
+are locked, their unpaid installments due by the run time are read through
+the (is_paid, payment_date) index and paid, oldest first, from each loan's
+linked account for as long as the account can cover them. A loan never pays
+a later installment while an earlier one is outstanding.
+
+Each account is debited once per range for everything it paid, ordinary
+accounts all together in a single UPDATE. The withdrawals are written with
+one bulk_create of Transaction rows, the installments and loans with
+bulk_update. Loans with nothing left to pay are completed, loans with an
+installment overdue by more than LOAN_DEFAULT_AFTER_DAYS are defaulted,
+and every loan in the range has its loan book position refreshed (see
+loans.rollups).
+
+Every range commits on its own and only unpaid installments are ever
+selected, so an interrupted run is simply started again: ranges that
+committed have nothing left to collect. Approved loans are not serviced
+until they are disbursed and become active.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from accounts.balances import debit, shard_total
+from accounts.models import Account
+from core.batch import id_ranges, run_in_processes
+from transactions.models import Transaction
+from .models import Loan, LoanPayment
+from .rollups import refresh_positions
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_AFTER_DAYS = 90
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+ServicingReport = namedtuple(
+    'ServicingReport', ['loans', 'installments', 'collected', 'missed', 'completed', 'defaulted']
+)
+
+
+def default_after_days():
+    return getattr(settings, 'LOAN_DEFAULT_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+
+
+def _available(accounts):
+    """{account_id: money it can pay} for the locked, active accounts"""
+    return {
+        pk: shard_total(account) if account.is_hot else account.balance
+        for pk, account in accounts.items()
+        if account.is_active
+    }
+
+
+def _debit_accounts(accounts, totals, now):
+    plain = {pk: amount for pk, amount in totals.items() if not accounts[pk].is_hot}
+    if plain:
+        Account.objects.filter(pk__in=list(plain)).update(
+            balance=F('balance') - Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in plain.items()], output_field=MONEY,
+            ),
+            updated_at=now,
+        )
+    for pk, amount in totals.items():
+        if accounts[pk].is_hot and not debit(accounts[pk], amount):
+            # The shards are summed under the account lock, so only a concurrent debit can get here
+            raise RuntimeError(f'Account {pk} could not cover {amount} after its shards were counted')
+
+
+def service_chunk(start_id, end_id, as_of, default_after):
+    """Worker: service active loans with start_id <= pk < end_id, returns a ServicingReport"""
+    now = timezone.now()
+    with transaction.atomic():
+        loans = dict(
+            Loan.objects.filter(pk__gte=start_id, pk__lt=end_id, status='active')
+            .select_for_update()
+            .order_by('pk')
+            .values_list('pk', 'account_id')
+        )
+        if not loans:
+            return ServicingReport(0, 0, Decimal('0.00'), 0, 0, 0)
+        due = list(
+            LoanPayment.objects.filter(is_paid=False, payment_date__lte=as_of, loan_id__in=list(loans))
+            .order_by('payment_date', 'loan_id', 'installment')
+            .only('pk', 'loan_id', 'installment', 'amount', 'balance_after')
+        )
+        # Accounts are locked in key order so ranges sharing an account cannot deadlock
+        accounts = (
+            Account.objects.select_for_update()
+            .filter(pk__in={loans[payment.loan_id] for payment in due} - {None})
+            .order_by('pk')
+            .only('pk', 'balance', 'is_hot', 'is_active')
+            .in_bulk()
+        )
+        available = _available(accounts)
+
+        paid, missed, blocked, totals = [], 0, set(), {}
+        for payment in due:
+            account_id = loans[payment.loan_id]
+            if payment.loan_id in blocked or available.get(account_id, 0) < payment.amount:
+                blocked.add(payment.loan_id)
+                missed += 1
+                continue
+            available[account_id] -= payment.amount
+            totals[account_id] = totals.get(account_id, 0) + payment.amount
+            paid.append(payment)
+
+        if paid:
+            _debit_accounts(accounts, totals, now)
+            withdrawals = Transaction.objects.bulk_create([
+                Transaction(
+                    from_account_id=loans[payment.loan_id], transaction_type='withdrawal', amount=payment.amount,
+                    description=f'Loan #{payment.loan_id} installment {payment.installment}',
+                )
+                for payment in paid
+            ])
+            for payment, withdrawal in zip(paid, withdrawals):
+                payment.is_paid = True
+                payment.paid_date = now
+                payment.transaction = withdrawal
+            LoanPayment.objects.bulk_update(paid, ['is_paid', 'paid_date', 'transaction'])
+
+            # Installments are in due order, so the last one paid leaves each loan's balance
+            collected, balances = {}, {}
+            for payment in paid:
+                collected[payment.loan_id] = collected.get(payment.loan_id, 0) + payment.amount
+                balances[payment.loan_id] = payment.balance_after
+            Loan.objects.filter(pk__in=list(collected)).update(
+                total_paid=F('total_paid') + Case(
+                    *[When(pk=pk, then=Value(amount)) for pk, amount in collected.items()], output_field=MONEY,
+                ),
+                remaining_balance=Case(
+                    *[When(pk=pk, then=Value(balance)) for pk, balance in balances.items()], output_field=MONEY,
+                ),
+                updated_at=now,
+            )
+
+        # A loan with a schedule and no unpaid installments left is paid off
+        scheduled = LoanPayment.objects.filter(loan_id__in=list(loans))
+        completed = (
+            Loan.objects.filter(pk__in=scheduled.values('loan_id'), status='active')
+            .exclude(pk__in=scheduled.filter(is_paid=False).values('loan_id'))
+            .update(status='completed', remaining_balance=0, updated_at=now)
+        )
+        overdue = scheduled.filter(is_paid=False, payment_date__lte=as_of - timedelta(days=default_after))
+        defaulted = Loan.objects.filter(pk__in=overdue.values('loan_id'), status='active').update(
+            status='defaulted', updated_at=now,
+        )
+        refresh_positions(list(loans), as_of)
+    return ServicingReport(
+        len(loans), len(paid), sum((payment.amount for payment in paid), Decimal('0.00')), missed, completed, defaulted,
+    )
+
+
+def service_loans(as_of=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, default_after=None):
+    """Collect every installment due by `as_of` and move loans on, returns the combined ServicingReport"""
+    as_of = as_of or timezone.now()
+    default_after = default_after_days() if default_after is None else default_after
+    tasks = [
+        (start, end, as_of, default_after)
+        for start, end in id_ranges(Loan.objects.filter(status='active'), chunk_size)
+    ]
+    if connection.vendor == 'sqlite':
+        # SQLite allows a single writer, parallel chunks would only fail with "database is locked"
+        workers = 1
+    totals = [0, 0, Decimal('0.00'), 0, 0, 0]
+    for report in run_in_processes(service_chunk, tasks, workers):
+        totals = [total + value for total, value in zip(totals, report)]
+    return ServicingReport(*totals)
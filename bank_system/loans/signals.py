@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Loan, LoanPayment
+from .rollups import drop_positions, refresh_positions
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=LoanPayment)
+@receiver(post_delete, sender=LoanPayment)
+def refresh_loan_book(sender, instance, **kwargs):
+    """Move a loan's share of the loan book rollup once its changes are committed"""
+    loan_id = instance.pk if sender is Loan else instance.loan_id
+    transaction.on_commit(lambda: refresh_positions([loan_id]))
+
+
+@receiver(pre_delete, sender=Loan)
+def remove_from_loan_book(sender, instance, **kwargs):
+    """Take a loan out of the rollup before its position is deleted with it"""
+    drop_positions([instance.pk])
+
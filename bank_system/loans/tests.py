@@ -1,3 +1,178 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.balances import credit, enable_hot_mode, shard_total
+from accounts.models import Account
+from core.testing import QueryCountMixin
+from transactions.models import Transaction
+from .amortization import write_schedules
+from .models import Loan, LoanPayment, LoanProduct
+from .pricing import affordability, quote_grid, quotes
+from .servicing import service_chunk
+
+
+class ServiceChunkTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='borrower')
+        product = LoanProduct.objects.create(
+            name='Personal', loan_type='personal', min_amount=1, max_amount=10**6, interest_rate=Decimal('6'),
+            min_term=1, max_term=60,
+        )
+        self.rich = Account.objects.create(user=user, account_number='RICH1', balance=Decimal('10000.00'))
+        self.poor = Account.objects.create(user=user, account_number='POOR1', balance=Decimal('100.00'))
+        disbursed = timezone.now() - timedelta(days=200)
+        self.paying, self.missing = [
+            Loan.objects.create(
+                user=user, product=product, account=account, principal_amount=Decimal('1200'),
+                interest_rate=Decimal('6'), loan_term=12, remaining_balance=Decimal('1200'), status='active',
+                disbursement_date=disbursed,
+            )
+            for account in (self.rich, self.poor)
+        ]
+        write_schedules(Loan.objects.all())
+        self.now = timezone.now()
+        self.due = LoanPayment.objects.filter(loan=self.paying, payment_date__lte=self.now)
+
+    def _service(self):
+        return service_chunk(self.paying.pk, self.missing.pk + 1, self.now, 90)
+
+    def test_collects_due_installments(self):
+        owed = self.due.aggregate(total=Sum('amount'))['total']
+        report = self._service()
+        self.assertEqual((report.loans, report.installments, report.collected), (2, self.due.count(), owed))
+        self.rich.refresh_from_db()
+        self.assertEqual(self.rich.balance, Decimal('10000.00') - owed)
+        self.assertFalse(self.due.filter(is_paid=False).exists())
+        self.assertEqual(Transaction.objects.filter(from_account=self.rich).count(), self.due.count())
+        self.paying.refresh_from_db()
+        self.assertEqual(self.paying.total_paid, owed)
+        self.assertEqual(self.paying.remaining_balance, self.due.order_by('installment').last().balance_after)
+
+        # Nothing is collected twice
+        rerun = self._service()
+        self.assertEqual((rerun.installments, rerun.collected), (0, Decimal('0.00')))
+
+    def test_collects_from_hot_accounts(self):
+        enable_hot_mode(self.rich)
+        owed = self.due.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(self._service().collected, owed)
+        self.assertEqual(shard_total(self.rich), Decimal('10000.00') - owed)
+
+    def test_defaults_loans_overdue_past_the_limit(self):
+        overdue = LoanPayment.objects.filter(loan=self.missing, payment_date__lte=self.now).count()
+        report = self._service()
+        self.assertEqual((report.missed, report.defaulted), (overdue, 1))
+        self.missing.refresh_from_db()
+        self.assertEqual(self.missing.status, 'defaulted')
+        self.poor.refresh_from_db()
+        self.assertEqual(self.poor.balance, Decimal('100.00'))
+        self.assertFalse(LoanPayment.objects.filter(loan=self.missing, is_paid=True).exists())
+
+
+class ServiceChunkQueryTests(QueryCountMixin, TestCase):
+    """A range runs the same statements however many loans and accounts it services"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='borrowers')
+        self.product = LoanProduct.objects.create(
+            name='Personal', loan_type='personal', min_amount=1, max_amount=10**6, interest_rate=Decimal('6'),
+            min_term=1, max_term=60,
+        )
+        self.disbursed = timezone.now() - timedelta(days=100)
+
+    def _loans(self, tag, count):
+        """(first pk, last pk + 1) of `count` new loans, each paid from its own account"""
+        loans = [
+            Loan.objects.create(
+                user=self.user, product=self.product, principal_amount=Decimal('1200'), interest_rate=Decimal('6'),
+                loan_term=12, remaining_balance=Decimal('1200'), status='active', disbursement_date=self.disbursed,
+                account=Account.objects.create(user=self.user, account_number=f'{tag}{i}', balance=Decimal('5000')),
+            )
+            for i in range(count)
+        ]
+        write_schedules(Loan.objects.filter(pk__in=[loan.pk for loan in loans]))
+        return loans[0].pk, loans[-1].pk + 1
+
+    def test_query_count_does_not_grow_with_loans(self):
+        now = timezone.now()
+        # The first range creates the loan book rollup row the others update
+        service_chunk(*self._loans('WARM', 1), now, 90)
+        few, many = self._loans('FEW', 1), self._loans('MANY', 5)
+        small, report = self.assertQueryCountFixed(
+            lambda: service_chunk(*few, now, 90), lambda: service_chunk(*many, now, 90),
+        )
+        self.assertEqual(small.loans, 1)
+        # Three monthly installments fall due within 100 days of disbursement
+        self.assertEqual((report.loans, report.installments, report.missed), (5, 15, 0))
+
+
+class AffordabilityTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='applicant')
+        product = LoanProduct.objects.create(
+            name='Personal', loan_type='personal', min_amount=1000, max_amount=20000, interest_rate=Decimal('9.5'),
+            min_term=6, max_term=36,
+        )
+        self.account = Account.objects.create(user=self.user, account_number='APP1', balance=Decimal('6000'))
+        Account.objects.create(user=self.user, account_number='APP2', balance=Decimal('155'))
+        Loan.objects.create(
+            user=self.user, product=product, principal_amount=1000, interest_rate=1, loan_term=6, status='active',
+            monthly_payment=Decimal('100.1'),
+        )
+
+    def test_amounts_in_cents(self):
+        room = affordability([self.user.pk])[self.user.pk]
+        self.assertEqual(str(room.balance), '6155.00')
+        self.assertEqual(str(room.debt_service), '100.10')
+        self.assertEqual(room.max_payment, Decimal('925.73'))
+
+    def test_hot_accounts_count_their_shards(self):
+        account = enable_hot_mode(self.account)
+        credit(account, Decimal('600.00'))
+        self.assertEqual(affordability([self.user.pk])[self.user.pk].balance, Decimal('6755.00'))
+
+    def test_quote_rejects_out_of_range_values(self):
+        self.client.force_login(self.user)
+        url = reverse('loans:loan_quote')
+        for params in ({'amount': '1e17', 'term': '12'}, {'amount': '5000', 'term': '99999999999999999999'},
+                       {'amount': 'abc', 'term': '12'}, {'amount': '5000', 'term': '0'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+        response = self.client.get(url, {'amount': '5000', 'term': '12'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['quotes']), 1)
+
+
+class QuoteGridTests(TestCase):
+    """Grids follow product changes made by any process, without a shared cache"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.products = [
+            LoanProduct.objects.create(name=name, loan_type='personal', min_amount=1000, max_amount=20000,
+                                       interest_rate=Decimal('9.5'), min_term=6, max_term=36)
+            for name in ('Personal', 'Flexible')
+        ]
+
+    def _rates(self):
+        return {quote.product: quote.interest_rate for quote in quotes(quote_grid([5000], [12]))}
 
-# Create your tests here.
+    def test_follows_saved_and_deleted_products(self):
+        grid = quote_grid([5000], [12])
+        self.assertIs(quote_grid([5000], [12]), grid)
+        self.assertEqual(self._rates(), {'Personal': Decimal('9.5'), 'Flexible': Decimal('9.5')})
+        self.products[0].interest_rate = Decimal('7.25')
+        self.products[0].save()
+        self.assertEqual(self._rates(), {'Personal': Decimal('7.25'), 'Flexible': Decimal('9.5')})
+        LoanProduct.objects.filter(pk=self.products[1].pk).delete()
+        self.assertEqual(self._rates(), {'Personal': Decimal('7.25')})
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'loans'
+
+urlpatterns = [
+    path('quote/', views.loan_quote, name='loan_quote'),
+    path('eligibility/', views.loan_eligibility, name='loan_eligibility'),
+]
@@ -1,3 +1,89 @@
-from django.shortcuts import render
+from decimal import Decimal, InvalidOperation
 
-# Create your views here.
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import LoanPreApproval
+from .pricing import MAX_QUOTE_AMOUNT, MAX_QUOTE_TERM, MAX_QUOTE_VALUES, affordability, quote_grid, quotes
+
+
+def _quote_params(request):
+    """Read repeated amount/term query parameters, raises ValueError when invalid"""
+    amounts, terms = request.GET.getlist('amount'), request.GET.getlist('term')
+    if not amounts or not terms:
+        raise ValueError('At least one amount and one term are required')
+    if len(amounts) > MAX_QUOTE_VALUES or len(terms) > MAX_QUOTE_VALUES:
+        raise ValueError(f'At most {MAX_QUOTE_VALUES} amounts and {MAX_QUOTE_VALUES} terms')
+    try:
+        amounts = [Decimal(amount).quantize(Decimal('0.01')) for amount in amounts]
+        terms = [int(term) for term in terms]
+    except (InvalidOperation, ValueError):
+        raise ValueError('Invalid amount or term')
+    if any(not amount.is_finite() or amount <= 0 for amount in amounts) or any(term < 1 for term in terms):
+        raise ValueError('Amounts and terms must be positive')
+    if any(amount > MAX_QUOTE_AMOUNT for amount in amounts) or any(term > MAX_QUOTE_TERM for term in terms):
+        raise ValueError(f'Amounts are at most {MAX_QUOTE_AMOUNT} and terms at most {MAX_QUOTE_TERM} months')
+    return amounts, terms
+
+
+def _affordability_dict(room):
+    return {
+        'balance': str(room.balance),
+        'debt_service': str(room.debt_service),
+        'has_default': room.has_default,
+        'max_payment': str(room.max_payment),
+    }
+
+
+@login_required
+def loan_quote(request):
+    """JSON quotes of every active product for each amount x term, flagged by what the user can afford"""
+    try:
+        amounts, terms = _quote_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    room = affordability([request.user.pk])[request.user.pk]
+    return JsonResponse({
+        'affordability': _affordability_dict(room),
+        'quotes': [
+            {
+                'product_id': quote.product_id,
+                'product': quote.product,
+                'loan_type': quote.loan_type,
+                'interest_rate': str(quote.interest_rate),
+                'amount': str(quote.amount),
+                'term': quote.term,
+                'monthly_payment': str(quote.monthly_payment),
+                'total_interest': str(quote.total_interest),
+                'total_cost': str(quote.total_cost),
+                'affordable': quote.monthly_payment <= room.max_payment,
+            }
+            for quote in quotes(quote_grid(amounts, terms))
+        ],
+    })
+
+
+@login_required
+def loan_eligibility(request):
+    """JSON affordability of the user and their current pre-approvals"""
+    room = affordability([request.user.pk])[request.user.pk]
+    preapprovals = LoanPreApproval.objects.filter(
+        user=request.user, expires_at__gt=timezone.now()
+    ).select_related('product')
+    return JsonResponse({
+        'affordability': _affordability_dict(room),
+        'preapprovals': [
+            {
+                'product_id': offer.product_id,
+                'product': offer.product.name,
+                'loan_type': offer.product.loan_type,
+                'amount': str(offer.amount),
+                'term': offer.term,
+                'interest_rate': str(offer.interest_rate),
+                'monthly_payment': str(offer.monthly_payment),
+                'expires_at': offer.expires_at.isoformat(),
+            }
+            for offer in preapprovals
+        ],
+    })
@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
 from .models import SavingsProduct, SavingsAccount, SavingsGoal, InterestTransaction
+from .accrual import accrue_accounts
 
 
 @admin.register(SavingsProduct)
@@ -27,9 +30,11 @@ class SavingsProductAdmin(admin.ModelAdmin):
 @admin.register(SavingsAccount)
 class SavingsAccountAdmin(admin.ModelAdmin):
     list_display = ['account_number', 'user', 'product', 'balance', 'interest_earned', 'status', 'withdrawals_this_month', 'opened_at']
+    # Join only what the change list renders, rather than every foreign key Django would follow
+    list_select_related = ['user', 'product']
     list_filter = ['status', 'product', 'opened_at']
     search_fields = ['account_number', 'user__username', 'user__email']
-    readonly_fields = ['account_number', 'interest_earned', 'withdrawals_this_month', 'last_interest_date', 'opened_at']
+    readonly_fields = ['account_number', 'interest_earned', 'withdrawals_this_month', 'withdrawals_month', 'last_interest_date', 'opened_at']
     fieldsets = (
         ('Account Information', {
             'fields': ('user', 'product', 'account', 'account_number', 'status')
@@ -38,7 +43,7 @@ class SavingsAccountAdmin(admin.ModelAdmin):
             'fields': ('balance', 'interest_earned')
         }),
         ('Activity Tracking', {
-            'fields': ('withdrawals_this_month', 'last_interest_date')
+            'fields': ('withdrawals_this_month', 'withdrawals_month', 'last_interest_date')
         }),
         ('Dates', {
             'fields': ('opened_at', 'closed_at')
@@ -48,12 +53,9 @@ class SavingsAccountAdmin(admin.ModelAdmin):
     actions = ['apply_interest_to_selected']
 
     def apply_interest_to_selected(self, request, queryset):
-        """Admin action to apply interest to selected accounts"""
-        count = 0
-        for account in queryset:
-            if account.status == 'active':
-                account.apply_interest()
-                count += 1
+        """Admin action to apply today's interest to selected accounts"""
+        with transaction.atomic():
+            count, _ = accrue_accounts(queryset, timezone.localdate())
         self.message_user(request, f'Interest applied to {count} account(s).')
 
     apply_interest_to_selected.short_description = "Apply interest to selected active accounts"
@@ -62,6 +64,7 @@ class SavingsAccountAdmin(admin.ModelAdmin):
 @admin.register(SavingsGoal)
 class SavingsGoalAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'savings_account', 'target_amount', 'current_amount', 'progress_percentage', 'target_date', 'status']
+    list_select_related = ['user', 'savings_account__user']
     list_filter = ['status', 'target_date']
     search_fields = ['name', 'user__username', 'description']
     readonly_fields = ['created_at', 'completed_at', 'progress_percentage', 'is_achieved']
@@ -80,8 +83,9 @@ class SavingsGoalAdmin(admin.ModelAdmin):
 
 @admin.register(InterestTransaction)
 class InterestTransactionAdmin(admin.ModelAdmin):
-    list_display = ['savings_account', 'amount', 'interest_rate', 'transaction_date']
-    list_filter = ['transaction_date']
+    list_display = ['savings_account', 'entry_type', 'amount', 'interest_rate', 'transaction_date']
+    list_select_related = ['savings_account__user']
+    list_filter = ['entry_type', 'transaction_date']
     search_fields = ['savings_account__account_number', 'savings_account__user__username']
-    readonly_fields = ['savings_account', 'amount', 'interest_rate', 'transaction_date']
+    readonly_fields = ['savings_account', 'entry_type', 'amount', 'interest_rate', 'transaction_date']
     date_hierarchy = 'transaction_date'
@@ -0,0 +1,143 @@
+"""
+Savings balance movements
+
+Deposits, withdrawals and interest change a SavingsAccount balance with a
+single F() UPDATE and, in the same transaction, move current_amount of the
+account's active goals by the same amount. Goal progress is stored alongside
+current_amount and goals that reach their target are completed by that same
+UPDATE, so nothing is recomputed per goal when pages render.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, DateTimeField, DecimalField, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from core.batch import id_ranges
+from .models import InterestTransaction, SavingsAccount, SavingsGoal
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+PERCENT = DecimalField(max_digits=5, decimal_places=2)
+
+
+def _goal_updates(delta, now):
+    """UPDATE expressions moving current_amount by `delta` and deriving progress, status and completed_at"""
+    amount = Greatest(F('current_amount') + delta, Value(Decimal('0')), output_field=MONEY)
+    reached = GreaterThanOrEqual(F('current_amount') + delta, F('target_amount'))
+    # current_amount goes last: MySQL evaluates SET clauses left to right against updated values
+    return {
+        'progress': Case(
+            When(target_amount__lte=0, then=Value(Decimal('100'))),
+            # Divided as floats, SQLite would otherwise truncate whole-number amounts to integer division
+            default=Least(
+                Value(100.0), Cast(amount, FloatField()) * 100 / Cast('target_amount', FloatField())
+            ),
+            output_field=PERCENT,
+        ),
+        'status': Case(When(reached, then=Value('completed')), default=F('status'), output_field=CharField()),
+        'completed_at': Case(When(reached, then=Value(now)), default=F('completed_at'), output_field=DateTimeField()),
+        'current_amount': amount,
+    }
+
+
+def track_goals(changes):
+    """
+    Apply {savings_account_id: amount} balance changes to active goals in one UPDATE.
+
+    Returns the number of goals touched.
+    """
+    changes = {pk: amount for pk, amount in changes.items() if amount}
+    if not changes:
+        return 0
+    if len(changes) == 1:
+        delta = Value(next(iter(changes.values())), output_field=MONEY)
+    else:
+        delta = Case(
+            *[When(savings_account_id=pk, then=Value(amount)) for pk, amount in changes.items()],
+            output_field=MONEY,
+        )
+    return SavingsGoal.objects.filter(status='active', savings_account_id__in=list(changes)).update(
+        **_goal_updates(delta, timezone.now())
+    )
+
+
+@transaction.atomic
+def deposit(savings_account, amount):
+    """Add `amount` to a savings account and its goals"""
+    SavingsAccount.objects.filter(pk=savings_account.pk).update(balance=F('balance') + amount)
+    track_goals({savings_account.pk: amount})
+    savings_account.balance += amount
+
+
+def current_month():
+    return timezone.localdate().replace(day=1)
+
+
+def withdrawal_penalty(product, amount):
+    """Penalty for a withdrawal over the product's monthly limit"""
+    return (amount * product.penalty_rate / 100).quantize(Decimal('0.01'))
+
+
+@transaction.atomic
+def withdraw(savings_account, amount):
+    """
+    Take `amount` from a savings account and its goals, counting it against
+    the product's monthly withdrawal limit.
+
+    Withdrawals over the limit also take withdrawal_penalty() from the
+    balance and record it as a penalty InterestTransaction. Returns the
+    penalty charged (zero within the limit), or None if the balance does not
+    cover the withdrawal and penalty.
+    """
+    product = savings_account.product
+    month = current_month()
+    # The counter belongs to an earlier month until its first withdrawal this month
+    this_month = Q(withdrawals_month=month)
+    counted = {
+        'withdrawals_this_month': Case(
+            When(this_month, then=F('withdrawals_this_month') + 1), default=Value(1)
+        ),
+        'withdrawals_month': Value(month),
+    }
+    within_limit = (this_month & Q(withdrawals_this_month__lt=product.withdrawal_limit)) | ~this_month
+    if product.withdrawal_limit <= 0:
+        within_limit = Q(pk__in=[])
+    penalty = withdrawal_penalty(product, amount)
+    accounts = SavingsAccount.objects.filter(pk=savings_account.pk)
+
+    # Each attempt is one conditional UPDATE, so the limit holds under concurrent withdrawals
+    if accounts.filter(within_limit, balance__gte=amount).update(balance=F('balance') - amount, **counted):
+        charged = Decimal('0.00')
+    elif accounts.exclude(within_limit).filter(balance__gte=amount + penalty).update(
+        balance=F('balance') - amount - penalty, **counted
+    ):
+        charged = penalty
+        if penalty:
+            InterestTransaction.objects.create(
+                savings_account=savings_account, amount=penalty, interest_rate=product.penalty_rate,
+                entry_type='penalty',
+            )
+    else:
+        return None
+
+    track_goals({savings_account.pk: -(amount + charged)})
+    savings_account.refresh_from_db(fields=['balance', 'withdrawals_this_month', 'withdrawals_month'])
+    return charged
+
+
+def reset_withdrawal_counters(chunk_size=50000):
+    """
+    Zero the withdrawal counters left over from earlier months, one UPDATE
+    per primary key range. Safe to run at any time; returns the rows reset.
+    """
+    month = current_month()
+    stale = SavingsAccount.objects.filter(Q(withdrawals_month__lt=month) | Q(withdrawals_month__isnull=True)).filter(
+        withdrawals_this_month__gt=0
+    )
+    reset = 0
+    for start, end in id_ranges(stale, chunk_size):
+        reset += stale.filter(pk__gte=start, pk__lt=end).update(withdrawals_this_month=0, withdrawals_month=month)
+    return reset
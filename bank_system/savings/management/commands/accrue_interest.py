@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from savings.accrual import DEFAULT_CHUNK_SIZE, accrue_interest
+
+
+class Command(BaseCommand):
+    help = 'Credit one day of interest to all active savings accounts (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Accrual date as YYYY-MM-DD (defaults to today)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Accounts per id range')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        run_date = timezone.localdate()
+        if options['date']:
+            run_date = parse_date(options['date'])
+            if run_date is None:
+                raise CommandError('--date must look like YYYY-MM-DD')
+
+        self.stdout.write(self.style.WARNING(f'Accruing interest for {run_date}...'))
+        started = timezone.now()
+        run = accrue_interest(run_date, chunk_size=options['chunk_size'], workers=options['workers'])
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Credited ${run.total_interest} to {run.accounts_credited} accounts in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from savings.balances import reset_withdrawal_counters
+
+
+class Command(BaseCommand):
+    help = 'Reset monthly savings withdrawal counters left over from earlier months'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Accounts per UPDATE')
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        reset = reset_withdrawal_counters(chunk_size=options['chunk_size'])
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'Reset {reset} withdrawal counters in {elapsed:.1f}s'))
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("savings", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InterestAccrualRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("run_date", models.DateField(unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("running", "Running"), ("completed", "Completed")],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("chunk_size", models.PositiveIntegerField()),
+                ("accounts_credited", models.IntegerField(default=0)),
+                (
+                    "total_interest",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-run_date"],
+            },
+        ),
+        migrations.CreateModel(
+            name="InterestAccrualCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_id", models.BigIntegerField()),
+                ("end_id", models.BigIntegerField()),
+                ("accounts_credited", models.IntegerField(default=0)),
+                (
+                    "total_interest",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("completed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkpoints",
+                        to="savings.interestaccrualrun",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["run", "start_id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("run", "start_id", "end_id"),
+                        name="unique_accrual_checkpoint",
+                    )
+                ],
+            },
+        ),
+    ]
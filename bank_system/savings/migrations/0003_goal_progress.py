@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:33
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Greatest, Least
+
+
+def backfill_progress(apps, schema_editor):
+    SavingsGoal = apps.get_model("savings", "SavingsGoal")
+    SavingsGoal.objects.filter(target_amount__gt=0).update(
+        progress=Least(
+            Value(100.0),
+            Cast(
+                Greatest(F("current_amount"), Value(Decimal("0"))), models.FloatField()
+            )
+            * 100
+            / Cast("target_amount", models.FloatField()),
+            output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("savings", "0002_interest_accrual_runs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="savingsgoal",
+            name="progress",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                help_text="Percent of target reached, kept in step with current_amount",
+                max_digits=5,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="savingsgoal",
+            index=models.Index(
+                fields=["user", "status", "-progress"], name="savings_goal_progress_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
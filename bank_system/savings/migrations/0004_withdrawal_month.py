@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("savings", "0003_goal_progress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="savingsaccount",
+            name="withdrawals_month",
+            field=models.DateField(
+                blank=True,
+                help_text="First day of the month withdrawals_this_month counts",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("savings", "0004_withdrawal_month"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="interesttransaction",
+            name="entry_type",
+            field=models.CharField(
+                choices=[("interest", "Interest"), ("penalty", "Withdrawal penalty")],
+                default="interest",
+                max_length=20,
+            ),
+        ),
+    ]
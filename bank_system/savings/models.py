@@ -3,6 +3,8 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from decimal import Decimal
 
+from .compounding import compound_interest
+
 User = get_user_model()
 
 
@@ -49,6 +51,7 @@ class SavingsAccount(models.Model):
     interest_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     withdrawals_this_month = models.IntegerField(default=0)
+    withdrawals_month = models.DateField(null=True, blank=True, help_text="First day of the month withdrawals_this_month counts")
     last_interest_date = models.DateField(null=True, blank=True)
     opened_at = models.DateTimeField(auto_now_add=True)
     closed_at = models.DateTimeField(null=True, blank=True)
@@ -59,22 +62,34 @@ class SavingsAccount(models.Model):
     class Meta:
         ordering = ['-opened_at']
 
-    def calculate_interest(self):
-        """Calculate interest based on compounding frequency"""
+    @property
+    def current_withdrawals(self):
+        """Withdrawals made this calendar month; a counter left over from an earlier month counts as zero"""
+        if self.withdrawals_month != timezone.localdate().replace(day=1):
+            return 0
+        return self.withdrawals_this_month
+
+    def calculate_interest(self, days=None):
+        """Calculate interest based on compounding frequency, by default for the days since it was last credited"""
         if self.status != 'active' or self.balance <= 0:
             return Decimal('0.00')
 
-        rate = self.product.interest_rate / 100
-        balance = self.balance
+        if days is None:
+            days = (timezone.now().date() - self.last_interest_date).days if self.last_interest_date else 1
+        return compound_interest(self.balance, self.product.interest_rate, self.product.compounding_frequency, days)
 
-        # Simple interest calculation for now
-        daily_rate = rate / 365
-        interest = balance * daily_rate
-
-        return interest.quantize(Decimal('0.01'))
+    def projected_balance(self, days):
+        """Balance after `days` more days of compounding, assuming no deposits or withdrawals"""
+        if self.status != 'active' or self.balance <= 0:
+            return self.balance
+        return self.balance + compound_interest(
+            self.balance, self.product.interest_rate, self.product.compounding_frequency, days
+        )
 
     def apply_interest(self):
         """Apply calculated interest to the account"""
+        from .balances import track_goals
+
         interest = self.calculate_interest()
         if interest > 0:
             self.balance += interest
@@ -88,6 +103,7 @@ class SavingsAccount(models.Model):
                 amount=interest,
                 interest_rate=self.product.interest_rate
             )
+            track_goals({self.pk: interest})
 
         return interest
 
@@ -106,6 +122,7 @@ class SavingsGoal(models.Model):
     description = models.TextField(blank=True)
     target_amount = models.DecimalField(max_digits=12, decimal_places=2)
     current_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    progress = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Percent of target reached, kept in step with current_amount")
     target_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -116,13 +133,14 @@ class SavingsGoal(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status', '-progress'], name='savings_goal_progress_idx'),
+        ]
 
     @property
     def progress_percentage(self):
-        """Calculate progress percentage"""
-        if self.target_amount <= 0:
-            return 0
-        return min(100, (self.current_amount / self.target_amount * 100))
+        """Progress percentage, stored by savings.balances whenever current_amount moves"""
+        return self.progress
 
     @property
     def is_achieved(self):
@@ -131,14 +149,61 @@ class SavingsGoal(models.Model):
 
 
 class InterestTransaction(models.Model):
-    """Track interest accrual transactions"""
+    """Track interest accrual transactions, and penalties charged to the savings balance"""
+    ENTRY_TYPES = (
+        ('interest', 'Interest'),
+        ('penalty', 'Withdrawal penalty'),
+    )
+
     savings_account = models.ForeignKey(SavingsAccount, on_delete=models.CASCADE, related_name='interest_transactions')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    entry_type = models.CharField(max_length=20, choices=ENTRY_TYPES, default='interest')
     transaction_date = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Interest ${self.amount} - {self.savings_account.account_number}"
+        return f"{self.get_entry_type_display()} ${self.amount} - {self.savings_account.account_number}"
 
     class Meta:
         ordering = ['-transaction_date']
+
+
+class InterestAccrualRun(models.Model):
+    """One nightly interest accrual, resumable through its checkpoints"""
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    )
+
+    run_date = models.DateField(unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    chunk_size = models.PositiveIntegerField()
+    accounts_credited = models.IntegerField(default=0)
+    total_interest = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Interest accrual {self.run_date} ({self.status})"
+
+    class Meta:
+        ordering = ['-run_date']
+
+
+class InterestAccrualCheckpoint(models.Model):
+    """An id range of savings accounts already credited in a run"""
+    run = models.ForeignKey(InterestAccrualRun, on_delete=models.CASCADE, related_name='checkpoints')
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    accounts_credited = models.IntegerField(default=0)
+    total_interest = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.run.run_date} [{self.start_id}, {self.end_id})"
+
+    class Meta:
+        ordering = ['run', 'start_id']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'start_id', 'end_id'], name='unique_accrual_checkpoint'),
+        ]
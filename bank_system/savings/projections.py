@@ -0,0 +1,160 @@
+"""
+Savings projections
+
+Month-by-month balance projections for a savings account or product under
+many what-if scenarios at once. Every combination of rate, monthly
+contribution and horizon becomes one row of a scenarios x months NumPy
+array computed in closed form:
+
+    balance[t] = start * g**t + contribution * (g**t - 1) / (g - 1)
+
+where g is the monthly growth factor of the rate and contributions are made
+at the end of each month. The growth factors are memoized by rate,
+compounding frequency and horizon; the amounts are applied per request.
+"""
+
+from decimal import Decimal
+from functools import lru_cache
+from itertools import product as cartesian
+
+import numpy as np
+from django.utils import timezone
+
+from core.dates import add_months
+from .compounding import monthly_growth
+
+MAX_MONTHS = 600
+MAX_SCENARIO_VALUES = 10
+
+
+@lru_cache(maxsize=512)
+def _growth_factors(rates, frequency, months):
+    """
+    (g**t, (g**t - 1) / (g - 1)) for every rate over months 0..months, as
+    read-only rates x months arrays. They do not depend on the amounts, so
+    projections of any balance and contributions share them.
+    """
+    growth = monthly_growth(rates, frequency)[:, None]
+    compounded = growth ** np.arange(months + 1)[None, :]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(growth == 1, np.arange(months + 1)[None, :], (compounded - 1) / (growth - 1))
+    for array in (compounded, annuity):
+        array.flags.writeable = False
+    return compounded, annuity
+
+
+def _balance_grid(start, rates, frequency, contributions, months):
+    """Balances for every (rate, contribution) pair over months 0..months"""
+    compounded, annuity = _growth_factors(rates, frequency, months)
+    contribution = np.array(contributions, dtype=np.float64)[None, :, None]
+    grid = float(start) * compounded[:, None, :] + contribution * annuity[:, None, :]
+    return grid.reshape(len(rates) * len(contributions), months + 1)
+
+
+class Projection:
+    """Projected balances for a grid of scenarios"""
+
+    def __init__(self, start, frequency, rates, contributions, horizons):
+        self.start = start
+        self.frequency = frequency
+        self.scenarios = list(cartesian(rates, contributions, horizons))
+        grid = _balance_grid(start, tuple(rates), frequency, tuple(contributions), max(horizons))
+        # Each (rate, contribution) row is shared by every horizon, which only truncates it
+        self.balances = np.repeat(grid, len(horizons), axis=0)
+        self.horizons = np.tile(np.array(horizons), len(rates) * len(contributions))
+
+    def final_balances(self):
+        return self.balances[np.arange(len(self.scenarios)), self.horizons]
+
+    def as_dict(self):
+        final = self.final_balances()
+        return {
+            'start': str(self.start),
+            'compounding': self.frequency,
+            'scenarios': [
+                {
+                    'rate': str(rate),
+                    'monthly_contribution': str(contribution),
+                    'months': months,
+                    'balances': np.round(self.balances[index, :months + 1], 2).tolist(),
+                    'final_balance': round(float(final[index]), 2),
+                }
+                for index, (rate, contribution, months) in enumerate(self.scenarios)
+            ],
+        }
+
+
+def project(source, start=None, rates=None, contributions=(Decimal('0'),), horizons=(12,)):
+    """
+    Project a SavingsAccount or SavingsProduct.
+
+    `start` defaults to the account balance (or the product's minimum
+    balance) and `rates` to the product's rate.
+    """
+    product = getattr(source, 'product', source)
+    if start is None:
+        start = source.balance if source is not product else product.min_balance
+    rates = tuple(rates or (product.interest_rate,))
+    return Projection(Decimal(start), product.compounding_frequency, rates, tuple(contributions), tuple(horizons))
+
+
+def months_to_target(current, targets, growth, contribution=0):
+    """
+    Whole months until each balance reaches its target given monthly growth
+    factors and monthly contributions, vectorized over goals.
+
+    Returns a float array with NaN where the target is out of reach within
+    MAX_MONTHS, such as an empty balance nothing is contributed to.
+    """
+    current = np.asarray(current, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    growth = np.broadcast_to(np.asarray(growth, dtype=np.float64), current.shape)
+    contribution = np.broadcast_to(np.asarray(contribution, dtype=np.float64), current.shape)
+
+    months = np.full(current.shape, np.nan)
+    # Interest alone never moves a zero balance, so those goals need contributions
+    compound = (growth > 1) & ((current > 0) | (contribution > 0))
+    linear = (growth <= 1) & (contribution > 0)
+    # Solve start * g**n + c * (g**n - 1) / (g - 1) >= target for n
+    offset = contribution[compound] / (growth[compound] - 1)
+    months[compound] = (
+        np.log((targets[compound] + offset) / (current[compound] + offset)) / np.log(growth[compound])
+    )
+    months[linear] = (targets[linear] - current[linear]) / contribution[linear]
+    months = np.ceil(np.maximum(months, 0))
+    months[targets <= current] = 0
+    months[months > MAX_MONTHS] = np.nan
+    return months
+
+
+def estimate_goal_completion(goals, contribution=0):
+    """
+    Set `estimated_completion` (a date, or None if out of reach) on each goal,
+    assuming `contribution` is deposited at the end of every month.
+
+    The months needed are computed for all goals in one NumPy pass. Goals
+    must have savings_account__product loaded.
+    """
+    goals = list(goals)
+    if not goals:
+        return goals
+    products = [goal.savings_account.product for goal in goals]
+    rates = np.array([product.interest_rate for product in products], dtype=np.float64)
+    frequencies = np.array([product.compounding_frequency for product in products])
+
+    growth = np.ones(len(goals))
+    for frequency in np.unique(frequencies):
+        mask = frequencies == frequency
+        growth[mask] = monthly_growth(rates[mask], str(frequency))
+
+    months = months_to_target(
+        [goal.current_amount for goal in goals],
+        [goal.target_amount for goal in goals],
+        growth,
+        contribution,
+    )
+    today = timezone.localdate()
+    for goal, needed in zip(goals, months):
+        goal.estimated_completion = None if np.isnan(needed) else add_months(today, int(needed))
+    return goals
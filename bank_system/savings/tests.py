@@ -0,0 +1,312 @@
+from datetime import timedelta
+from decimal import ROUND_HALF_EVEN, Decimal, localcontext
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from core.batch import id_ranges
+from core.dates import add_months
+from .accrual import accrue_interest
+from .balances import current_month, deposit, reset_withdrawal_counters, track_goals, withdraw
+from .compounding import (
+    DAYS_PER_YEAR, MAX_TABLE_DAYS, PERIODS_PER_YEAR, compound_interest, growth_table, interest_cents, monthly_growth,
+)
+from .models import InterestAccrualRun, InterestTransaction, SavingsAccount, SavingsGoal, SavingsProduct
+from .projections import MAX_MONTHS, estimate_goal_completion, months_to_target
+
+
+def reference_interest(balance, rate, frequency, days):
+    """Interest on one balance, compounded with Decimal arithmetic and rounded half to even"""
+    with localcontext() as context:
+        context.prec = 40
+        periods = PERIODS_PER_YEAR[frequency]
+        growth = (1 + Decimal(rate) / 100 / periods) ** (Decimal(periods * days) / DAYS_PER_YEAR)
+        return (balance * (growth - 1)).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+
+class CompoundingTests(SimpleTestCase):
+    def test_matches_reference(self):
+        balance = Decimal('12345.67')
+        days = [1, 2, 30, 91, 365, 366, MAX_TABLE_DAYS, MAX_TABLE_DAYS + 1, 5000]
+        for frequency in PERIODS_PER_YEAR:
+            for rate in ('0.01', '2.50', '4.75', '19.99'):
+                with self.subTest(frequency=frequency, rate=rate):
+                    cents = interest_cents([int(balance * 100)] * len(days), Decimal(rate), frequency, days)
+                    self.assertEqual([Decimal(int(c)).scaleb(-2) for c in cents],
+                                     [reference_interest(balance, rate, frequency, d) for d in days])
+
+    def test_year_earns_the_effective_rate(self):
+        balance = Decimal('10000.00')
+        self.assertEqual(compound_interest(balance, Decimal('5'), 'annually', 365), Decimal('500.00'))
+        self.assertEqual(compound_interest(balance, Decimal('5'), 'monthly', 365), Decimal('511.62'))
+        self.assertEqual(compound_interest(balance, Decimal('5'), 'daily', 365), Decimal('512.67'))
+        self.assertEqual(compound_interest(balance, Decimal('5'), 'daily', 0), Decimal('0.00'))
+
+    def test_tables_are_cached_per_rate(self):
+        table = growth_table(Decimal('3.30'), 'quarterly')
+        self.assertIs(growth_table(Decimal('3.30'), 'quarterly'), table)
+        self.assertIsNot(growth_table(Decimal('3.35'), 'quarterly'), table)
+        self.assertEqual(len(table), MAX_TABLE_DAYS + 1)
+        self.assertFalse(table.flags.writeable)
+
+
+class AccrualTests(TestCase):
+    """The vectorized accrual credits what a per-account Decimal computation does"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='saver')
+        self.account = Account.objects.create(user=self.user, account_number='SAVE1', balance=Decimal('0.00'))
+        self.run_date = timezone.localdate()
+        products = [
+            SavingsProduct.objects.create(name=frequency, interest_rate=rate, compounding_frequency=frequency)
+            for frequency, rate in [
+                ('daily', Decimal('1.25')), ('monthly', Decimal('4.10')),
+                ('quarterly', Decimal('2.75')), ('annually', Decimal('19.99')),
+            ]
+        ]
+        # Never credited (one day), yesterday, a month, more than a year and past the factor table
+        last_dates = [None] + [self.run_date - timedelta(days=days) for days in (1, 31, 400, 4000)]
+        balances = [Decimal('0.01'), Decimal('73.19'), Decimal('1234.56'), Decimal('98765.43'), Decimal('5000.00')]
+        self.savings = [
+            SavingsAccount.objects.create(
+                user=self.user, product=product, account=self.account, account_number=f'S{product.pk}-{i}',
+                balance=balance, last_interest_date=last_date,
+            )
+            for offset, product in enumerate(products)
+            for i, balance in enumerate(balances)
+            # Rotated so each product pairs balances with different gaps
+            for last_date in [last_dates[(i + offset) % len(last_dates)]]
+        ]
+
+    def _expected(self, savings):
+        days = (self.run_date - savings.last_interest_date).days if savings.last_interest_date else 1
+        return reference_interest(savings.balance, savings.product.interest_rate,
+                                  savings.product.compounding_frequency, days)
+
+    def test_matches_reference_across_chunks(self):
+        expected = {savings.pk: self._expected(savings) for savings in self.savings}
+        credited = {pk for pk, interest in expected.items() if interest}
+        self.assertLess(len(credited), len(expected))
+        # Chunks of one account, chunks that split each product's accounts, and a single chunk
+        for chunk_size in (1, 3, 7, len(self.savings)):
+            with self.subTest(chunk_size=chunk_size), transaction.atomic():
+                run = accrue_interest(self.run_date, chunk_size=chunk_size)
+                self.assertEqual(run.checkpoints.count(), len(id_ranges(SavingsAccount.objects.all(), chunk_size)))
+                self.assertEqual((run.accounts_credited, run.total_interest),
+                                 (len(credited), sum(expected.values())))
+                for savings in self.savings:
+                    accrued = SavingsAccount.objects.get(pk=savings.pk)
+                    self.assertEqual(accrued.balance, savings.balance + expected[savings.pk], savings.account_number)
+                    self.assertEqual(accrued.interest_earned, expected[savings.pk])
+                    self.assertEqual(accrued.last_interest_date,
+                                     self.run_date if savings.pk in credited else savings.last_interest_date)
+                self.assertEqual(
+                    dict(InterestTransaction.objects.values_list('savings_account_id', 'amount')),
+                    {pk: expected[pk] for pk in credited},
+                )
+                transaction.set_rollback(True)
+
+    def test_credits_once_per_day(self):
+        first = accrue_interest(self.run_date, chunk_size=4)
+        balances = dict(SavingsAccount.objects.values_list('pk', 'balance'))
+        # A completed run is returned as is, a fresh run for the same date finds nothing to credit
+        self.assertEqual(accrue_interest(self.run_date, chunk_size=4).pk, first.pk)
+        InterestAccrualRun.objects.all().delete()
+        rerun = accrue_interest(self.run_date, chunk_size=4)
+        self.assertEqual((rerun.accounts_credited, rerun.total_interest), (0, Decimal('0.00')))
+        self.assertEqual(dict(SavingsAccount.objects.values_list('pk', 'balance')), balances)
+
+    def test_skips_inactive_and_empty_accounts(self):
+        inactive, empty = self.savings[2], self.savings[7]
+        SavingsAccount.objects.filter(pk=inactive.pk).update(status='inactive')
+        SavingsAccount.objects.filter(pk=empty.pk).update(balance=0)
+        accrue_interest(self.run_date, chunk_size=5)
+        self.assertFalse(InterestTransaction.objects.filter(savings_account__in=[inactive, empty]).exists())
+        self.assertEqual(SavingsAccount.objects.get(pk=inactive.pk).balance, inactive.balance)
+
+
+def reference_months(current, target, growth, contribution):
+    """Months until `target`, stepping the balance one month at a time"""
+    months, balance = 0, current
+    while balance < target:
+        if months == MAX_MONTHS:
+            return None
+        balance = balance * growth + contribution
+        months += 1
+    return months
+
+
+class GoalCompletionTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='planner')
+        account = Account.objects.create(user=self.user, account_number='PLAN1', balance=Decimal('0.00'))
+        product = SavingsProduct.objects.create(name='Flat', interest_rate=Decimal('0.00'))
+        self.savings = SavingsAccount.objects.create(user=self.user, product=product, account=account,
+                                                     account_number='PLANS1')
+        self.goal = SavingsGoal.objects.create(user=self.user, savings_account=self.savings, name='Car',
+                                               target_amount=Decimal('1200.00'), target_date=timezone.localdate())
+
+    def test_months_match_stepping(self):
+        growth = float(monthly_growth([4.5], 'monthly')[0])
+        cases = [(0, 1000, 50), (250, 1000, 0), (250, 1000, 20), (999.99, 1000, 0), (1000, 1000, 0), (0, 10**6, 1)]
+        current, targets, contributions = (np.array(column, dtype=np.float64) for column in zip(*cases))
+        with np.errstate(all='raise'):
+            months = months_to_target(current, targets, growth, contributions)
+        for case, needed in zip(cases, months):
+            expected = reference_months(*case[:2], growth, case[2])
+            self.assertEqual(None if np.isnan(needed) else int(needed), expected, case)
+
+    def test_zero_start_needs_contributions(self):
+        with np.errstate(all='raise'):
+            self.assertTrue(np.isnan(months_to_target([0, 0], [100, 100], [1.0, 1.01], 0)).all())
+            self.assertEqual(months_to_target([0], [1200], [1.0], 100).tolist(), [12])
+
+        today = timezone.localdate()
+        goal, = estimate_goal_completion(SavingsGoal.objects.select_related('savings_account__product'), 100)
+        self.assertEqual(goal.estimated_completion, add_months(today, 12))
+        goal, = estimate_goal_completion(SavingsGoal.objects.select_related('savings_account__product'))
+        self.assertIsNone(goal.estimated_completion)
+
+    def test_pages_take_the_contribution(self):
+        self.client.force_login(self.user)
+        expected = f'{add_months(timezone.localdate(), 12):%b %Y}'
+        for url in (reverse('savings:goals_list'), reverse('savings:savings_detail', args=[self.savings.pk])):
+            with self.subTest(url):
+                self.assertContains(self.client.get(url, {'contribution': '100'}), expected)
+                self.assertContains(self.client.get(url), 'needs regular deposits')
+                self.assertContains(self.client.get(url, {'contribution': '-5'}), 'needs regular deposits')
+
+
+class GoalProgressTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='goals')
+        account = Account.objects.create(user=user, account_number='GOAL1', balance=Decimal('0.00'))
+        product = SavingsProduct.objects.create(name='Goals', interest_rate=Decimal('1.00'))
+        self.savings = SavingsAccount.objects.create(user=user, product=product, account=account,
+                                                     account_number='GOALS1')
+        self.other = SavingsAccount.objects.create(user=user, product=product, account=account,
+                                                   account_number='GOALS2')
+        target_date = timezone.localdate()
+        self.small, self.large, self.cancelled, self.elsewhere = [
+            SavingsGoal.objects.create(user=user, savings_account=savings, name=name, target_amount=target,
+                                       target_date=target_date, status=status)
+            for savings, name, target, status in [
+                (self.savings, 'Small', Decimal('100.00'), 'active'),
+                (self.savings, 'Large', Decimal('400.00'), 'active'),
+                (self.savings, 'Old', Decimal('100.00'), 'cancelled'),
+                (self.other, 'Elsewhere', Decimal('100.00'), 'active'),
+            ]
+        ]
+
+    def _goals(self):
+        return {goal.name: (goal.current_amount, goal.progress, goal.status) for goal in SavingsGoal.objects.all()}
+
+    def test_deposit_moves_active_goals(self):
+        deposit(self.savings, Decimal('30.00'))
+        self.assertEqual(self.savings.balance, Decimal('30.00'))
+        self.assertEqual(self._goals(), {
+            'Small': (Decimal('30.00'), Decimal('30.00'), 'active'),
+            'Large': (Decimal('30.00'), Decimal('7.50'), 'active'),
+            'Old': (Decimal('0.00'), Decimal('0.00'), 'cancelled'),
+            'Elsewhere': (Decimal('0.00'), Decimal('0.00'), 'active'),
+        })
+
+    def test_reaching_the_target_completes_the_goal(self):
+        deposit(self.savings, Decimal('70.00'))
+        deposit(self.savings, Decimal('50.00'))
+        goals = self._goals()
+        # The amount keeps the overshoot, progress stops at 100%
+        self.assertEqual(goals['Small'], (Decimal('120.00'), Decimal('100.00'), 'completed'))
+        self.assertEqual(goals['Large'], (Decimal('120.00'), Decimal('30.00'), 'active'))
+        self.assertIsNotNone(SavingsGoal.objects.get(pk=self.small.pk).completed_at)
+        # Completed goals stop moving
+        deposit(self.savings, Decimal('10.00'))
+        self.assertEqual(self._goals()['Small'][0], Decimal('120.00'))
+
+    def test_changes_for_many_accounts_in_one_update(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(track_goals({self.savings.pk: Decimal('40.00'), self.other.pk: Decimal('-5.00')}), 3)
+        goals = self._goals()
+        self.assertEqual(goals['Large'][:2], (Decimal('40.00'), Decimal('10.00')))
+        # Goals never go below zero
+        self.assertEqual(goals['Elsewhere'][:2], (Decimal('0.00'), Decimal('0.00')))
+
+
+class WithdrawalLimitTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='spender')
+        self.account = Account.objects.create(user=self.user, account_number='SPEND1', balance=Decimal('0.00'))
+        self.product = SavingsProduct.objects.create(name='Limited', interest_rate=Decimal('1.00'), withdrawal_limit=2,
+                                                     penalty_rate=Decimal('2.50'))
+        self.savings = SavingsAccount.objects.create(user=self.user, product=self.product, account=self.account,
+                                                     account_number='SPENDS1', balance=Decimal('1000.00'))
+        self.goal = SavingsGoal.objects.create(user=self.user, savings_account=self.savings, name='Trip',
+                                               target_amount=Decimal('2000.00'), current_amount=Decimal('1000.00'),
+                                               target_date=timezone.localdate())
+
+    def test_penalty_over_the_limit(self):
+        self.assertEqual(withdraw(self.savings, Decimal('100.00')), Decimal('0.00'))
+        self.assertEqual(withdraw(self.savings, Decimal('100.00')), Decimal('0.00'))
+        self.assertFalse(InterestTransaction.objects.exists())
+
+        self.assertEqual(withdraw(self.savings, Decimal('100.00')), Decimal('2.50'))
+        self.assertEqual((self.savings.balance, self.savings.withdrawals_this_month), (Decimal('697.50'), 3))
+        penalty = InterestTransaction.objects.get()
+        self.assertEqual((penalty.entry_type, penalty.amount, penalty.interest_rate),
+                         ('penalty', Decimal('2.50'), Decimal('2.50')))
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_amount, Decimal('697.50'))
+
+    def test_balance_must_cover_the_penalty(self):
+        SavingsAccount.objects.filter(pk=self.savings.pk).update(withdrawals_this_month=2,
+                                                                 withdrawals_month=current_month())
+        self.assertIsNone(withdraw(self.savings, Decimal('1000.00')))
+        self.savings.refresh_from_db()
+        self.assertEqual((self.savings.balance, self.savings.withdrawals_this_month), (Decimal('1000.00'), 2))
+        self.assertFalse(InterestTransaction.objects.exists())
+        self.assertEqual(withdraw(self.savings, Decimal('975.60')), Decimal('24.39'))
+        self.assertEqual(self.savings.balance, Decimal('0.01'))
+
+    def test_counter_from_an_earlier_month_starts_over(self):
+        last_month = add_months(current_month(), -1)
+        SavingsAccount.objects.filter(pk=self.savings.pk).update(withdrawals_this_month=5, withdrawals_month=last_month)
+        self.savings.refresh_from_db()
+        self.assertEqual(self.savings.current_withdrawals, 0)
+        self.assertEqual(withdraw(self.savings, Decimal('10.00')), Decimal('0.00'))
+        self.assertEqual((self.savings.withdrawals_this_month, self.savings.withdrawals_month), (1, current_month()))
+
+    def test_no_free_withdrawals_at_zero_limit(self):
+        SavingsProduct.objects.filter(pk=self.product.pk).update(withdrawal_limit=0)
+        self.savings.refresh_from_db()
+        self.assertEqual(withdraw(self.savings, Decimal('100.00')), Decimal('2.50'))
+
+    def test_reset_only_touches_stale_counters(self):
+        month = current_month()
+        last_month = add_months(month, -1)
+        rows = [(5, last_month), (3, None), (0, last_month), (2, month)]
+        accounts = [
+            SavingsAccount.objects.create(user=self.user, product=self.product, account=self.account,
+                                          account_number=f'RESET{i}', withdrawals_this_month=count,
+                                          withdrawals_month=counted)
+            for i, (count, counted) in enumerate(rows)
+        ]
+        self.assertEqual(reset_withdrawal_counters(chunk_size=1), 2)
+        self.assertEqual(
+            [SavingsAccount.objects.values_list('withdrawals_this_month', 'withdrawals_month').get(pk=account.pk)
+             for account in accounts],
+            [(0, month), (0, month), (0, last_month), (2, month)],
+        )
+        self.assertEqual(reset_withdrawal_counters(), 0)
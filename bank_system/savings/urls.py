@@ -6,6 +6,10 @@ app_name = 'savings'
 urlpatterns = [
     path('', views.savings_list, name='savings_list'),
     path('<int:pk>/', views.savings_detail, name='savings_detail'),
+    path('<int:pk>/deposit/', views.savings_deposit, name='savings_deposit'),
+    path('<int:pk>/withdraw/', views.savings_withdraw, name='savings_withdraw'),
+    path('<int:pk>/projection/', views.savings_projection, name='savings_projection'),
+    path('products/<int:pk>/projection/', views.product_projection, name='product_projection'),
     path('create/', views.create_savings_account, name='create_savings_account'),
     path('<int:savings_account_id>/goals/create/', views.create_goal, name='create_goal'),
     path('goals/', views.goals_list, name='goals_list'),
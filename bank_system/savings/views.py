@@ -2,18 +2,23 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
+from django.http import JsonResponse
 from django.utils import timezone
-from decimal import Decimal
-import random
+from decimal import Decimal, InvalidOperation
 
 from .models import SavingsProduct, SavingsAccount, SavingsGoal, InterestTransaction
+from .balances import deposit, withdraw
+from .projections import MAX_MONTHS, MAX_SCENARIO_VALUES, estimate_goal_completion, project
 from accounts.models import Account
+from accounts.balances import credit, debit
+from transactions.models import Transaction
+from accounts.numbering import allocate_account_number
 
 
 @login_required
 def savings_list(request):
     """List all savings accounts for the user"""
-    savings_accounts = SavingsAccount.objects.filter(user=request.user)
+    savings_accounts = SavingsAccount.objects.filter(user=request.user).select_related('product')
     products = SavingsProduct.objects.filter(is_active=True)
 
     context = {
@@ -26,20 +31,24 @@ def savings_list(request):
 @login_required
 def savings_detail(request, pk):
     """Detail view for a savings account"""
-    savings_account = get_object_or_404(SavingsAccount, pk=pk, user=request.user)
+    savings_account = get_object_or_404(SavingsAccount.objects.select_related('product'), pk=pk, user=request.user)
     interest_transactions = savings_account.interest_transactions.all()[:10]
-    goals = savings_account.goals.filter(status='active')
+    contribution = _goal_contribution(request)
+    goals = estimate_goal_completion(
+        savings_account.goals.filter(status='active').select_related('savings_account__product'), contribution
+    )
 
     context = {
         'savings_account': savings_account,
         'interest_transactions': interest_transactions,
         'goals': goals,
+        'contribution': contribution,
+        'projected_balance': savings_account.projected_balance(365),
     }
     return render(request, 'savings/savings_detail.html', context)
 
 
 @login_required
-@transaction.atomic
 def create_savings_account(request):
     """Create a new savings account"""
     if request.method == 'POST':
@@ -57,27 +66,23 @@ def create_savings_account(request):
                 messages.error(request, f'Initial deposit must be at least ${product.min_balance}')
                 return redirect('savings:savings_list')
 
-            # Deduct from account if initial deposit
-            if initial_deposit > 0:
-                if account.balance < initial_deposit:
+            # Reserved outside the transaction below so a rollback cannot hand the block back
+            account_number = allocate_account_number('savings')
+
+            with transaction.atomic():
+                # Deduct from account if initial deposit
+                if initial_deposit > 0 and not debit(account, initial_deposit):
                     messages.error(request, 'Insufficient balance in account')
                     return redirect('savings:savings_list')
-                account.balance -= initial_deposit
-                account.save()
-
-            # Generate account number
-            account_number = f"SAV{random.randint(10000000, 99999999)}"
-            while SavingsAccount.objects.filter(account_number=account_number).exists():
-                account_number = f"SAV{random.randint(10000000, 99999999)}"
-
-            # Create savings account
-            savings_account = SavingsAccount.objects.create(
-                user=request.user,
-                product=product,
-                account=account,
-                account_number=account_number,
-                balance=initial_deposit
-            )
+
+                # Create savings account
+                savings_account = SavingsAccount.objects.create(
+                    user=request.user,
+                    product=product,
+                    account=account,
+                    account_number=account_number,
+                    balance=initial_deposit
+                )
 
             messages.success(request, f'Savings account {account_number} created successfully!')
             return redirect('savings:savings_detail', pk=savings_account.pk)
@@ -96,6 +101,91 @@ def create_savings_account(request):
     return render(request, 'savings/create_savings_account.html', context)
 
 
+def _parse_amount(request):
+    """The positive, whole-cent POST amount, or None"""
+    try:
+        amount = Decimal(request.POST.get('amount', ''))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount <= 0:
+        return None
+    # Fractions of a cent would be rounded away by the database after the money moved
+    if amount.normalize().as_tuple().exponent < -2:
+        return None
+    return amount
+
+
+@login_required
+@transaction.atomic
+def savings_deposit(request, pk):
+    """Move money from the linked account into a savings account"""
+    savings_account = get_object_or_404(
+        SavingsAccount.objects.select_related('account', 'product'), pk=pk, user=request.user, status='active'
+    )
+
+    if request.method == 'POST':
+        amount = _parse_amount(request)
+        if amount is None:
+            messages.error(request, 'Please enter a valid amount')
+        elif not debit(savings_account.account, amount):
+            messages.error(request, 'Insufficient balance in account')
+        else:
+            deposit(savings_account, amount)
+            Transaction.objects.create(
+                from_account=savings_account.account,
+                transaction_type='withdrawal',
+                amount=amount,
+                description=f'Savings deposit to {savings_account.account_number}'
+            )
+            messages.success(request, f'Deposited ${amount} to {savings_account.account_number}')
+            return redirect('savings:savings_detail', pk=pk)
+
+    context = {
+        'savings_account': savings_account,
+        'action': 'deposit',
+    }
+    return render(request, 'savings/savings_transfer.html', context)
+
+
+@login_required
+@transaction.atomic
+def savings_withdraw(request, pk):
+    """Move money from a savings account back to the linked account"""
+    savings_account = get_object_or_404(
+        SavingsAccount.objects.select_related('account', 'product'), pk=pk, user=request.user, status='active'
+    )
+
+    if request.method == 'POST':
+        amount = _parse_amount(request)
+        if amount is None:
+            messages.error(request, 'Please enter a valid amount')
+        else:
+            penalty = withdraw(savings_account, amount)
+            if penalty is None:
+                messages.error(request, 'Insufficient savings balance')
+            else:
+                credit(savings_account.account, amount)
+                Transaction.objects.create(
+                    to_account=savings_account.account,
+                    transaction_type='deposit',
+                    amount=amount,
+                    description=f'Savings withdrawal from {savings_account.account_number}'
+                )
+                if penalty:
+                    messages.warning(
+                        request,
+                        f'Monthly withdrawal limit exceeded: a ${penalty} penalty was taken from your savings'
+                    )
+                messages.success(request, f'Withdrew ${amount} from {savings_account.account_number}')
+                return redirect('savings:savings_detail', pk=pk)
+
+    context = {
+        'savings_account': savings_account,
+        'action': 'withdraw',
+    }
+    return render(request, 'savings/savings_transfer.html', context)
+
+
 @login_required
 @transaction.atomic
 def create_goal(request, savings_account_id):
@@ -129,8 +219,75 @@ def create_goal(request, savings_account_id):
 @login_required
 def goals_list(request):
     """List all savings goals"""
-    goals = SavingsGoal.objects.filter(user=request.user)
+    contribution = _goal_contribution(request)
+    goals = estimate_goal_completion(
+        SavingsGoal.objects.filter(user=request.user)
+        .select_related('savings_account__product')
+        .order_by('status', '-progress'),
+        contribution,
+    )
     context = {
         'goals': goals,
+        'contribution': contribution,
     }
     return render(request, 'savings/goals_list.html', context)
+
+
+def _finite_decimal(value):
+    number = Decimal(value)
+    if not number.is_finite() or number < 0:
+        raise ValueError(value)
+    return number
+
+
+def _goal_contribution(request):
+    """Monthly contribution goal estimates assume, from the `contribution` query parameter"""
+    try:
+        return _finite_decimal(request.GET.get('contribution') or '0')
+    except (InvalidOperation, ValueError):
+        return Decimal('0')
+
+
+def _scenario_params(request):
+    """Read repeated rate/contribution/months query parameters, raises ValueError when invalid"""
+    def values(name, convert):
+        raw = request.GET.getlist(name)
+        if len(raw) > MAX_SCENARIO_VALUES:
+            raise ValueError(f'At most {MAX_SCENARIO_VALUES} values for {name}')
+        try:
+            return [convert(value) for value in raw]
+        except (InvalidOperation, ValueError):
+            raise ValueError(f'Invalid value for {name}')
+
+    rates = values('rate', _finite_decimal)
+    contributions = values('contribution', _finite_decimal) or [Decimal('0')]
+    months = values('months', int) or [12]
+    if any(month < 1 or month > MAX_MONTHS for month in months):
+        raise ValueError(f'months must be between 1 and {MAX_MONTHS}')
+    return rates, contributions, months
+
+
+def _projection_response(request, source, start=None):
+    try:
+        rates, contributions, months = _scenario_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(project(source, start, rates, contributions, months).as_dict())
+
+
+@login_required
+def savings_projection(request, pk):
+    """JSON projections for a savings account, one scenario per rate x contribution x months"""
+    savings_account = get_object_or_404(SavingsAccount.objects.select_related('product'), pk=pk, user=request.user)
+    return _projection_response(request, savings_account)
+
+
+@login_required
+def product_projection(request, pk):
+    """JSON projections for a savings product starting from `amount` (defaults to the minimum balance)"""
+    product = get_object_or_404(SavingsProduct, pk=pk, is_active=True)
+    try:
+        start = _finite_decimal(request.GET['amount']) if request.GET.get('amount') else None
+    except (InvalidOperation, ValueError):
+        return JsonResponse({'error': 'Invalid value for amount'}, status=400)
+    return _projection_response(request, product, start)
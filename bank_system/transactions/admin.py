@@ -5,4 +5,5 @@ from .models import Transaction
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['transaction_type', 'amount', 'from_account', 'to_account', 'created_at']
     list_filter = ['transaction_type', 'created_at']
-    search_fields = ['from_account__account_number', 'to_account__account_number']
\ No newline at end of file
+    search_fields = ['from_account__account_number', 'to_account__account_number']
+    ordering = ['-created_at']
\ No newline at end of file
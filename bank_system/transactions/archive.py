@@ -0,0 +1,208 @@
+"""
+Hot/cold transaction storage
+
+Transactions older than TRANSACTION_ARCHIVE_HORIZON_DAYS are moved in batches
+from the hot Transaction table to ArchivedTransaction in the archive database
+(see transactions.routers). History readers only touch the archive when the
+requested range reaches back past the newest archived row, so everyday
+reads and inserts work against a small hot table.
+"""
+
+import heapq
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Transaction, ArchivedTransaction
+
+DEFAULT_HORIZON_DAYS = 365
+WATERMARK_CACHE_KEY = 'transaction_archive_watermark'
+# Stored in the cache while nothing has been archived yet
+NO_WATERMARK = 'none'
+
+HISTORY_FIELDS = [
+    'id', 'created_at', 'transaction_type', 'amount', 'description',
+    'from_account_id', 'from_account_number', 'to_account_id', 'to_account_number',
+]
+
+# The same columns read from the hot table, account numbers joined in
+_HOT_FIELDS = [
+    'id', 'created_at', 'transaction_type', 'amount', 'description',
+    'from_account_id', 'from_account__account_number', 'to_account_id', 'to_account__account_number',
+]
+
+_TRANSACTION_TYPE_LABELS = dict(Transaction.TRANSACTION_TYPES)
+
+
+class HistoryEntry(namedtuple('HistoryEntry', HISTORY_FIELDS)):
+    """Read-only transaction row that looks the same whether it came from hot or cold storage"""
+    __slots__ = ()
+
+    def get_transaction_type_display(self):
+        return _TRANSACTION_TYPE_LABELS.get(self.transaction_type, self.transaction_type)
+
+
+def archive_cutoff(now=None):
+    horizon = getattr(settings, 'TRANSACTION_ARCHIVE_HORIZON_DAYS', DEFAULT_HORIZON_DAYS)
+    return (now or timezone.now()) - timedelta(days=horizon)
+
+
+def cold_watermark():
+    """created_at of the newest archived transaction, or None if the archive is empty"""
+    watermark = cache.get(WATERMARK_CACHE_KEY)
+    if watermark is None:
+        try:
+            watermark = ArchivedTransaction.objects.aggregate(latest=Max('created_at'))['latest']
+        except DatabaseError:
+            # Archive database not migrated yet
+            watermark = None
+        cache.set(WATERMARK_CACHE_KEY, watermark or NO_WATERMARK, 60 * 60)
+    return None if watermark == NO_WATERMARK else watermark
+
+
+def needs_cold(start_at):
+    """Whether a range beginning at `start_at` (None = from the beginning) reaches archived data"""
+    watermark = cold_watermark()
+    return watermark is not None and (start_at is None or start_at <= watermark)
+
+
+def _hot_rows(account_ids, start_at, end_at, descending):
+    queryset = Transaction.objects.filter(Q(from_account_id__in=account_ids) | Q(to_account_id__in=account_ids))
+    if start_at is not None:
+        queryset = queryset.filter(created_at__gte=start_at)
+    if end_at is not None:
+        queryset = queryset.filter(created_at__lt=end_at)
+    order = ['-created_at', '-id'] if descending else ['created_at', 'id']
+    return queryset.order_by(*order).values_list(*_HOT_FIELDS)
+
+
+def _cold_rows(account_ids, start_at, end_at, descending):
+    queryset = ArchivedTransaction.objects.filter(
+        Q(from_account_id__in=account_ids) | Q(to_account_id__in=account_ids)
+    )
+    if start_at is not None:
+        queryset = queryset.filter(created_at__gte=start_at)
+    if end_at is not None:
+        queryset = queryset.filter(created_at__lt=end_at)
+    order = ['-created_at', '-id'] if descending else ['created_at', 'id']
+    return queryset.order_by(*order).values_list(*HISTORY_FIELDS)
+
+
+def iter_account_history(account_ids, start_at=None, end_at=None, descending=False, chunk_size=2000,
+                         include_cold=True):
+    """
+    Yield HistoryEntry rows touching any of `account_ids` in [start_at, end_at).
+
+    Both sources are read through server side cursors and merged lazily, so
+    memory use does not depend on the size of the range. Pass
+    include_cold=False to read the hot table only.
+    """
+    account_ids = list(account_ids)
+    hot = (HistoryEntry(*row) for row in _hot_rows(account_ids, start_at, end_at, descending).iterator(chunk_size=chunk_size))
+    if not include_cold or not needs_cold(start_at):
+        return hot
+    cold = (HistoryEntry(*row) for row in _cold_rows(account_ids, start_at, end_at, descending).iterator(chunk_size=chunk_size))
+    return heapq.merge(cold, hot, key=lambda entry: (entry.created_at, entry.id), reverse=descending)
+
+
+def net_change_since(account, start_at):
+    """Credits minus debits for `account` from `start_at` onwards, across hot and cold storage"""
+    sources = [Transaction.objects.filter(Q(from_account=account) | Q(to_account=account))]
+    if needs_cold(start_at):
+        sources.append(ArchivedTransaction.objects.filter(
+            Q(from_account_id=account.pk) | Q(to_account_id=account.pk)
+        ))
+    total = 0
+    for queryset in sources:
+        totals = queryset.filter(created_at__gte=start_at).aggregate(
+            credits=Sum('amount', filter=Q(to_account_id=account.pk)),
+            debits=Sum('amount', filter=Q(from_account_id=account.pk)),
+        )
+        total += (totals['credits'] or 0) - (totals['debits'] or 0)
+    return total
+
+
+def transaction_totals():
+    """
+    {transaction_type: (count, volume)} over all transactions, hot and cold.
+
+    Archived rows are only read when something has been archived, so this
+    is two grouped queries at most.
+    """
+    sources = [Transaction.objects.all()]
+    if cold_watermark() is not None:
+        sources.append(ArchivedTransaction.objects.all())
+    totals = {}
+    for queryset in sources:
+        rows = queryset.order_by().values('transaction_type').annotate(count=Count('id'), volume=Sum('amount'))
+        for row in rows:
+            count, volume = totals.get(row['transaction_type'], (0, 0))
+            totals[row['transaction_type']] = (count + row['count'], volume + (row['volume'] or 0))
+    return totals
+
+
+def archivable_transactions(cutoff):
+    """Hot rows old enough to archive that nothing else still points at"""
+    return Transaction.objects.filter(
+        created_at__lt=cutoff,
+        fraud_detection__isnull=True,
+        investmenttransaction__isnull=True,
+        loanpayment__isnull=True,
+        bill__isnull=True,
+    )
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """
+    Move one batch of old transactions to cold storage, returns how many moved.
+
+    Rows are copied before they are deleted and keep their ids, so a batch
+    interrupted halfway is simply copied again (duplicates are ignored) on
+    the next run.
+    """
+    rows = list(
+        archivable_transactions(cutoff).order_by('id').values_list(*_HOT_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    ArchivedTransaction.objects.bulk_create(
+        [
+            ArchivedTransaction(
+                id=row_id,
+                period=created_at.year * 100 + created_at.month,
+                from_account_id=from_id,
+                from_account_number=from_number or '',
+                to_account_id=to_id,
+                to_account_number=to_number or '',
+                transaction_type=transaction_type,
+                amount=amount,
+                description=description,
+                created_at=created_at,
+            )
+            for row_id, created_at, transaction_type, amount, description, from_id, from_number, to_id, to_number in rows
+        ],
+        ignore_conflicts=True,
+    )
+    with transaction.atomic():
+        Transaction.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_old_transactions(batch_size=1000, cutoff=None):
+    """Archive everything older than the horizon, returns the number of rows moved"""
+    cutoff = cutoff or archive_cutoff()
+    moved = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+    if moved:
+        cache.delete(WATERMARK_CACHE_KEY)
+    return moved
@@ -1,6 +1,7 @@
 from django import forms
 from .models import Transaction
-from accounts.models import Account
+from accounts.directory import resolve_account_number
+from accounts.numbering import is_plausible_account_number
 
 class DepositForm(forms.ModelForm):
     class Meta:
@@ -36,8 +37,9 @@ class TransferForm(forms.ModelForm):
     
     def clean_to_account_number(self):
         account_number = self.cleaned_data['to_account_number']
-        try:
-            account = Account.objects.get(account_number=account_number, is_active=True)
-            return account
-        except Account.DoesNotExist:
-            raise forms.ValidationError("Invalid or inactive account number.")
\ No newline at end of file
+        if not is_plausible_account_number(account_number):
+            raise forms.ValidationError("Invalid account number. Please check it for typos.")
+        entry = resolve_account_number(account_number)
+        if entry is None or not entry.is_active:
+            raise forms.ValidationError("Invalid or inactive account number.")
+        return entry
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Idempotency keys for money-moving endpoints
+
+Clients send an ``Idempotency-Key`` header (browsers post an ``idempotency_key``
+hidden field instead). The first request with a given key executes the view;
+any retry with the same key gets the stored response back without touching
+balances again. Reusing a key for a different path or different form data is
+refused with 422.
+"""
+
+import hashlib
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+# Form fields that differ between retries of the same request
+UNHASHED_FIELDS = {IDEMPOTENCY_FIELD, 'csrfmiddlewaretoken'}
+DEFAULT_TTL = 60 * 60 * 24
+
+
+def get_ttl():
+    """Seconds an idempotency key (and its cached response) is kept"""
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+
+
+def get_idempotency_key(request):
+    """Return the client supplied key from the header or form field, if any"""
+    key = request.META.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD, '')
+    key = key.strip()
+    if not key or len(key) > 255:
+        return None
+    return key
+
+
+def _cache_key(user_id, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{user_id}:{digest}'
+
+
+def _fingerprint(request):
+    """SHA-256 of the path and the form data, so a key cannot be reused for another request"""
+    fields = sorted(
+        (name, value) for name, values in request.POST.lists() if name not in UNHASHED_FIELDS for value in values
+    )
+    payload = '\n'.join([request.path] + [f'{name}={value}' for name, value in fields])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _conflict():
+    return HttpResponse('Idempotency key was already used for a different request.', status=422)
+
+
+def _snapshot(record):
+    return {
+        'path': record.request_path,
+        'hash': record.request_hash,
+        'status': record.response_status,
+        'location': record.response_location,
+        'body': record.response_body,
+    }
+
+
+def _replay(request, snapshot):
+    """Rebuild the stored response for a retried request"""
+    response = HttpResponse(snapshot['body'], status=snapshot['status'])
+    if snapshot['location']:
+        response['Location'] = snapshot['location']
+    response['Idempotent-Replayed'] = 'true'
+    messages.info(request, 'This request was already processed.')
+    return response
+
+
+def idempotent(view_func):
+    """
+    Run a POST view at most once per (user, idempotency key).
+
+    The key row is inserted in the same transaction as the view's writes, so a
+    concurrent retry blocks on the unique index until the first request commits
+    and then replays its response. Only successful (redirect) responses are
+    recorded; anything else releases the key so the client can fix the input
+    and retry with it.
+
+    Usage:
+        @login_required
+        @idempotent
+        @transaction.atomic
+        def deposit(request, account_pk):
+            ...
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = get_idempotency_key(request) if request.method == 'POST' else None
+        # Templates embed this so browser double-submits share one key
+        request.idempotency_key = key or uuid.uuid4().hex
+
+        if key is None or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        cache_key = _cache_key(request.user.pk, key)
+        fingerprint = _fingerprint(request)
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            if snapshot['hash'] != fingerprint:
+                return _conflict()
+            return _replay(request, snapshot)
+
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=get_ttl())
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        request_path=request.path,
+                        request_hash=fingerprint,
+                        expires_at=expires_at,
+                    )
+            except IntegrityError:
+                record = IdempotencyKey.objects.select_for_update().get(user=request.user, key=key)
+                if record.expires_at <= now:
+                    # Expired but not swept yet, reuse the row for this request
+                    record.request_path = request.path
+                    record.request_hash = fingerprint
+                    record.status = 'processing'
+                    record.expires_at = expires_at
+                elif record.request_hash != fingerprint:
+                    return _conflict()
+                elif record.status == 'completed':
+                    snapshot = _snapshot(record)
+                    cache.set(cache_key, snapshot, max(int((record.expires_at - now).total_seconds()), 1))
+                    return _replay(request, snapshot)
+                else:
+                    return HttpResponse('A request with this idempotency key is still in progress.', status=409)
+
+            response = view_func(request, *args, **kwargs)
+
+            if 300 <= response.status_code < 400:
+                record.status = 'completed'
+                record.response_status = response.status_code
+                record.response_location = response.get('Location', '')
+                record.response_body = response.content.decode(response.charset or 'utf-8', errors='replace')
+                record.save()
+                snapshot = _snapshot(record)
+                transaction.on_commit(lambda: cache.set(cache_key, snapshot, get_ttl()))
+            else:
+                record.delete()
+
+        return response
+
+    return wrapper
+
+
+def sweep_expired_keys(batch_size=1000, now=None):
+    """Delete expired idempotency keys in batches, returns the number removed"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        batch = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by()
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+        deleted, _ = IdempotencyKey.objects.filter(pk__in=batch).delete()
+        total += deleted
+    return total
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from transactions.archive import archive_cutoff, archive_old_transactions
+
+
+class Command(BaseCommand):
+    help = 'Move transactions older than the archive horizon to the archive database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override TRANSACTION_ARCHIVE_HORIZON_DAYS')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per batch')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+        else:
+            cutoff = archive_cutoff()
+
+        self.stdout.write(self.style.WARNING(f'Archiving transactions created before {cutoff:%Y-%m-%d %H:%M}...'))
+        started = timezone.now()
+        moved = archive_old_transactions(batch_size=options['batch_size'], cutoff=cutoff)
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} transactions in {elapsed:.1f}s'))
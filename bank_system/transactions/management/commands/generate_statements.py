@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import Account
+from core.batch import chunked, run_in_processes
+from transactions.statements import FORMATS, statement_filename, write_statement
+
+
+def write_month_end_statements(account_ids, start, end, fmt, output_dir):
+    """Worker: write statements for a batch of accounts, returns (accounts, bytes)"""
+    written = 0
+    accounts = Account.objects.filter(pk__in=account_ids).only('id', 'account_number', 'balance', 'is_hot')
+    for account in accounts.iterator():
+        path = Path(output_dir) / statement_filename(account, start, end, fmt)
+        written += write_statement(account, start, end, fmt, path)
+    return len(account_ids), written
+
+
+class Command(BaseCommand):
+    help = 'Generate month-end statements for all active accounts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Statement month as YYYY-MM (defaults to last month)')
+        parser.add_argument('--format', default='pdf', choices=sorted(FORMATS))
+        parser.add_argument('--output-dir', default='statements')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=200, help='Accounts per worker task')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                year, month = (int(part) for part in options['month'].split('-'))
+                start = date(year, month, 1)
+            except ValueError:
+                raise CommandError('--month must look like YYYY-MM')
+        else:
+            start = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+        output_dir = Path(options['output_dir']) / f'{start:%Y-%m}'
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        account_ids = Account.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True)
+        tasks = [
+            (batch, start, end, options['format'], str(output_dir))
+            for batch in chunked(account_ids, options['batch_size'])
+        ]
+
+        self.stdout.write(self.style.WARNING(
+            f'Generating {start:%B %Y} statements for {len(account_ids)} accounts...'
+        ))
+        started = timezone.now()
+        total_accounts = total_bytes = 0
+        for accounts, written in run_in_processes(write_month_end_statements, tasks, options['workers']):
+            total_accounts += accounts
+            total_bytes += written
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total_accounts} statements ({total_bytes / 1024:.1f} KiB) to {output_dir} in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from transactions.idempotency import sweep_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sweep every N seconds (0 runs once)')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_expired_keys(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired idempotency keys'))
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_accountnumbersequence"),
+        ("transactions", "0003_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTransaction",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "period",
+                    models.PositiveIntegerField(
+                        help_text="Monthly partition key as YYYYMM"
+                    ),
+                ),
+                ("from_account_id", models.BigIntegerField(blank=True, null=True)),
+                ("from_account_number", models.CharField(blank=True, max_length=20)),
+                ("to_account_id", models.BigIntegerField(blank=True, null=True)),
+                ("to_account_number", models.CharField(blank=True, max_length=20)),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[
+                            ("deposit", "Deposit"),
+                            ("withdrawal", "Withdrawal"),
+                            ("transfer", "Transfer"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("description", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name="transaction",
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["created_at"], name="transaction_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["from_account", "created_at"],
+                name="transaction_from_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["to_account", "created_at"], name="transaction_to_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtransaction",
+            index=models.Index(
+                fields=["period", "created_at"], name="archive_period_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtransaction",
+            index=models.Index(
+                fields=["from_account_id", "created_at"],
+                name="archive_from_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtransaction",
+            index=models.Index(
+                fields=["to_account_id", "created_at"], name="archive_to_created_idx"
+            ),
+        ),
+    ]
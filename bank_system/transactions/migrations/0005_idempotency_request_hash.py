@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0004_transaction_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="request_hash",
+            field=models.CharField(
+                blank=True, help_text="SHA-256 of the path and form data", max_length=64
+            ),
+        ),
+    ]
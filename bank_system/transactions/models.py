@@ -19,7 +19,39 @@ class Transaction(models.Model):
         return f"{self.transaction_type} - ${self.amount} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
     class Meta:
-        ordering = ['-created_at']
+        # No default ordering: history queries order explicitly and everything else stays unsorted
+        indexes = [
+            models.Index(fields=['created_at'], name='transaction_created_idx'),
+            models.Index(fields=['from_account', 'created_at'], name='transaction_from_created_idx'),
+            models.Index(fields=['to_account', 'created_at'], name='transaction_to_created_idx'),
+        ]
+
+
+class ArchivedTransaction(models.Model):
+    """Cold copy of a Transaction older than the archive horizon, stored in the archive database"""
+    # Same id as the hot row it was moved from
+    id = models.BigIntegerField(primary_key=True)
+    period = models.PositiveIntegerField(help_text="Monthly partition key as YYYYMM")
+    # Plain columns rather than foreign keys: accounts live in the default database
+    from_account_id = models.BigIntegerField(null=True, blank=True)
+    from_account_number = models.CharField(max_length=20, blank=True)
+    to_account_id = models.BigIntegerField(null=True, blank=True)
+    to_account_number = models.CharField(max_length=20, blank=True)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.transaction_type} - ${self.amount} - {self.created_at.strftime('%Y-%m-%d %H:%M')} (archived)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['period', 'created_at'], name='archive_period_created_idx'),
+            models.Index(fields=['from_account_id', 'created_at'], name='archive_from_created_idx'),
+            models.Index(fields=['to_account_id', 'created_at'], name='archive_to_created_idx'),
+        ]
 
 
 class FraudDetection(models.Model):
@@ -62,4 +94,35 @@ class FraudDetection(models.Model):
 
     class Meta:
         ordering = ['-detected_at']
-        verbose_name_plural = "Fraud Detections"
\ No newline at end of file
+        verbose_name_plural = "Fraud Detections"
+
+
+class IdempotencyKey(models.Model):
+    """Remember the outcome of a money-moving request so client retries are replayed, not re-executed"""
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+    ]
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_path = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the path and form data")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_location = models.CharField(max_length=255, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} - {self.user.username} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
@@ -0,0 +1,28 @@
+class TransactionArchiveRouter:
+    """
+    Send ArchivedTransaction to the 'archive' database and keep everything
+    else out of it.
+    """
+    archive_db = 'archive'
+    archive_models = {'archivedtransaction'}
+
+    def _is_archive_model(self, model):
+        return model._meta.app_label == 'transactions' and model._meta.model_name in self.archive_models
+
+    def db_for_read(self, model, **hints):
+        if self._is_archive_model(model):
+            return self.archive_db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if self._is_archive_model(model):
+            return self.archive_db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        is_archive_model = app_label == 'transactions' and model_name in self.archive_models
+        if db == self.archive_db:
+            return is_archive_model
+        if is_archive_model:
+            return False
+        return None
@@ -1,3 +1,215 @@
+import csv
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.balances import credit, enable_hot_mode
+from accounts.models import Account
+from bills.models import Bill, Biller
+from core.testing import QueryCountMixin
+from loans.models import Loan, LoanPayment, LoanProduct
+from .archive import archive_batch, archive_cutoff, archive_old_transactions, iter_account_history, transaction_totals
+from .idempotency import sweep_expired_keys
+from .management.commands.generate_statements import write_month_end_statements
+from .models import ArchivedTransaction, IdempotencyKey, Transaction
+from .statements import statement_filename, stream_csv, stream_jsonl, stream_pdf
+
+
+class ArchiveTests(QueryCountMixin, TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='holder')
+        self.account = Account.objects.create(user=self.user, account_number='ARC1', balance=Decimal('100'))
+        self.old = timezone.now() - timedelta(days=400)
+
+    def _transaction(self, amount, created_at, transaction_type='deposit'):
+        row = Transaction.objects.create(to_account=self.account, transaction_type=transaction_type, amount=amount)
+        # created_at is auto_now_add, so backdate it afterwards
+        Transaction.objects.filter(pk=row.pk).update(created_at=created_at)
+        return row
+
+    def test_moves_old_rows_and_keeps_history(self):
+        old = self._transaction(Decimal('5.00'), self.old)
+        recent = self._transaction(Decimal('7.00'), timezone.now())
+
+        self.assertEqual(archive_old_transactions(), 1)
+        self.assertFalse(Transaction.objects.filter(pk=old.pk).exists())
+        self.assertEqual(ArchivedTransaction.objects.get(pk=old.pk).amount, Decimal('5.00'))
+        history = [entry.id for entry in iter_account_history([self.account.pk])]
+        self.assertEqual(history, [old.pk, recent.pk])
+        self.assertEqual(transaction_totals(), {'deposit': (2, Decimal('12.00'))})
+        self.assertEqual(archive_old_transactions(), 0)
+
+    def test_linked_rows_stay_hot(self):
+        paid_bill = self._transaction(Decimal('20.00'), self.old, 'withdrawal')
+        biller = Biller.objects.create(user=self.user, name='Power')
+        bill = Bill.objects.create(biller=biller, amount=Decimal('20.00'), due_date=date.today(), transaction=paid_bill)
+        installment = self._transaction(Decimal('30.00'), self.old, 'withdrawal')
+        product = LoanProduct.objects.create(name='P', loan_type='personal', min_amount=1, max_amount=1000,
+                                             interest_rate=Decimal('5'), min_term=1, max_term=12)
+        loan = Loan.objects.create(user=self.user, product=product, principal_amount=100, interest_rate=5, loan_term=1)
+        LoanPayment.objects.create(loan=loan, amount=Decimal('30.00'), is_paid=True, transaction=installment)
+
+        self.assertEqual(archive_old_transactions(), 0)
+        bill.refresh_from_db()
+        self.assertEqual(bill.transaction_id, paid_bill.pk)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_batch_query_count_does_not_grow_with_rows(self):
+        cutoff = archive_cutoff()
+        for _ in range(6):
+            self._transaction(Decimal('1.00'), self.old)
+        # Rows are read and deleted on the default database and copied on the archive one
+        moved = self.assertQueryCountFixed(
+            lambda: archive_batch(cutoff, 1), lambda: archive_batch(cutoff, 100), using=('default', 'archive'),
+        )
+        self.assertEqual(moved, (1, 5))
+
+
+class StatementTests(TestCase):
+    """Running balances carry over from archived rows into hot ones"""
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username='statement')
+        # The balance already includes every transaction below
+        self.account = Account.objects.create(user=user, account_number='STM1', balance=Decimal('100.00'))
+        payee = Account.objects.create(user=user, account_number='STM2', balance=Decimal('0.00'))
+        now = timezone.now()
+        for days, amount, sender, receiver, transaction_type in [
+            (400, '40.00', None, self.account, 'deposit'),
+            (390, '10.00', self.account, payee, 'transfer'),
+            (2, '25.00', None, self.account, 'deposit'),
+            (1, '5.00', self.account, None, 'withdrawal'),
+        ]:
+            row = Transaction.objects.create(from_account=sender, to_account=receiver,
+                                             transaction_type=transaction_type, amount=Decimal(amount))
+            Transaction.objects.filter(pk=row.pk).update(created_at=now - timedelta(days=days))
+        self.assertEqual(archive_old_transactions(), 2)
+        self.today = timezone.localdate()
+
+    def _csv(self, start):
+        return list(csv.reader(''.join(stream_csv(self.account, start, self.today)).splitlines()))
+
+    def test_csv_balances_across_archive(self):
+        rows = self._csv(self.today - timedelta(days=500))
+        self.assertEqual(rows[0][-1], 'Balance')
+        self.assertEqual([(row[1], row[3], row[4], row[5], row[6]) for row in rows[1:]], [
+            ('deposit', '', '', '40.00', '90.00'),
+            ('transfer', 'STM2', '10.00', '', '80.00'),
+            ('deposit', '', '', '25.00', '105.00'),
+            ('withdrawal', '', '5.00', '', '100.00'),
+        ])
+
+    def test_opening_balance_inside_archive(self):
+        # Starts after the archived deposit, so it is folded into the opening balance
+        rows = self._csv(self.today - timedelta(days=395))
+        self.assertEqual([row[6] for row in rows[1:]], ['80.00', '105.00', '100.00'])
+        rows = self._csv(self.today - timedelta(days=3))
+        self.assertEqual([row[6] for row in rows[1:]], ['105.00', '100.00'])
+
+    def test_jsonl_and_pdf_match_csv(self):
+        start = self.today - timedelta(days=500)
+        records = [json.loads(line) for line in stream_jsonl(self.account, start, self.today)]
+        self.assertEqual([record['balance'] for record in records], ['90.00', '80.00', '105.00', '100.00'])
+        self.assertEqual((records[1]['debit'], records[1]['credit']), ('10.00', None))
+        pdf = b''.join(stream_pdf(self.account, start, self.today))
+        self.assertTrue(pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n'))
+        for balance in (b'90.00', b'80.00', b'105.00', b'100.00'):
+            self.assertIn(balance, pdf)
+
+    def test_hot_account_starts_from_shards(self):
+        self.account = account = enable_hot_mode(self.account)
+        credit(account, Decimal('30.00'))
+        Transaction.objects.create(to_account=account, transaction_type='deposit', amount=Decimal('30.00'))
+        # Account.balance still says 100.00 until the next fold
+        rows = self._csv(self.today - timedelta(days=500))
+        self.assertEqual([row[6] for row in rows[1:]], ['90.00', '80.00', '105.00', '100.00', '130.00'])
+
+        start = self.today - timedelta(days=3)
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.assertEqual(write_month_end_statements([account.pk], start, self.today, 'csv', output_dir)[0], 1)
+            with open(f'{output_dir}/{statement_filename(account, start, self.today, "csv")}') as written:
+                rows = list(csv.reader(written))
+        self.assertEqual([row[6] for row in rows[1:]], ['105.00', '100.00', '130.00'])
+
+
+class IdempotencyTests(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='payer')
+        self.account = Account.objects.create(user=self.user, account_number='IDEM1', balance=Decimal('100.00'))
+        self.url = reverse('deposit', args=[self.account.pk])
+        self.client.force_login(self.user)
+
+    def _deposit(self, amount='10.00', key='retry-1', client=None):
+        return (client or self.client).post(self.url, {'amount': amount, 'description': ''}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def _balance(self):
+        return Account.objects.values_list('balance', flat=True).get(pk=self.account.pk)
+
+    def test_retry_replays_and_moves_money_once(self):
+        first = self._deposit()
+        self.assertEqual(first.status_code, 302)
+        self.assertNotIn('Idempotent-Replayed', first)
+        for _ in range(2):
+            retry = self._deposit()
+            self.assertEqual((retry.status_code, retry['Location']), (302, first['Location']))
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            # The second retry is served from the cache, the first one from the key row
+            cache.clear()
+        self.assertEqual(self._balance(), Decimal('110.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self._deposit()
+        self.assertEqual(self._deposit(amount='20.00').status_code, 422)
+        cache.clear()
+        self.assertEqual(self._deposit(amount='20.00').status_code, 422)
+        withdraw = self.client.post(
+            reverse('withdraw', args=[self.account.pk]), {'amount': '10.00', 'description': ''},
+            HTTP_IDEMPOTENCY_KEY='retry-1',
+        )
+        self.assertEqual(withdraw.status_code, 422)
+        self.assertEqual(self._balance(), Decimal('110.00'))
+
+    def test_keys_belong_to_one_user(self):
+        self._deposit()
+        other = get_user_model().objects.create_user(username='other')
+        account = Account.objects.create(user=other, account_number='IDEM2', balance=Decimal('0.00'))
+        self.client.force_login(other)
+        # The same key from another user is theirs: it is neither replayed nor refused
+        response = self.client.post(
+            reverse('deposit', args=[account.pk]), {'amount': '5.00', 'description': ''},
+            HTTP_IDEMPOTENCY_KEY='retry-1',
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('Idempotent-Replayed', response)
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal('5.00'))
+        self.assertEqual(self._balance(), Decimal('110.00'))
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self._deposit(amount='').status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._deposit().status_code, 302)
+        self.assertEqual(self._balance(), Decimal('110.00'))
 
-# Create your tests here.
+    def test_sweep_removes_expired_keys(self):
+        self._deposit(key='old')
+        self._deposit(key='new')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sweep_expired_keys(batch_size=1), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
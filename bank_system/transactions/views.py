@@ -2,22 +2,43 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
 from .models import Transaction
 from .forms import DepositForm, WithdrawForm, TransferForm
+from .idempotency import idempotent
+from .archive import iter_account_history
 from accounts.models import Account
+from accounts.balances import credit, debit
+from accounts.directory import warm_frequent_payees
 
 @login_required
 def transaction_list(request):
-    accounts = request.user.accounts.all()
-    transactions = Transaction.objects.filter(
-        from_account__in=accounts
-    ) | Transaction.objects.filter(
-        to_account__in=accounts
-    )
-    transactions = transactions.distinct().order_by('-created_at')
-    return render(request, 'transactions/transaction_list.html', {'transactions': transactions})
+    account_ids = list(request.user.accounts.values_list('pk', flat=True))
+
+    # Without a start date only the hot table is read; older ranges pull in the archive
+    try:
+        start = parse_date(request.GET.get('start', ''))
+        end = parse_date(request.GET.get('end', ''))
+    except ValueError:
+        start = end = None
+    tz = timezone.get_current_timezone()
+    start_at = timezone.make_aware(datetime.combine(start, time.min), tz) if start else None
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz) if end else None
+
+    transactions = list(iter_account_history(
+        account_ids, start_at, end_at, descending=True, include_cold=start is not None,
+    ))
+    return render(request, 'transactions/transaction_list.html', {
+        'transactions': transactions,
+        'account_ids': account_ids,
+        'start': start,
+        'end': end,
+    })
 
 @login_required
+@idempotent
 @transaction.atomic
 def deposit(request, account_pk):
     account = get_object_or_404(Account, pk=account_pk, user=request.user)
@@ -30,8 +51,7 @@ def deposit(request, account_pk):
             trans.to_account = account
             trans.save()
             
-            account.balance += trans.amount
-            account.save()
+            credit(account, trans.amount)
             
             messages.success(request, f'Successfully deposited ${trans.amount} to account {account.account_number}')
             return redirect('account_detail', pk=account.pk)
@@ -41,6 +61,7 @@ def deposit(request, account_pk):
     return render(request, 'transactions/deposit.html', {'form': form, 'account': account})
 
 @login_required
+@idempotent
 @transaction.atomic
 def withdraw(request, account_pk):
     account = get_object_or_404(Account, pk=account_pk, user=request.user)
@@ -49,7 +70,7 @@ def withdraw(request, account_pk):
         form = WithdrawForm(request.POST)
         if form.is_valid():
             amount = form.cleaned_data['amount']
-            if amount > account.balance:
+            if not debit(account, amount):
                 messages.error(request, 'Insufficient balance!')
             else:
                 trans = form.save(commit=False)
@@ -57,9 +78,6 @@ def withdraw(request, account_pk):
                 trans.from_account = account
                 trans.save()
                 
-                account.balance -= trans.amount
-                account.save()
-                
                 messages.success(request, f'Successfully withdrew ${trans.amount} from account {account.account_number}')
                 return redirect('account_detail', pk=account.pk)
     else:
@@ -68,6 +86,7 @@ def withdraw(request, account_pk):
     return render(request, 'transactions/withdraw.html', {'form': form, 'account': account})
 
 @login_required
+@idempotent
 @transaction.atomic
 def transfer(request, account_pk):
     from_account = get_object_or_404(Account, pk=account_pk, user=request.user)
@@ -78,25 +97,24 @@ def transfer(request, account_pk):
             amount = form.cleaned_data['amount']
             to_account = form.cleaned_data['to_account_number']
             
-            if from_account == to_account:
+            if from_account.pk == to_account.id:
                 messages.error(request, 'Cannot transfer to the same account!')
-            elif amount > from_account.balance:
+            elif not debit(from_account, amount):
                 messages.error(request, 'Insufficient balance!')
             else:
                 trans = form.save(commit=False)
                 trans.transaction_type = 'transfer'
                 trans.from_account = from_account
-                trans.to_account = to_account
+                trans.to_account_id = to_account.id
                 trans.save()
                 
-                from_account.balance -= trans.amount
-                to_account.balance += trans.amount
-                from_account.save()
-                to_account.save()
+                # Credit in place, the recipient row is never loaded
+                credit(to_account, trans.amount)
                 
                 messages.success(request, f'Successfully transferred ${trans.amount} to account {to_account.account_number}')
                 return redirect('account_detail', pk=from_account.pk)
     else:
         form = TransferForm()
+        warm_frequent_payees(request.user)
     
     return render(request, 'transactions/transfer.html', {'form': form, 'account': from_account})
\ No newline at end of file